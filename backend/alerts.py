@@ -0,0 +1,102 @@
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Alert changes kept for polling clients; older cursors get the full list again
+MAX_ALERT_EVENTS = int(os.environ.get("AGRIS_ALERT_EVENTS", "1000"))
+
+NEW, CHANGED, RESOLVED = "new", "changed", "resolved"
+
+class AlertFeed:
+    """
+    Current alerts of a dataset and a numbered log of how they changed
+    Alerts are matched by id between dataset versions; only new, changed and resolved
+    alerts are logged, so subscribers receive the difference instead of the whole list
+    """
+
+    def __init__(self, epoch: str, max_events: int = MAX_ALERT_EVENTS):
+        self._alerts = {}
+        self._events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        # Sequence numbers restart at 0 with every feed, so cursors carry the epoch of the
+        # feed that issued them: one from another worker or an earlier run never matches
+        self.epoch = epoch
+        # Sequence number of the latest event
+        self.seq = 0
+        # Dataset version the current alerts were computed from
+        self.version = None
+
+    def update(self, alerts: List[Dict], version: int) -> Dict[str, int]:
+        """
+        Replace the current alerts, logging one event per new, changed or resolved alert
+        An alert keeps the timestamp of when it was first raised for as long as it is active
+        """
+        now = datetime.now().isoformat()
+        changes = []
+        with self._lock:
+            previous = self._alerts
+            current = {}
+            for alert in alerts:
+                before = previous.get(alert['id'])
+                if before is None:
+                    alert = {**alert, 'timestamp': now}
+                    changes.append((NEW, alert))
+                else:
+                    alert = {**alert, 'timestamp': before['timestamp']}
+                    if alert != before:
+                        changes.append((CHANGED, alert))
+                current[alert['id']] = alert
+            changes += [(RESOLVED, alert) for alert_id, alert in previous.items() if alert_id not in current]
+
+            for kind, alert in changes:
+                self.seq += 1
+                self._events.append({'seq': self.seq, 'cursor': self._cursor(self.seq), 'type': kind,
+                                     'at': now, 'alert': alert})
+            self._alerts = current
+            self.version = version
+        return {kind: sum(1 for change, _ in changes if change == kind) for kind in (NEW, CHANGED, RESOLVED)}
+
+    def stamp(self, alerts: List[Dict]) -> List[Dict]:
+        """
+        Alerts with the first-raised timestamps of the matching current alerts
+        """
+        with self._lock:
+            return [{**alert, 'timestamp': self._alerts[alert['id']]['timestamp']}
+                    if alert['id'] in self._alerts else alert for alert in alerts]
+
+    def current(self) -> List[Dict]:
+        with self._lock:
+            return list(self._alerts.values())
+
+    @property
+    def cursor(self) -> str:
+        """
+        Cursor of the latest event, "<epoch>:<seq>"; clients pass it back as since=
+        """
+        return self._cursor(self.seq)
+
+    def _cursor(self, seq: int) -> str:
+        return f"{self.epoch}:{seq}"
+
+    def _sequence(self, cursor: str) -> Optional[int]:
+        # Sequence number of a cursor issued by this feed, else None
+        epoch, _, seq = cursor.rpartition(":")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def since(self, cursor: Optional[str]) -> Dict:
+        """
+        Events after a cursor; without one, or when the cursor is older than the log
+        or from another run of the server, the full current list instead
+        """
+        with self._lock:
+            seq = self._sequence(cursor) if cursor is not None else None
+            oldest = self._events[0]['seq'] if self._events else self.seq + 1
+            if seq is None or seq > self.seq or seq < oldest - 1:
+                alerts = list(self._alerts.values())
+                return {'alerts': alerts, 'count': len(alerts), 'cursor': self.cursor, 'reset': cursor is not None}
+            events = [event for event in self._events if event['seq'] > seq]
+            return {'events': events, 'count': len(events), 'cursor': self.cursor, 'reset': False}
@@ -0,0 +1,93 @@
+"""
+CSV ingest throughput with and without schema resolution
+Run from the backend directory:
+
+    python benchmarks/ingest_throughput.py --rows 10000000
+
+Writes seeded retail and mandi feeds of the requested size (alias headers, month-first dates)
+to a temporary directory, then ingests each one with the reader inferring every column and
+the date format ("inferred") and with the header resolved and the date format pinned from a
+sample ("resolved"), both with and without keeping the raw rows. Reports rows per second
+and the peak RSS of the process
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import dataset_for_rows
+from demand_engine import RETAIL_SCHEMA, combine_retail_data, preprocess_retail_data
+from price_engine import MANDI_SCHEMA, combine_mandi_data, preprocess_mandi_data
+from ingestion import CHUNK_ROWS, ingest_csv, peak_rss_mb
+
+# Headers as real feeds name them, so every run goes through alias resolution
+RETAIL_HEADERS = {"date": "Date", "product": "Item", "sales_quantity": "Quantity", "sales_value": "Amount"}
+MANDI_HEADERS = {"date": "Date", "product": "Commodity", "price": "Rate", "location": "Market"}
+
+FEEDS = {
+    "retail": (RETAIL_HEADERS, preprocess_retail_data, combine_retail_data, RETAIL_SCHEMA),
+    "mandi": (MANDI_HEADERS, preprocess_mandi_data, combine_mandi_data, MANDI_SCHEMA)
+}
+
+def write_feeds(rows: int, directory: str) -> dict:
+    retail, mandi = dataset_for_rows(rows)
+    paths = {}
+    for name, frame in (("retail", retail), ("mandi", mandi)):
+        headers = FEEDS[name][0]
+        frame = frame.rename(columns=headers)
+        # Month-first dates with extra unused columns, as exported by spreadsheet tools
+        frame["Date"] = pd.to_datetime(frame["Date"]).dt.strftime("%m/%d/%Y")
+        frame["Notes"] = "ok"
+        frame["Source"] = name
+        paths[name] = os.path.join(directory, f"{name}.csv")
+        frame.to_csv(paths[name], index=False)
+    return paths
+
+def run(path: str, feed: str, resolved: bool, keep_raw: bool, chunk_rows: int) -> dict:
+    _, preprocess, combine, schema = FEEDS[feed]
+    start = time.perf_counter()
+    with open(path, "rb") as source:
+        result = ingest_csv(source, preprocess, combine, chunk_rows=chunk_rows, keep_raw=keep_raw,
+                            schema=schema if resolved else None)
+    elapsed = time.perf_counter() - start
+    return {
+        "feed": feed,
+        "reader": "resolved" if resolved else "inferred",
+        "keep_raw": keep_raw,
+        "rows": result['rows'],
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(result['rows'] / elapsed) if elapsed else None,
+        "processed_rows": len(result['processed'])
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000, help="rows per feed")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_feeds(args.rows, directory)
+        for feed, path in paths.items():
+            for keep_raw in (False, True):
+                for resolved in (False, True):
+                    results.append(run(path, feed, resolved, keep_raw, args.chunk_rows))
+
+    for result in results:
+        if result["reader"] != "resolved":
+            continue
+        baseline = next(other for other in results if other["reader"] == "inferred"
+                        and other["feed"] == result["feed"] and other["keep_raw"] == result["keep_raw"])
+        result["speedup"] = round(baseline["seconds"] / result["seconds"], 2) if result["seconds"] else None
+    print(json.dumps({"results": results, "peak_rss_mb": peak_rss_mb()}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Latency of reads while large uploads are running, against a real uvicorn server
+Run from the backend directory:
+
+    python benchmarks/load_test.py --rows 1000000 --duration 30 --readers 16 --uploaders 2
+
+Readers loop over the health check and the analysis endpoints while uploaders keep
+re-uploading a synthetic feed. p50/p95/p99 latency and the number of 429 responses
+are reported per endpoint as JSON
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import dataset_for_rows
+
+READ_PATHS = ["/", "/analysis/demand", "/analysis/price", "/analysis/gap", "/analysis/recommendations"]
+
+def start_server(port: int) -> subprocess.Popen:
+    env = dict(os.environ, AGRIS_STORE_DIR="")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not start")
+
+async def upload(client: httpx.AsyncClient, kind: str, path: str) -> httpx.Response:
+    with open(path, 'rb') as f:
+        return await client.post(f"/upload/{kind}", files={'file': (os.path.basename(path), f.read(), 'text/csv')},
+                                 params={'keep_raw': 'false'})
+
+async def reader(client: httpx.AsyncClient, stop: float, samples: dict, index: int):
+    i = index
+    while time.monotonic() < stop:
+        path = READ_PATHS[i % len(READ_PATHS)]
+        i += 1
+        start = time.perf_counter()
+        response = await client.get(path)
+        samples.setdefault(f"GET {path}", []).append((time.perf_counter() - start, response.status_code))
+
+async def uploader(client: httpx.AsyncClient, stop: float, samples: dict, files: dict, index: int):
+    kinds = list(files)
+    i = index
+    while time.monotonic() < stop:
+        kind = kinds[i % len(kinds)]
+        i += 1
+        start = time.perf_counter()
+        response = await upload(client, kind, files[kind])
+        samples.setdefault(f"POST /upload/{kind}", []).append((time.perf_counter() - start, response.status_code))
+        if response.status_code == 429:
+            await asyncio.sleep(float(response.headers.get("retry-after", "1")))
+
+def summarize(samples: dict) -> list:
+    rows = []
+    for name, values in sorted(samples.items()):
+        seconds = np.array([value for value, status in values if status != 429])
+        rows.append({
+            'name': name,
+            'requests': len(values),
+            'rejected_429': sum(status == 429 for _, status in values),
+            'errors': sum(status >= 500 for _, status in values),
+            'p50_ms': round(float(np.percentile(seconds, 50)) * 1000, 2) if len(seconds) else None,
+            'p95_ms': round(float(np.percentile(seconds, 95)) * 1000, 2) if len(seconds) else None,
+            'p99_ms': round(float(np.percentile(seconds, 99)) * 1000, 2) if len(seconds) else None
+        })
+    return rows
+
+async def run(args, files: dict) -> dict:
+    async with httpx.AsyncClient(base_url=args.url, timeout=None,
+                                 limits=httpx.Limits(max_connections=args.readers + args.uploaders + 4)) as client:
+        await wait_ready(client)
+        # Seed both datasets so the analysis endpoints have something to compute
+        for kind, path in files.items():
+            (await upload(client, kind, path)).raise_for_status()
+
+        samples = {}
+        stop = time.monotonic() + args.duration
+        await asyncio.gather(
+            *[reader(client, stop, samples, i) for i in range(args.readers)],
+            *[uploader(client, stop, samples, files, i) for i in range(args.uploaders)]
+        )
+        return {'rows': args.rows, 'duration': args.duration, 'readers': args.readers,
+                'uploaders': args.uploaders, 'results': summarize(samples)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000, help="rows per uploaded feed")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--uploaders", type=int, default=2)
+    parser.add_argument("--url", help="test a running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = None
+    if args.url is None:
+        args.url = f"http://127.0.0.1:{args.port}"
+        server = start_server(args.port)
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            retail, mandi = dataset_for_rows(args.rows)
+            files = {'retail': os.path.join(tmp, "retail_sales.csv"), 'mandi': os.path.join(tmp, "mandi_prices.csv")}
+            retail.to_csv(files['retail'], index=False)
+            mandi.to_csv(files['mandi'], index=False)
+            report = asyncio.run(run(args, files))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    for row in report['results']:
+        print(f"  {row['name']:<36} n={row['requests']:<6} 429={row['rejected_429']:<5} "
+              f"p50={row['p50_ms']} p95={row['p95_ms']} p99={row['p99_ms']} ms", file=sys.stderr)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Scaling of the process-pool signal computation from 1 to N workers
+Run from the backend directory: python benchmarks/parallel_scaling.py --products 10000 --max-workers 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import generate_retail, generate_mandi
+from demand_engine import preprocess_retail_data, demand_window_totals, demand_trends_from_totals, demand_signals_from_trends
+from price_engine import preprocess_mandi_data, price_regression_stats, price_trends_from_stats, price_signals_from_trends
+from gap_analyzer import analyze_supply_demand_gap
+from parallel import parallel_price_stats, parallel_demand_totals, parallel_gap_analysis, shutdown_pool
+
+def synthetic_frames(products: int, days: int, seed: int = 0):
+    """
+    Processed retail and mandi frames for a synthetic product set
+    """
+    retail = preprocess_retail_data(generate_retail(products, days, seed=seed))
+    mandi = preprocess_mandi_data(generate_mandi(products, mandis=1, days=days, seed=seed))
+    return retail, mandi
+
+def run(retail: pd.DataFrame, mandi: pd.DataFrame, workers: int) -> float:
+    start = time.perf_counter()
+    if workers <= 1:
+        totals = demand_window_totals(retail)
+        stats = price_regression_stats(mandi)
+    else:
+        totals = parallel_demand_totals(retail, workers=workers)
+        stats = parallel_price_stats(mandi, workers=workers)
+    demand_signals = demand_signals_from_trends(demand_trends_from_totals(totals))
+    price_signals = price_signals_from_trends(price_trends_from_stats(stats))
+    if workers <= 1:
+        analyze_supply_demand_gap(demand_signals, price_signals)
+    else:
+        parallel_gap_analysis(demand_signals, price_signals, workers=workers)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    retail, mandi = synthetic_frames(args.products, args.days)
+    results = []
+    for workers in range(1, args.max_workers + 1):
+        run(retail, mandi, workers)  # Warm up the pool
+        seconds = min(run(retail, mandi, workers) for _ in range(args.repeat))
+        results.append({'workers': workers, 'seconds': round(seconds, 4)})
+        print(f"workers={workers:<3} {seconds:8.3f}s  speedup={results[0]['seconds'] / seconds:5.2f}x", file=sys.stderr)
+    shutdown_pool()
+
+    print(json.dumps({'products': args.products, 'days': args.days, 'rows': len(retail),
+                      'cpu_count': os.cpu_count(), 'results': results}, indent=2))
+
+if __name__ == "__main__":
+    main()
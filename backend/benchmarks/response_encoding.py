@@ -0,0 +1,111 @@
+"""
+Payload size and encode time of the analysis responses in every representation
+Run from the backend directory:
+
+    python benchmarks/response_encoding.py --products 10000
+
+Uploads seeded retail and mandi feeds through the API, computes the demand, price, gap,
+recommendation and history payloads once, then encodes each one as JSON with the previous
+encoder (jsonable_encoder and JSONResponse) and with orjson, as compact JSON, as MessagePack
+(plain and compact) and as Arrow. Reports the bytes and best encode time of every
+representation, and its size and compression time under gzip and brotli
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Keep benchmark uploads out of the real on-disk store
+os.environ.setdefault("AGRIS_STORE_DIR", "")
+
+from synthetic import generate_retail, generate_mandi
+import encoding
+
+PAYLOADS = {
+    "demand": "compute_demand_analysis",
+    "price": "compute_price_analysis",
+    "gap": "compute_gap_analysis",
+    "recommendations": "compute_recommendations"
+}
+
+def best_time(fn, repeat: int):
+    result, best = None, float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+def load_payloads(products: int, days: int, seed: int) -> dict:
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    with tempfile.TemporaryDirectory() as directory:
+        feeds = {"retail": generate_retail(products, days, seed=seed), "mandi": generate_mandi(products, days=days, seed=seed)}
+        for kind, frame in feeds.items():
+            path = os.path.join(directory, f"{kind}.csv")
+            frame.to_csv(path, index=False)
+            with open(path, "rb") as f:
+                client.post(f"/upload/{kind}", files={"file": (f"{kind}.csv", f, "text/csv")}).raise_for_status()
+    dataset = main.get_datasets().get(main.DEFAULT_DATASET)
+    payloads = {name: getattr(dataset, method)() for name, method in PAYLOADS.items()}
+    payloads["history"] = dataset.compute_history(None, None, None, "2100-01-01")
+    return payloads
+
+def encoders():
+    """
+    (name, function of a computed payload) pairs; all but the first take the decoded JSON,
+    as the API derives every other representation from the cached JSON body
+    """
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    # JSONResponse rejects NaN and infinity, which the API sends as null
+    yield "json (jsonable_encoder)", lambda content, _: JSONResponse(content=encoding.finite(jsonable_encoder(content))).body
+    if encoding.orjson is not None:
+        yield "json (orjson)", lambda content, _: encoding.dumps(content, default=jsonable_encoder)
+    yield "compact json", lambda _, decoded: encoding.encode(decoded, "json", True)
+    if encoding.available("msgpack"):
+        yield "msgpack", lambda _, decoded: encoding.encode(decoded, "msgpack", False)
+        yield "compact msgpack", lambda _, decoded: encoding.encode(decoded, "msgpack", True)
+    if encoding.available("arrow"):
+        yield "arrow", lambda _, decoded: encoding.encode(decoded, "arrow", False)
+
+def run(name: str, content: dict, repeat: int) -> list:
+    decoded = encoding.loads(encoding.dumps(content, default=str))
+    results = []
+    for encoder, encode in encoders():
+        body, seconds = best_time(lambda: encode(content, decoded), repeat)
+        result = {"payload": name, "encoding": encoder, "bytes": len(body), "encode_ms": round(seconds * 1000, 2)}
+        codings = ["gzip"] + (["br"] if encoding.brotli is not None else [])
+        for coding in codings:
+            compressed, seconds = best_time(lambda: encoding.compress(body, coding), repeat)
+            result[f"{coding}_bytes"] = len(compressed)
+            result[f"{coding}_ms"] = round(seconds * 1000, 2)
+        results.append(result)
+        print(f"  {name:<16} {encoder:<24} {len(body):>10} B {result['encode_ms']:9.2f} ms  gzip {result['gzip_bytes']:>9} B"
+              + (f"  br {result['br_bytes']:>9} B" if "br_bytes" in result else ""), file=sys.stderr)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.products, args.days, args.seed)
+    results = []
+    for name, content in payloads.items():
+        results.extend(run(name, content, args.repeat))
+    print(json.dumps({"products": args.products, "days": args.days, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
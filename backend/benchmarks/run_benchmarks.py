@@ -0,0 +1,206 @@
+"""
+Time every public engine function and API endpoint on synthetic data of increasing size
+Run from the backend directory:
+
+    python benchmarks/run_benchmarks.py --sizes 1e3,1e4,1e5 --output bench.json
+    python benchmarks/run_benchmarks.py --sizes 1e3,1e4 --compare bench.json
+
+Results are written as JSON (wall time and peak traced memory per case) so runs from
+different commits can be compared with --compare
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Keep benchmark uploads out of the real on-disk store
+os.environ.setdefault("AGRIS_STORE_DIR", "")
+
+from synthetic import dataset_for_rows
+
+def measure(fn, repeat: int, trace_memory: bool):
+    """
+    Best wall time over repeat runs, plus peak traced allocation of one extra run
+    """
+    result = None
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+
+    peak_mb = None
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = round(peak / 1024 / 1024, 2)
+
+    return result, best, peak_mb
+
+def engine_cases(retail_raw, mandi_raw):
+    """
+    (name, callable) pairs for each public engine function, run in pipeline order
+    so every case can use the output of the ones before it
+    """
+    from demand_engine import preprocess_retail_data, calculate_demand_trends, get_demand_signals, cube_window_totals
+    from price_engine import preprocess_mandi_data, calculate_price_trends, get_price_signals, cube_price_stats
+    from gap_analyzer import analyze_supply_demand_gap, get_gap_summary
+    from cube import ProductDayCube
+    from recommendation_engine import generate_alerts_and_recommendations, get_actionable_insights
+
+    state = {}
+    yield "demand_engine.preprocess_retail_data", lambda: state.__setitem__('retail', preprocess_retail_data(retail_raw))
+    yield "demand_engine.calculate_demand_trends", lambda: calculate_demand_trends(state['retail'])
+    yield "demand_engine.get_demand_signals", lambda: state.__setitem__('demand', get_demand_signals(state['retail']))
+    yield "price_engine.preprocess_mandi_data", lambda: state.__setitem__('mandi', preprocess_mandi_data(mandi_raw))
+    yield "price_engine.calculate_price_trends", lambda: calculate_price_trends(state['mandi'])
+    yield "price_engine.get_price_signals", lambda: state.__setitem__('price', get_price_signals(state['mandi']))
+    yield "cube.ProductDayCube.build", lambda: state.__setitem__('cube', ProductDayCube.build(state['retail'], state['mandi']))
+    yield "demand_engine.cube_window_totals", lambda: cube_window_totals(state['cube'], [14])
+    yield "price_engine.cube_price_stats", lambda: cube_price_stats(state['cube'])
+    yield "gap_analyzer.analyze_supply_demand_gap", lambda: state.__setitem__('gap', analyze_supply_demand_gap(state['demand'], state['price']))
+    yield "gap_analyzer.get_gap_summary", lambda: get_gap_summary(state['gap'])
+    yield "recommendation_engine.generate_alerts_and_recommendations", lambda: generate_alerts_and_recommendations(state['gap'], state['demand'], state['price'])
+    yield "recommendation_engine.get_actionable_insights", lambda: get_actionable_insights(state['gap'], state['demand'], state['price'])
+
+def endpoint_cases(retail_csv: str, mandi_csv: str):
+    """
+    (name, callable) pairs for each API endpoint, called through FastAPI's TestClient
+    Analysis endpoints are called with a new dataset version each time so the result cache
+    does not hide the computation
+    """
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app, raise_server_exceptions=False)
+
+    def upload(kind, path):
+        with open(path, 'rb') as f:
+            response = client.post(f"/upload/{kind}", files={'file': (os.path.basename(path), f, 'text/csv')})
+        response.raise_for_status()
+
+    def uncached_get(path):
+        def call():
+            main.get_datasets().get(main.DEFAULT_DATASET).bump_version()
+            response = client.get(path)
+            response.read()
+        return call
+
+    def uncached_post(path, body):
+        def call():
+            main.get_datasets().get(main.DEFAULT_DATASET).bump_version()
+            response = client.post(path, json=body)
+            response.read()
+        return call
+
+    yield "POST /upload/retail", lambda: upload("retail", retail_csv)
+    yield "POST /upload/mandi", lambda: upload("mandi", mandi_csv)
+    for path in ["/analysis/demand", "/analysis/price", "/analysis/gap", "/analysis/recommendations",
+                 "/analysis/history?as_of=2100-01-01", "/data/retail", "/data/mandi"]:
+        yield f"GET {path}", uncached_get(path)
+    # Demand moving 10% either way, with prices on their trend and on a forecast model
+    scenarios = [{"demand_change": change, "price_model": model} for change in (-10, 10) for model in (None, "holt_winters")]
+    yield "POST /analysis/scenarios", uncached_post("/analysis/scenarios", {"scenarios": scenarios})
+
+def run_size(rows: int, repeat: int, trace_memory: bool, include_endpoints: bool, seed: int):
+    retail_raw, mandi_raw = dataset_for_rows(rows, seed=seed)
+    results = []
+
+    def record(name, fn):
+        _, seconds, peak_mb = measure(fn, repeat, trace_memory)
+        results.append({'name': name, 'rows': rows, 'seconds': round(seconds, 6), 'peak_mb': peak_mb})
+        print(f"  {name:<60} {seconds * 1000:12.2f} ms  {peak_mb if peak_mb is not None else '-':>10} MB", file=sys.stderr)
+
+    for name, fn in engine_cases(retail_raw, mandi_raw):
+        record(name, fn)
+
+    if include_endpoints:
+        with tempfile.TemporaryDirectory() as tmp:
+            retail_csv = os.path.join(tmp, "retail_sales.csv")
+            mandi_csv = os.path.join(tmp, "mandi_prices.csv")
+            retail_raw.to_csv(retail_csv, index=False)
+            mandi_raw.to_csv(mandi_csv, index=False)
+            for name, fn in endpoint_cases(retail_csv, mandi_csv):
+                record(name, fn)
+
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def compare(current: dict, baseline_path: str, threshold: float) -> int:
+    """
+    Print time ratios against a previous run and return the number of regressions
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r['name'], r['rows']): r for r in baseline['results']}
+
+    regressions = 0
+    print(f"\nComparison with {baseline_path} ({baseline.get('commit')})", file=sys.stderr)
+    for result in current['results']:
+        old = previous.get((result['name'], result['rows']))
+        if old is None or old['seconds'] <= 0:
+            continue
+        ratio = result['seconds'] / old['seconds']
+        flag = "REGRESSION" if ratio > threshold else ""
+        regressions += bool(flag)
+        print(f"  {result['name']:<60} {result['rows']:>10}  x{ratio:6.2f} {flag}", file=sys.stderr)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1e3,1e4,1e5", help="comma separated row counts, e.g. 1e3,1e4,1e7")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--no-endpoints", action="store_true", help="only benchmark engine functions")
+    parser.add_argument("--output", help="write results JSON here (default stdout)")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="time ratio reported as a regression")
+    args = parser.parse_args()
+
+    sizes = [int(float(size)) for size in args.sizes.split(",")]
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': []
+    }
+    for rows in sizes:
+        print(f"rows={rows}", file=sys.stderr)
+        report['results'].extend(run_size(rows, args.repeat, not args.no_memory, not args.no_endpoints, args.seed))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        sys.exit(1 if compare(report, args.compare, args.threshold) else 0)
+
+if __name__ == "__main__":
+    main()
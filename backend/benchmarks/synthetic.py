@@ -0,0 +1,106 @@
+"""
+Seeded synthetic retail sales and mandi price feeds at arbitrary scale
+Run from the backend directory to write CSVs: python benchmarks/synthetic.py --rows 1000000 --out /tmp/agris
+"""
+import argparse
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+def _grid(products: int, days: int, mandis: int, start: str):
+    """
+    Every (product, day, mandi) combination as flat arrays
+    """
+    product_idx = np.repeat(np.arange(products), days * mandis)
+    day_idx = np.tile(np.repeat(np.arange(days), mandis), products)
+    mandi_idx = np.tile(np.arange(mandis), products * days)
+    dates = np.datetime64(start, 'D') + day_idx
+    return product_idx, day_idx, mandi_idx, dates
+
+def _drop_missing(df: pd.DataFrame, missing_rate: float, rng: np.random.Generator) -> pd.DataFrame:
+    if missing_rate <= 0:
+        return df
+    return df[rng.random(len(df)) >= missing_rate].reset_index(drop=True)
+
+def product_names(products: int):
+    return np.array([f"Product-{i:06d}" for i in range(products)], dtype=object)
+
+def generate_retail(products: int = 100, days: int = 120, noise: float = 0.1, missing_rate: float = 0.0,
+                    seed: int = 0, start: str = "2024-01-01") -> pd.DataFrame:
+    """
+    Daily sales per product with a per-product trend, weekly seasonality and multiplicative noise
+    missing_rate drops that fraction of (product, day) rows at random
+    """
+    rng = np.random.default_rng(seed)
+    product_idx, day_idx, _, dates = _grid(products, days, 1, start)
+
+    base = rng.uniform(100, 2000, products)
+    trend = rng.normal(0, 0.004, products)  # Relative change per day
+    weekly = 1 + 0.15 * np.sin(2 * np.pi * day_idx / 7)
+    quantity = base[product_idx] * (1 + trend[product_idx] * day_idx) * weekly
+    quantity = np.maximum(quantity * rng.normal(1, noise, len(quantity)), 0).round()
+    unit_price = rng.uniform(10, 120, products)[product_idx]
+
+    df = pd.DataFrame({
+        'date': pd.to_datetime(dates).strftime('%Y-%m-%d'),
+        'product': product_names(products)[product_idx],
+        'sales_quantity': quantity.astype(np.int64),
+        'sales_value': (quantity * unit_price).round(2)
+    })
+    return _drop_missing(df, missing_rate, rng)
+
+def generate_mandi(products: int = 100, mandis: int = 5, days: int = 120, noise: float = 0.05,
+                   missing_rate: float = 0.0, seed: int = 0, start: str = "2024-01-01") -> pd.DataFrame:
+    """
+    Daily price quotes per product and mandi: a per-product price level and drift,
+    a per-mandi premium and multiplicative noise
+    """
+    rng = np.random.default_rng(seed + 1)
+    product_idx, day_idx, mandi_idx, dates = _grid(products, days, mandis, start)
+
+    level = rng.uniform(8, 150, products)
+    drift = rng.normal(0, 0.002, products)
+    premium = rng.normal(1, 0.05, (products, mandis))
+    price = level[product_idx] * (1 + drift[product_idx] * day_idx) * premium[product_idx, mandi_idx]
+    price = np.maximum(price * rng.normal(1, noise, len(price)), 0.5).round(2)
+
+    df = pd.DataFrame({
+        'date': pd.to_datetime(dates).strftime('%Y-%m-%d'),
+        'product': product_names(products)[product_idx],
+        'price': price,
+        'location': np.array([f"Mandi-{i:03d}" for i in range(mandis)], dtype=object)[mandi_idx]
+    })
+    return _drop_missing(df, missing_rate, rng)
+
+def dataset_for_rows(rows: int, days: int = 120, mandis: int = 5, noise: float = 0.1,
+                     missing_rate: float = 0.0, seed: int = 0):
+    """
+    Retail and mandi feeds of roughly the requested number of rows each
+    """
+    retail_products = max(1, math.ceil(rows / days))
+    mandi_products = max(1, math.ceil(rows / (days * mandis)))
+    retail = generate_retail(retail_products, days, noise, missing_rate, seed)
+    mandi = generate_mandi(mandi_products, mandis, days, noise / 2, missing_rate, seed)
+    return retail, mandi
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--mandis", type=int, default=5)
+    parser.add_argument("--noise", type=float, default=0.1)
+    parser.add_argument("--missing-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=".")
+    args = parser.parse_args()
+
+    retail, mandi = dataset_for_rows(args.rows, args.days, args.mandis, args.noise, args.missing_rate, args.seed)
+    os.makedirs(args.out, exist_ok=True)
+    retail.to_csv(os.path.join(args.out, "retail_sales.csv"), index=False)
+    mandi.to_csv(os.path.join(args.out, "mandi_prices.csv"), index=False)
+    print(f"Wrote {len(retail)} retail rows and {len(mandi)} mandi rows to {args.out}")
+
+if __name__ == "__main__":
+    main()
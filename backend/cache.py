@@ -0,0 +1,98 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+class ResultCache:
+    """
+    Bounded LRU cache for analysis results
+    Keys include the dataset version, so an upload makes every older entry unreachable
+    and the least recently used ones are evicted as new results come in
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.not_modified = 0
+        # Size of the cached bodies, counted towards the memory of their namespace
+        self.bytes = 0
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, str]]:
+        """
+        Return the cached (value, etag) pair for key, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, value: Any) -> Tuple[Any, str]:
+        """
+        Store a value and return it together with its ETag
+        """
+        entry = (value, make_etag(key))
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= _size(previous[0])
+            self._entries[key] = entry
+            self.bytes += _size(value)
+            while len(self._entries) > self.max_entries:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.bytes -= _size(evicted)
+                self.evictions += 1
+        return entry
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict:
+        """
+        Hit/miss counters and current size of the cache
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'not_modified': self.not_modified,
+                'bytes': self.bytes,
+                'hit_rate': round(self.hits / lookups, 4) if lookups > 0 else 0
+            }
+
+def _size(value: Any) -> int:
+    return len(value) if isinstance(value, (bytes, bytearray)) else 0
+
+def make_etag(key: Hashable) -> str:
+    """
+    ETag of a cache key, derived from the key rather than the payload
+    Keys name one result only within their namespace's epoch (see Dataset.epoch): a version
+    number alone is reused by every process and after every restart
+    """
+    return '"' + hashlib.sha1(repr(key).encode("utf-8")).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check an If-None-Match header value against an ETag
+    """
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f"W/{etag}" in candidates
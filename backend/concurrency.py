@@ -0,0 +1,165 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Hashable
+
+# Threads running pandas work for request handlers, off the event loop
+WORK_THREADS = int(os.environ.get("AGRIS_WORK_THREADS", "4"))
+
+# Jobs allowed to wait for a thread; beyond threads + queue requests are rejected with 429
+MAX_QUEUED = int(os.environ.get("AGRIS_MAX_QUEUED", "16"))
+
+# Threads running background jobs, apart from the request pool so long jobs never hold up reads
+JOB_THREADS = int(os.environ.get("AGRIS_JOB_THREADS", "2"))
+
+# Background jobs allowed to wait for a job thread; beyond that job submissions get 429
+MAX_QUEUED_JOBS = int(os.environ.get("AGRIS_MAX_QUEUED_JOBS", "16"))
+
+class PoolSaturated(Exception):
+    """
+    Raised when the work pool and its queue are full
+    """
+    pass
+
+class ReadWriteLock:
+    """
+    Lock taken exclusively by writers and shared by readers, e.g. uploads applying new data
+    and requests reading one consistent version of it
+    Used as a context manager, or through acquire and release, it is taken exclusively;
+    shared() holds it for reading. Waiting writers go first, so readers cannot starve them
+    Not reentrant: a thread holding it must not take it again
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    def acquire(self, blocking: bool = True) -> bool:
+        with self._condition:
+            if not blocking:
+                if self._writing or self._readers:
+                    return False
+            else:
+                self._writers_waiting += 1
+                try:
+                    self._condition.wait_for(lambda: not self._writing and not self._readers)
+                finally:
+                    self._writers_waiting -= 1
+            self._writing = True
+            return True
+
+    def release(self):
+        with self._condition:
+            self._writing = False
+            self._condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    @contextmanager
+    def shared(self):
+        with self._condition:
+            self._condition.wait_for(lambda: not self._writing and not self._writers_waiting)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+class WorkPool:
+    """
+    Bounded thread pool with admission control: submissions fail fast instead of
+    queueing without limit when the server is overloaded
+    """
+
+    def __init__(self, threads: int = WORK_THREADS, max_queued: int = MAX_QUEUED):
+        self.threads = max(threads, 1)
+        self.capacity = self.threads + max(max_queued, 0)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._active = 0
+        self._rejected = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="agris-work")
+        return self._executor
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._active -= 1
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """
+        Queue fn(*args) on the pool, or raise PoolSaturated if it is full
+        The caller's context (e.g. the request's stage timings) is carried into the thread
+        """
+        with self._lock:
+            if self._active >= self.capacity:
+                self._rejected += 1
+                raise PoolSaturated()
+            self._active += 1
+            executor = self._get_executor()
+
+        context = contextvars.copy_context()
+        try:
+            future = executor.submit(context.run, fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn: Callable, *args):
+        """
+        Run fn(*args) on the pool and wait for it without blocking the event loop
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"threads": self.threads, "capacity": self.capacity, "active": self._active,
+                    "rejected": self._rejected}
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one: the first caller runs the work
+    and later callers await its result instead of repeating it
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._shared = 0
+
+    async def run(self, key: Hashable, work: Callable[[], Awaitable]):
+        pending = self._calls.get(key)
+        if pending is not None:
+            self._shared += 1
+            # Shielded so one cancelled waiter does not cancel the work for the others
+            return await asyncio.shield(pending)
+
+        task = asyncio.ensure_future(work())
+        self._calls[key] = task
+        task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict:
+        return {"in_flight": len(self._calls), "shared": self._shared}
@@ -0,0 +1,247 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+from instrumentation import timed
+
+# Largest product x day grid materialized per namespace; larger datasets are analysed from the frames
+CUBE_MAX_CELLS = int(os.environ.get("AGRIS_CUBE_MAX_CELLS", "10000000"))
+
+# Days allocated past the latest date, so daily appends fill the grid without reallocating
+DAY_HEADROOM = 32
+
+class ProductDayCube:
+    """
+    Retail and mandi data of one namespace as dense (product x day) arrays on one shared
+    product axis and day axis: sales quantity and value, the daily mean price (NaN without
+    a quote) and the number of quotes behind it, with a validity mask per feed
+    Built once when a feed is replaced and updated in place on append; the engines read
+    its arrays as views, so no request regroups or re-filters the frames
+    Readers hold lock while they slice the grid, so they never see an append half written
+    """
+
+    def __init__(self, start: np.datetime64):
+        # Day 0 of the grid; products get codes in the order they are first seen
+        self.start = np.datetime64(start, 'D')
+        self.names = []
+        self._codes = {}
+        self.n_days = 0
+        # Latest day with retail sales and with a price quote, -1 while a feed is empty
+        self.retail_last = -1
+        self.mandi_last = -1
+        self.quantity_integral = True
+        # Dates are reported in the unit of the frames' date columns
+        self.date_dtype = np.dtype('datetime64[ns]')
+        self._order = None
+        self.lock = threading.Lock()
+        self._allocate(0, 0)
+
+    @classmethod
+    @timed
+    def build(cls, retail: Optional[pd.DataFrame], mandi: Optional[pd.DataFrame]) -> Optional["ProductDayCube"]:
+        """
+        Cube of processed (date, product) retail and mandi frames, or None if the grid
+        would exceed CUBE_MAX_CELLS
+        """
+        frames = [df for df in (retail, mandi) if df is not None and not df.empty]
+        if not frames:
+            return None
+        first = min(df['date'].min() for df in frames)
+        last = max(df['date'].max() for df in frames)
+        products = set()
+        for df in frames:
+            column = df['product']
+            names = column.cat.categories if isinstance(column.dtype, pd.CategoricalDtype) else column.unique()
+            products.update(names.tolist())
+        if len(products) * ((last - first).days + 1) > CUBE_MAX_CELLS:
+            return None
+
+        cube = cls(first)
+        if retail is not None and not cube.add_sales(retail):
+            return None
+        if mandi is not None and not cube.set_prices(mandi):
+            return None
+        return cube
+
+    def _allocate(self, products: int, days: int):
+        self._quantity = np.zeros((products, days))
+        self._value = np.zeros((products, days))
+        self._sales = np.zeros((products, days), dtype=bool)
+        self._price = np.full((products, days), np.nan)
+        self._quotes = np.zeros((products, days), dtype=np.int32)
+        self._priced = np.zeros((products, days), dtype=bool)
+
+    def _reserve(self, products: int, first_day: int, last_day: int) -> bool:
+        """
+        Grow the grid to hold the given products and day offsets relative to the current
+        start; False, leaving the cube unchanged, if it would exceed CUBE_MAX_CELLS
+        """
+        shift = max(0, -first_day)
+        days = max(self.n_days, last_day + 1) + shift
+        if products * days > CUBE_MAX_CELLS:
+            return False
+        capacity_products, capacity_days = self._quantity.shape
+        if shift == 0 and products <= capacity_products and days <= capacity_days:
+            self.n_days = days
+            return True
+
+        # Spare rows and days, so a run of small appends reallocates rarely
+        new_products = max(products, capacity_products + capacity_products // 2)
+        new_days = days + DAY_HEADROOM
+        if new_products * new_days > CUBE_MAX_CELLS:
+            new_products, new_days = products, days
+        old = (self._quantity, self._value, self._sales, self._price, self._quotes, self._priced)
+        # Products just encoded have no data yet, so only the rows of the old grid are copied
+        n, used = min(len(self.names), capacity_products), self.n_days
+        self._allocate(new_products, new_days)
+        for target, source in zip((self._quantity, self._value, self._sales, self._price, self._quotes, self._priced), old):
+            target[:n, shift:shift + used] = source[:n, :used]
+        self.start -= np.timedelta64(shift, 'D')
+        self.retail_last += shift if self.retail_last >= 0 else 0
+        self.mandi_last += shift if self.mandi_last >= 0 else 0
+        self.n_days = days
+        return True
+
+    def _encode(self, products: pd.Series) -> np.ndarray:
+        # Interned columns are encoded per category, not per row
+        if isinstance(products.dtype, pd.CategoricalDtype):
+            names, codes = products.cat.categories, products.cat.codes.to_numpy()
+        else:
+            codes, names = pd.factorize(products)
+        lookup = np.empty(len(names), dtype=np.int64)
+        for i, name in enumerate(names.tolist()):
+            code = self._codes.get(name)
+            if code is None:
+                code = self._codes[name] = len(self.names)
+                self.names.append(name)
+                self._order = None
+            lookup[i] = code
+        return lookup[codes]
+
+    def _locate(self, df: pd.DataFrame):
+        """
+        Product codes and day offsets of a processed frame's rows, with the grid grown to
+        hold them; None if it would not fit
+        """
+        days = (df['date'].to_numpy(dtype='datetime64[D]') - self.start).astype(np.int64)
+        self.date_dtype = df['date'].dtype
+        known = len(self.names)
+        codes = self._encode(df['product'])
+        if not self._reserve(len(self.names), int(days.min()), int(days.max())):
+            # Forget the products of the rejected rows again
+            for name in self.names[known:]:
+                del self._codes[name]
+            del self.names[known:]
+            return None
+        # Offsets move when the grid was extended to earlier days
+        days = (df['date'].to_numpy(dtype='datetime64[D]') - self.start).astype(np.int64)
+        return codes, days
+
+    def add_sales(self, df: pd.DataFrame) -> bool:
+        """
+        Add processed retail rows to the sales of their (product, day) cells, as a merge sums them
+        Rows are unique per (date, product), as preprocess_retail_data and merges produce them
+        False if the grid would exceed CUBE_MAX_CELLS
+        """
+        if df.empty:
+            return True
+        with self.lock:
+            located = self._locate(df)
+            if located is None:
+                return False
+            codes, days = located
+            self._quantity[codes, days] += df['sales_quantity'].to_numpy(dtype=np.float64)
+            self._value[codes, days] += df['sales_value'].to_numpy(dtype=np.float64)
+            self._sales[codes, days] = True
+            self.quantity_integral = self.quantity_integral and df['sales_quantity'].dtype.kind in 'iu'
+            self.retail_last = max(self.retail_last, int(days.max()))
+        return True
+
+    def set_prices(self, df: pd.DataFrame) -> bool:
+        """
+        Overwrite the daily mean price and quote count of the cells of processed mandi rows,
+        e.g. the rows a merge produced or changed; False if the grid would exceed CUBE_MAX_CELLS
+        """
+        if df.empty:
+            return True
+        with self.lock:
+            located = self._locate(df)
+            if located is None:
+                return False
+            codes, days = located
+            self._price[codes, days] = df['price'].to_numpy(dtype=np.float64)
+            self._quotes[codes, days] = df['price_count'].to_numpy()
+            self._priced[codes, days] = True
+            self.mandi_last = max(self.mandi_last, int(days.max()))
+        return True
+
+    # Views of the used part of the grid; slicing them further does not copy
+
+    @property
+    def quantity(self) -> np.ndarray:
+        return self._quantity[:len(self.names), :self.n_days]
+
+    @property
+    def value(self) -> np.ndarray:
+        return self._value[:len(self.names), :self.n_days]
+
+    @property
+    def has_sales(self) -> np.ndarray:
+        return self._sales[:len(self.names), :self.n_days]
+
+    @property
+    def price(self) -> np.ndarray:
+        return self._price[:len(self.names), :self.n_days]
+
+    @property
+    def quotes(self) -> np.ndarray:
+        return self._quotes[:len(self.names), :self.n_days]
+
+    @property
+    def has_price(self) -> np.ndarray:
+        return self._priced[:len(self.names), :self.n_days]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def sorted_rows(self) -> np.ndarray:
+        """
+        Product rows in name order, the order the frame-based engines report products in
+        """
+        if self._order is None:
+            self._order = np.argsort(np.array(self.names, dtype=object), kind='stable')
+        return self._order
+
+    def products(self, rows: np.ndarray) -> pd.Index:
+        return pd.Index(np.array(self.names, dtype=object)[rows], dtype=object, name='product')
+
+    def rows_of(self, products) -> np.ndarray:
+        return np.array([self._codes[name] for name in products if name in self._codes], dtype=np.int64)
+
+    def dates(self, days: np.ndarray) -> np.ndarray:
+        return (self.start + np.asarray(days).astype('timedelta64[D]')).astype(self.date_dtype)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self._quantity, self._value, self._sales, self._price,
+                                               self._quotes, self._priced))
+
+    def stats(self) -> Dict:
+        return {
+            'products': len(self.names),
+            'days': self.n_days,
+            'start': str(self.start),
+            'mb': round(self.nbytes / 1024 / 1024, 2)
+        }
+
+def day_slice_sum(grid: np.ndarray, first: int, last: int) -> np.ndarray:
+    """
+    Per-product total of a grid over the day offsets first..last inclusive, clipped to day 0
+    """
+    return grid[:, max(first, 0):max(last + 1, 0)].sum(axis=1)
+
+def row_blocks(n_rows: int, n_days: int, cells: int = 1 << 20) -> List[slice]:
+    # Row ranges of about the given number of cells, bounding the temporaries of a grid pass
+    step = max(1, cells // max(n_days, 1))
+    return [slice(i, min(i + step, n_rows)) for i in range(0, n_rows, step)]
@@ -0,0 +1,669 @@
+import os
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from demand_engine import (
+    merge_retail_data, demand_window_totals, update_demand_window_totals,
+    demand_trends_from_totals, demand_signals_from_trends, rolling_window_totals,
+    cube_window_totals, weekly_demand, cube_weekly_demand
+)
+from price_engine import (
+    combine_mandi_data, merge_mandi_data, price_regression_stats, merge_price_stats,
+    price_trends_from_stats, price_signals_from_trends, location_price_signals,
+    cube_price_stats, update_cube_price_stats
+)
+from gap_analyzer import analyze_supply_demand_gap, get_gap_summary
+from recommendation_engine import (
+    generate_alerts_and_recommendations, get_actionable_insights, calculate_confidence_score,
+    generate_immediate_actions
+)
+from cache import ResultCache
+from concurrency import ReadWriteLock
+from cube import ProductDayCube
+from alerts import AlertFeed
+from ranking import RankingIndex, finite_or_none
+from store import STORE_DIR, store_enabled, save_processed, load_processed
+from forecasting import MODELS, ModelCache, SeriesSet, changed_series, forecast_series, backtest_series
+from settings import DEFAULT_DATASET, DATASET_NAME
+from history import SignalHistory
+from scenarios import ScenarioBase, evaluate_cells, scenario_cells, scenario_results
+from parallel import (
+    use_parallel, parallel_price_stats, parallel_demand_totals, parallel_gap_analysis, parallel_backtest,
+    parallel_evaluate_cells
+)
+
+# Other namespaces are persisted under <store>/datasets/<name>
+NAMESPACE_DIR = "datasets"
+
+# Memory ceiling for all namespaces in MB; idle ones are evicted to the store beyond it (0 = no limit)
+MEMORY_LIMIT_MB = float(os.environ.get("AGRIS_MEMORY_LIMIT_MB", "0"))
+
+# Analysis results cached per namespace
+CACHE_SIZE = int(os.environ.get("AGRIS_CACHE_SIZE", "128"))
+
+LOCATION_KEYS = ['product', 'location']
+
+# Length of the recent and previous periods behind the default demand signals
+DEMAND_PERIOD_DAYS = 14
+
+def full_demand_totals(df: pd.DataFrame) -> pd.DataFrame:
+    # Large datasets are sharded by product across worker processes when AGRIS_WORKERS > 1
+    if use_parallel(df['product'].nunique()):
+        return parallel_demand_totals(df)
+    return demand_window_totals(df)
+
+def full_price_stats(df: pd.DataFrame) -> pd.DataFrame:
+    if use_parallel(df['product'].nunique()):
+        return parallel_price_stats(df)
+    return price_regression_stats(df)
+
+def gap_analysis_for(demand_signals: list, price_signals: list) -> list:
+    if use_parallel(max(len(demand_signals), len(price_signals))):
+        return parallel_gap_analysis(demand_signals, price_signals)
+    return analyze_supply_demand_gap(demand_signals, price_signals)
+
+def append_raw(existing: Optional[pd.DataFrame], new: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+    if existing is None or new is None:
+        return new if existing is None else existing
+    return pd.concat([existing, new], ignore_index=True)
+
+def store_root(name: str) -> Optional[str]:
+    if name == DEFAULT_DATASET:
+        return None
+    return os.path.join(STORE_DIR, NAMESPACE_DIR, name)
+
+class Dataset:
+    """
+    One namespace: uploaded rows, processed frames, the running per-product aggregates
+    derived from them and the cached analysis results
+    """
+
+    def __init__(self, name: str, cache_size: int = CACHE_SIZE):
+        self.name = name
+        self.root = store_root(name)
+        self.retail_data = None
+        self.mandi_data = None
+        self.processed_retail_data = None
+        self.processed_mandi_data = None
+        # Mandi prices per (date, product, location), kept when the feed has a location column
+        self.processed_mandi_locations = None
+        # Running per-product aggregates kept up to date on every upload
+        self.retail_window_totals = None
+        self.mandi_price_stats = None
+        self.mandi_location_stats = None
+        # Product x day grid of both feeds that the engines read; None when too large to materialize
+        self.cube = None
+        # Bumped on every successful upload; cached analysis results are keyed by it
+        self.version = 0
+        # Versions restart at 0 in every process, so results are also keyed by this process's epoch:
+        # another worker or a restarted server serving the same version number gets other ETags
+        # and alert cursors
+        self.epoch = uuid.uuid4().hex
+        self.cache = ResultCache(max_entries=cache_size)
+        # Per-mandi price signals indexed by location, rebuilt once per dataset version
+        self.location_signal_index = {"version": None, "signals": {}}
+        # Parsed date columns of the served data, reused across requests for one version
+        self.parsed_dates = {}
+        # Signals and gap analysis of the current version, shared by every endpoint and the alerts
+        self.derived = {}
+        # Price series for forecasting per granularity, rebuilt once per dataset version
+        self.price_series = {}
+        # Fitted forecasting models, reused until new data arrives for their series
+        self.forecasts = ModelCache()
+        # Alerts published to subscribers; kept when the namespace is evicted so cursors stay valid
+        self.alerts = AlertFeed(self.epoch)
+        # Per-product scores for top-K queries, updated with the alerts on every data change
+        self.rankings = None
+        # Uploads parse concurrently but apply their results to the data one at a time, holding
+        # this exclusively; requests hold it shared, so each reads the frames and version of one upload
+        self.update_lock = ReadWriteLock()
+        self.frame_bytes = 0
+        self.evicted = False
+        self.users = 0
+        self.last_used = time.time()
+
+    @property
+    def has_retail(self) -> bool:
+        return self.processed_retail_data is not None
+
+    @property
+    def has_mandi(self) -> bool:
+        return self.processed_mandi_data is not None
+
+    def bump_version(self):
+        self.version += 1
+
+    def cache_key(self, analysis: str, params: tuple = ()) -> tuple:
+        return (self.name, self.epoch, self.version, analysis, params)
+
+    def apply_retail(self, df: Optional[pd.DataFrame], new_rows: pd.DataFrame, mode: str) -> Dict[str, int]:
+        """
+        Replace or append preprocessed retail rows; called with update_lock held
+        Returns the number of new, changed and resolved alerts
+        """
+        if mode == "append" and self.processed_retail_data is not None:
+            # Merge only the new rows and slide the running window totals
+            previous_max_date = self.processed_retail_data['date'].iloc[-1]
+            self.retail_data = append_raw(self.retail_data, df)
+            self.processed_retail_data = merge_retail_data(self.processed_retail_data, new_rows)
+            if self.cube is not None and not self.cube.add_sales(new_rows):
+                self.cube = None
+            if self.cube is not None:
+                self.retail_window_totals = self.demand_totals()
+            else:
+                self.retail_window_totals = update_demand_window_totals(
+                    self.retail_window_totals, self.processed_retail_data, new_rows, previous_max_date
+                )
+            save_processed("retail", self.processed_retail_data, changed=new_rows, root=self.root)
+        else:
+            self.retail_data = df
+            self.processed_retail_data = new_rows
+            self.rebuild_cube()
+            self.retail_window_totals = self.demand_totals()
+            save_processed("retail", self.processed_retail_data, root=self.root)
+        self.bump_version()
+        self.measure()
+        return self.refresh_signals()
+
+    def set_mandi_data(self, new_rows: pd.DataFrame):
+        """
+        Replace the processed mandi data with freshly preprocessed (per-mandi) rows
+        """
+        if 'location' in new_rows.columns:
+            self.processed_mandi_locations = new_rows
+            self.mandi_location_stats = price_regression_stats(new_rows, keys=LOCATION_KEYS)
+            self.processed_mandi_data = combine_mandi_data([new_rows])
+        else:
+            self.processed_mandi_locations = None
+            self.mandi_location_stats = None
+            self.processed_mandi_data = new_rows
+        self.rebuild_cube()
+        self.mandi_price_stats = self.price_stats()
+
+    def append_mandi_data(self, new_rows: pd.DataFrame) -> pd.DataFrame:
+        """
+        Merge newly preprocessed (per-mandi) rows into the processed data and running statistics
+        Returns the changed rows at the finest granularity available
+        """
+        if self.processed_mandi_locations is not None and 'location' in new_rows.columns:
+            self.processed_mandi_locations, removed, changed = merge_mandi_data(self.processed_mandi_locations, new_rows)
+            self.mandi_location_stats = merge_price_stats(self.mandi_location_stats, removed, changed, keys=LOCATION_KEYS)
+        else:
+            # Without locations on both sides only the product-level series can be maintained
+            self.processed_mandi_locations = None
+            self.mandi_location_stats = None
+            changed = None
+
+        self.processed_mandi_data, removed, added = merge_mandi_data(
+            self.processed_mandi_data, combine_mandi_data([new_rows])
+        )
+        if self.cube is not None and not self.cube.set_prices(added):
+            self.cube = None
+        if self.cube is not None:
+            # Only the products whose daily means changed are read back from the grid
+            self.mandi_price_stats = update_cube_price_stats(self.mandi_price_stats, self.cube, added['product'].unique())
+        else:
+            self.mandi_price_stats = merge_price_stats(self.mandi_price_stats, removed, added)
+        return added if changed is None else changed
+
+    def apply_mandi(self, df: Optional[pd.DataFrame], new_rows: pd.DataFrame, mode: str) -> Dict[str, int]:
+        """
+        Replace or append preprocessed mandi rows; called with update_lock held
+        Returns the number of new, changed and resolved alerts
+        """
+        if mode == "append" and self.processed_mandi_data is not None:
+            # Merge only the new rows and fold the changed points into the regression sums
+            self.mandi_data = append_raw(self.mandi_data, df)
+            changed = self.append_mandi_data(new_rows)
+            self.forecasts.invalidate(changed_series(changed))
+            save_processed("mandi", self.stored_mandi_data(), changed=changed, root=self.root)
+        else:
+            self.mandi_data = df
+            self.set_mandi_data(new_rows)
+            self.forecasts.invalidate()
+            save_processed("mandi", self.stored_mandi_data(), root=self.root)
+        self.bump_version()
+        self.measure()
+        return self.refresh_signals()
+
+    def stored_mandi_data(self) -> pd.DataFrame:
+        # The per-mandi frame is persisted when available; product data is derived from it on load
+        if self.processed_mandi_locations is not None:
+            return self.processed_mandi_locations
+        return self.processed_mandi_data
+
+    def served_data(self, kind: str) -> Optional[pd.DataFrame]:
+        """
+        Raw uploaded rows when they were retained, otherwise the processed data
+        """
+        if kind == "retail":
+            return self.retail_data if self.retail_data is not None else self.processed_retail_data
+        return self.mandi_data if self.mandi_data is not None else self.stored_mandi_data()
+
+    def served_dates(self, kind: str, df: pd.DataFrame) -> Optional[pd.Series]:
+        if 'date' not in df.columns:
+            return None
+        cached = self.parsed_dates.get(kind)
+        if cached is None or cached[0] != self.version:
+            cached = (self.version, pd.to_datetime(df['date']))
+            self.parsed_dates[kind] = cached
+        return cached[1]
+
+    def load(self) -> bool:
+        """
+        Restore the processed frames from the columnar store; raw rows are not persisted
+        Returns True if anything was found
+        """
+        retail = load_processed("retail", root=self.root)
+        if retail is not None:
+            self.processed_retail_data = retail
+        mandi = load_processed("mandi", root=self.root)
+        if mandi is not None:
+            # Builds the cube of both feeds
+            self.set_mandi_data(mandi)
+            self.forecasts.invalidate()
+        else:
+            self.rebuild_cube()
+        if retail is not None:
+            self.retail_window_totals = self.demand_totals()
+        self.evicted = False
+        if retail is None and mandi is None:
+            return False
+        self.bump_version()
+        self.measure()
+        self.refresh_signals()
+        return True
+
+    def ensure_loaded(self):
+        with self.update_lock:
+            if self.evicted:
+                self.load()
+
+    def unload(self):
+        """
+        Drop everything held in memory; the processed frames stay in the store
+        """
+        self.retail_data = self.mandi_data = None
+        self.processed_retail_data = self.processed_mandi_data = self.processed_mandi_locations = None
+        self.retail_window_totals = self.mandi_price_stats = self.mandi_location_stats = None
+        self.cube = None
+        self.location_signal_index = {"version": None, "signals": {}}
+        self.parsed_dates = {}
+        self.derived = {}
+        self.price_series = {}
+        self.forecasts.invalidate()
+        self.rankings = None
+        self.cache.clear()
+        self.frame_bytes = 0
+        self.evicted = True
+
+    def measure(self):
+        frames = [self.retail_data, self.mandi_data, self.processed_retail_data, self.processed_mandi_data,
+                  self.processed_mandi_locations, self.retail_window_totals, self.mandi_price_stats,
+                  self.mandi_location_stats]
+        self.frame_bytes = int(sum(df.memory_usage(deep=True).sum() for df in frames if df is not None))
+        if self.cube is not None:
+            self.frame_bytes += self.cube.nbytes
+
+    def memory_bytes(self) -> int:
+        history = self.derived.get("signal_history")
+        history_bytes = history[1].nbytes if history is not None and history[1] is not None else 0
+        return self.frame_bytes + history_bytes + self.cache.stats()['bytes']
+
+    def rebuild_cube(self):
+        self.cube = ProductDayCube.build(self.processed_retail_data, self.processed_mandi_data)
+
+    def demand_totals(self) -> pd.DataFrame:
+        if self.cube is not None:
+            return cube_window_totals(self.cube, [DEMAND_PERIOD_DAYS])[DEMAND_PERIOD_DAYS]
+        return full_demand_totals(self.processed_retail_data)
+
+    def price_stats(self) -> pd.DataFrame:
+        if self.cube is not None:
+            return cube_price_stats(self.cube)
+        return full_price_stats(self.processed_mandi_data)
+
+    def current(self, name: str, compute):
+        """
+        A result derived from the running aggregates, computed once per dataset version
+        """
+        cached = self.derived.get(name)
+        if cached is None or cached[0] != self.version:
+            cached = (self.version, compute())
+            self.derived[name] = cached
+        return cached[1]
+
+    def current_demand_signals(self) -> list:
+        return self.current("demand_signals", lambda: demand_signals_from_trends(
+            demand_trends_from_totals(self.retail_window_totals)))
+
+    def current_price_trends(self) -> dict:
+        return self.current("price_trends", lambda: price_trends_from_stats(self.mandi_price_stats))
+
+    def current_price_signals(self) -> list:
+        return self.current("price_signals", lambda: price_signals_from_trends(self.current_price_trends()))
+
+    def current_gap_analysis(self) -> list:
+        return self.current("gap_analysis", lambda: gap_analysis_for(self.current_demand_signals(),
+                                                                     self.current_price_signals()))
+
+    def current_location_index(self) -> dict:
+        if self.location_signal_index["version"] != self.version:
+            self.location_signal_index = {"version": self.version,
+                                          "signals": location_price_signals(self.mandi_location_stats)}
+        return self.location_signal_index["signals"]
+
+    def current_price_series(self, by_location: bool) -> SeriesSet:
+        cached = self.price_series.get(by_location)
+        if cached is None or cached[0] != self.version:
+            df = self.processed_mandi_locations if by_location else self.processed_mandi_data
+            cached = (self.version, SeriesSet(df, by_location=by_location))
+            self.price_series[by_location] = cached
+        return cached[1]
+
+    def refresh_signals(self) -> Dict[str, int]:
+        """
+        Update the ranking index and diff the alerts of the current version against the
+        published ones; runs once per data change instead of on every request
+        Returns the number of new, changed and resolved alerts
+        """
+        alerts = []
+        previous, self.rankings = self.rankings, None
+        if self.has_retail and self.has_mandi:
+            demand_signals = self.current_demand_signals()
+            price_trends = self.current_price_trends()
+            price_signals = self.current_price_signals()
+            gap_analysis = self.current_gap_analysis()
+            alerts = generate_alerts_and_recommendations(gap_analysis, demand_signals, price_signals)['alerts']
+            if previous is None:
+                self.rankings = RankingIndex(gap_analysis, demand_signals, price_trends)
+            else:
+                self.rankings = previous.updated(gap_analysis, demand_signals, price_trends)
+        return self.alerts.update(alerts, self.version)
+
+    def compute_demand_analysis(self) -> dict:
+        signals = self.current_demand_signals()
+        return {"signals": signals, "count": len(signals)}
+
+    def compute_demand_windows(self, windows: List[int]) -> dict:
+        # All windows are day slices of the cube, or come from one product x day pass over the data
+        if self.cube is not None:
+            totals = cube_window_totals(self.cube, windows)
+        else:
+            totals = rolling_window_totals(self.processed_retail_data, windows)
+        results = []
+        for days in windows:
+            signals = demand_signals_from_trends(demand_trends_from_totals(totals[days]))
+            results.append({"period_days": days, "signals": signals, "count": len(signals)})
+        return {"windows": results}
+
+    def compute_weekly_demand(self, weeks: int) -> dict:
+        if self.cube is not None:
+            return cube_weekly_demand(self.cube, weeks)
+        return weekly_demand(self.processed_retail_data, weeks)
+
+    def compute_price_analysis(self) -> dict:
+        signals = self.current_price_signals()
+        return {"signals": signals, "count": len(signals)}
+
+    def compute_gap_analysis(self) -> dict:
+        return gap_payload(self.current_gap_analysis())
+
+    def compute_recommendations(self) -> dict:
+        demand_signals = self.current_demand_signals()
+        price_signals = self.current_price_signals()
+
+        gap_analysis = self.current_gap_analysis()
+        alerts_and_rec = generate_alerts_and_recommendations(gap_analysis, demand_signals, price_signals)
+        actionable_insights = get_actionable_insights(gap_analysis, demand_signals, price_signals)
+
+        return {
+            # Stamped with when each alert was first raised, as published to subscribers
+            "alerts": self.alerts.stamp(alerts_and_rec['alerts']),
+            "recommendations": alerts_and_rec['recommendations'],
+            "summary": alerts_and_rec['summary'],
+            "actionable_insights": actionable_insights
+        }
+
+    def compute_ranked_recommendations(self, k: int, sort_by: str, signal_level: Optional[str],
+                                       prefix: Optional[str], minimums: Dict[str, float]) -> dict:
+        """
+        Recommendations narrowed by signal level, product prefix and score thresholds, with the
+        top k products per ranking, served from the ranking index and published alerts
+        """
+        rankings = self.rankings
+        if rankings is None:
+            return {"alerts": [], "recommendations": [], "ranked": [], "count": 0,
+                    "actionable_insights": get_actionable_insights([], [], [], k)}
+        
+        def matches(item: Dict) -> bool:
+            return ((signal_level is None or item['signal_level'] == signal_level) and
+                    (not prefix or str(item['product']).startswith(prefix)))
+        
+        def top_level(level: str) -> List[Dict]:
+            if signal_level not in (None, level):
+                return []
+            positions = rankings.top(k, "demand_change", level, prefix, minimums)
+            return [rankings.items[i] for i in positions]
+        
+        opportunities = top_level('opportunity')
+        risks = top_level('risk')
+        changing = rankings.top(k, "demand_change", signal_level, prefix, minimums)
+        ranked = rankings.records(rankings.top(k, sort_by, signal_level, prefix, minimums))
+        
+        return {
+            "alerts": [alert for alert in self.alerts.current() if matches(alert)],
+            "recommendations": [
+                {'product': item['product'], 'action': item['recommendation'], 'priority': item['signal_level'],
+                 'confidence': calculate_confidence_score(item)}
+                for item in rankings.items if matches(item)
+            ],
+            "ranked": ranked,
+            "count": len(ranked),
+            "actionable_insights": {
+                'top_opportunities': opportunities,
+                'top_risks': risks,
+                'fastest_changing_demands': [(rankings.products[i], finite_or_none(rankings.change_percentage[i]))
+                                             for i in changing if not np.isnan(rankings.change_percentage[i])],
+                'immediate_actions': generate_immediate_actions(opportunities, risks)
+            }
+        }
+
+    def compute_forecast(self, model: str, horizon: int, product: Optional[str] = None,
+                         location: Optional[str] = None) -> dict:
+        """
+        Price forecasts per product, or per mandi when a location is given; only series
+        that received data since their last fit are refitted
+        """
+        series = self.current_price_series(by_location=location is not None)
+        return forecast_series(series, MODELS[model], horizon, self.forecasts, series.select(product, location))
+
+    def compute_backtest(self, models: List[str], horizon: int, by_location: bool = False) -> dict:
+        series = self.current_price_series(by_location)
+        # Large backtests are split across worker processes when AGRIS_WORKERS > 1
+        if use_parallel(len(series)):
+            return parallel_backtest(series, models, horizon)
+        return backtest_series(series, models, horizon)
+
+    def current_signal_history(self) -> Optional[SignalHistory]:
+        # Built on first use per version; not kept for namespaces too large for a cube
+        if self.cube is None:
+            return None
+        return self.current("signal_history", lambda: SignalHistory.build(self.cube, DEMAND_PERIOD_DAYS))
+
+    def compute_history(self, product: Optional[str], first: Optional[str], last: Optional[str],
+                        as_of: Optional[str]) -> dict:
+        """
+        Point-in-time signals: every product's, or one product's, on the as_of date, or one
+        product's series of signals from first to last
+        """
+        history = self.current_signal_history()
+        if as_of is not None:
+            return history.as_of(as_of, product)
+        return history.product_series(product, first, last)
+
+    def current_scenario_base(self) -> ScenarioBase:
+        return self.current("scenario_base", lambda: ScenarioBase(
+            self.current_gap_analysis(), self.retail_window_totals, self.current_price_trends(),
+            self.current_price_series(by_location=False)))
+
+    def compute_scenarios(self, specs: List[Dict]) -> dict:
+        """
+        Gap and alert summaries of what-if scenarios, evaluated against the live analysis of
+        this version; only the products a scenario perturbs are copied and reclassified
+        """
+        base = self.current_scenario_base()
+        cells = scenario_cells(base, specs, self.forecasts)
+        # Large batches are classified on the worker processes when AGRIS_WORKERS > 1
+        if use_parallel(len(cells['row'])):
+            evaluated = parallel_evaluate_cells(cells)
+        else:
+            evaluated = evaluate_cells(cells)
+        return scenario_results(base, specs, cells, evaluated)
+
+    def default_analyses(self) -> dict:
+        """
+        Parameterless analysis requests that can be answered with the data uploaded so far
+        """
+        analyses = {}
+        if self.has_retail:
+            analyses["demand"] = self.compute_demand_analysis
+        if self.has_mandi:
+            analyses["price"] = self.compute_price_analysis
+        if self.has_retail and self.has_mandi:
+            analyses["gap"] = self.compute_gap_analysis
+            analyses["recommendations"] = self.compute_recommendations
+        return analyses
+
+    def stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "retail_rows": None if self.processed_retail_data is None else len(self.processed_retail_data),
+            "mandi_rows": None if self.processed_mandi_data is None else len(self.processed_mandi_data),
+            "memory_mb": round(self.memory_bytes() / 1024 / 1024, 2),
+            "cube": None if self.cube is None else self.cube.stats(),
+            "history": self.derived["signal_history"][1].stats() if self.derived.get("signal_history") else None,
+            "evicted": self.evicted,
+            "in_use": self.users,
+            "idle_seconds": round(time.time() - self.last_used, 1),
+            "cache": self.cache.stats()
+        }
+
+def gap_payload(gap_analysis: list) -> dict:
+    return {
+        "gap_analysis": gap_analysis,
+        "summary": get_gap_summary(gap_analysis),
+        "count": len(gap_analysis)
+    }
+
+class DatasetRegistry:
+    """
+    Named dataset namespaces, created on first upload and evicted to the columnar store,
+    least recently used first, when their combined memory exceeds the limit
+    """
+
+    def __init__(self, memory_limit_mb: float = MEMORY_LIMIT_MB):
+        self.memory_limit_mb = memory_limit_mb
+        self._datasets = {DEFAULT_DATASET: Dataset(DEFAULT_DATASET)}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def discover(self):
+        """
+        Register namespaces persisted by an earlier run without loading them
+        The default namespace is loaded right away, as before namespaces existed
+        """
+        self._datasets[DEFAULT_DATASET].load()
+        if not store_enabled():
+            return
+        path = os.path.join(STORE_DIR, NAMESPACE_DIR)
+        names = os.listdir(path) if os.path.isdir(path) else []
+        with self._lock:
+            for name in names:
+                if DATASET_NAME.match(name) and name not in self._datasets:
+                    dataset = Dataset(name)
+                    dataset.evicted = True
+                    self._datasets[name] = dataset
+
+    def acquire(self, name: str, create: bool = False) -> Dataset:
+        """
+        Mark a namespace as in use so it is not evicted; unknown names raise KeyError
+        unless create is set. Evicted namespaces still need ensure_loaded()
+        """
+        with self._lock:
+            dataset = self._datasets.get(name)
+            if dataset is None:
+                if not create:
+                    raise KeyError(name)
+                dataset = self._datasets[name] = Dataset(name)
+            dataset.users += 1
+            dataset.last_used = time.time()
+            return dataset
+
+    def release(self, dataset: Dataset):
+        with self._lock:
+            dataset.users -= 1
+            dataset.last_used = time.time()
+
+    @contextmanager
+    def checkout(self, name: str, create: bool = False):
+        dataset = self.acquire(name, create)
+        try:
+            dataset.ensure_loaded()
+            yield dataset
+        finally:
+            self.release(dataset)
+
+    def get(self, name: str) -> Optional[Dataset]:
+        with self._lock:
+            return self._datasets.get(name)
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(dataset.memory_bytes() for dataset in self._datasets.values())
+
+    def enforce_limit(self) -> List[str]:
+        """
+        Evict idle namespaces, least recently used first, until memory is under the limit
+        Namespaces in use, or being updated, are never evicted
+        """
+        if self.memory_limit_mb <= 0 or not store_enabled():
+            return []
+        limit = self.memory_limit_mb * 1024 * 1024
+        evicted = []
+        with self._lock:
+            total = sum(dataset.memory_bytes() for dataset in self._datasets.values())
+            for dataset in sorted(self._datasets.values(), key=lambda d: d.last_used):
+                if total <= limit:
+                    break
+                size = dataset.memory_bytes()
+                if dataset.evicted or size == 0 or dataset.users > 0:
+                    continue
+                if not dataset.update_lock.acquire(blocking=False):
+                    continue
+                try:
+                    total -= size
+                    dataset.unload()
+                finally:
+                    dataset.update_lock.release()
+                evicted.append(dataset.name)
+            self.evictions += len(evicted)
+        return evicted
+
+    def stats(self) -> Dict:
+        with self._lock:
+            datasets = list(self._datasets.values())
+        return {
+            "datasets": [dataset.stats() for dataset in sorted(datasets, key=lambda d: d.name)],
+            "count": len(datasets),
+            "loaded": sum(not dataset.evicted for dataset in datasets),
+            "memory_mb": round(sum(dataset.memory_bytes() for dataset in datasets) / 1024 / 1024, 2),
+            "memory_limit_mb": self.memory_limit_mb,
+            "evictions": self.evictions
+        }
@@ -2,78 +2,151 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple
-import warnings
-warnings.filterwarnings('ignore')
+from instrumentation import timed
+from frames import compact_counts, compact_keys, concat_frames, plain_index, widen
+from cube import ProductDayCube, day_slice_sum
+from schema import Schema
 
-def preprocess_retail_data(df: pd.DataFrame) -> pd.DataFrame:
+# Standard retail columns and the other names feeds use for them
+RETAIL_SCHEMA = Schema(
+    "retail",
+    {
+        'date': [],
+        'product': ['item', 'commodity'],
+        'sales_quantity': ['quantity', 'sales', 'volume'],
+        'sales_value': ['value', 'amount', 'price']
+    },
+    dtypes={'sales_value': 'float64'},
+    keys=['product']
+)
+
+@timed
+def preprocess_retail_data(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
     """
     Preprocess retail sales data to ensure proper format
     Expected columns: date, product, sales_quantity, sales_value
+    Pass copy=False when the caller hands over the frame and it may be modified in place
     """
     # Make a copy to avoid modifying original data
-    df = df.copy()
+    if copy:
+        df = df.copy()
     
-    # Convert date column to datetime if it exists
-    if 'date' in df.columns:
-        df['date'] = pd.to_datetime(df['date'])
-    elif 'Date' in df.columns:
-        df['date'] = pd.to_datetime(df['Date'])
-        
-    # Standardize column names
-    column_mapping = {
-        'product': ['product', 'Product', 'item', 'Item', 'commodity', 'Commodity'],
-        'sales_quantity': ['sales_quantity', 'quantity', 'Quantity', 'sales', 'Sales', 'volume', 'Volume'],
-        'sales_value': ['sales_value', 'value', 'Value', 'amount', 'Amount', 'price', 'Price']
-    }
-    
-    for standard_col, possible_cols in column_mapping.items():
-        for col in possible_cols:
-            if col in df.columns and standard_col not in df.columns:
-                df.rename(columns={col: standard_col}, inplace=True)
-                break
+    # Standardize column names and parse dates with the format pinned for this header
+    df = RETAIL_SCHEMA.normalize(df)
     
     # Group by date and product if multiple entries exist
     if 'date' in df.columns and 'product' in df.columns:
-        df = df.groupby(['date', 'product']).agg({
+        # Grouping on interned product codes is cheaper than on the strings
+        compact_keys(df, ['product'])
+        df = df.groupby(['date', 'product'], observed=True).agg({
             'sales_quantity': 'sum',
             'sales_value': 'sum'
         }).reset_index()
+        compact_counts(df)
     
     return df
 
-def calculate_demand_trends(df: pd.DataFrame, period_days: int = 14) -> Dict:
+@timed
+def combine_retail_data(frames: List[pd.DataFrame]) -> pd.DataFrame:
     """
-    Calculate demand trends comparing recent period to previous period
+    Combine separately preprocessed retail frames (e.g. CSV chunks) into one grouped frame
     """
-    if df.empty:
-        return {}
+    df = concat_frames(frames, ignore_index=True)
+    if 'date' not in df.columns or 'product' not in df.columns:
+        return df
     
-    df = df.sort_values('date', ascending=False)
+    if 'sales_quantity' in df.columns:
+        df['sales_quantity'] = widen(df['sales_quantity'])
+    df = df.groupby(['date', 'product'], observed=True).agg({
+        'sales_quantity': 'sum',
+        'sales_value': 'sum'
+    }).reset_index()
+    return compact_counts(df)
+
+@timed
+def merge_retail_data(processed: pd.DataFrame, new_rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Merge newly preprocessed retail rows into existing grouped (date, product) data
+    Only the tail of the existing data from the first new date onwards is regrouped
+    """
+    # Processed data is sorted by date, so rows that can overlap the new feed form a tail
+    split = processed['date'].searchsorted(new_rows['date'].min())
+    head = processed.iloc[:split]
+    tail = processed.iloc[split:]
     
-    # Get the most recent date
-    max_date = df['date'].max()
-    min_date = df['date'].min()
+    merged_tail = combine_retail_data([tail, new_rows])
     
-    # Define periods
-    recent_end = max_date
+    return concat_frames([head, merged_tail], ignore_index=True)
+
+def _window_bounds(max_date: pd.Timestamp, period_days: int) -> Tuple[pd.Timestamp, pd.Timestamp]:
+    """
+    Start dates of the recent and previous windows ending at max_date
+    """
     recent_start = max_date - timedelta(days=period_days)
+    previous_start = recent_start - timedelta(days=period_days)
+    return recent_start, previous_start
+
+def window_totals_at(df: pd.DataFrame, max_date: pd.Timestamp, period_days: int) -> pd.DataFrame:
+    """
+    Sum sales quantity per product over the recent and previous windows
+    """
+    recent_start, previous_start = _window_bounds(max_date, period_days)
     previous_end = recent_start
-    previous_start = previous_end - timedelta(days=period_days)
     
     # Filter data for each period
-    recent_data = df[(df['date'] >= recent_start) & (df['date'] <= recent_end)]
+    recent_data = df[(df['date'] >= recent_start) & (df['date'] <= max_date)]
     previous_data = df[(df['date'] >= previous_start) & (df['date'] <= previous_end)]
     
     # Calculate total sales for each product in each period
-    recent_totals = recent_data.groupby('product')['sales_quantity'].sum().to_dict()
-    previous_totals = previous_data.groupby('product')['sales_quantity'].sum().to_dict()
+    totals = pd.DataFrame({
+        'current_period_total': widen(recent_data['sales_quantity']).groupby(recent_data['product'], observed=True).sum(),
+        'previous_period_total': widen(previous_data['sales_quantity']).groupby(previous_data['product'], observed=True).sum()
+    })
     
-    # Calculate trends
+    # Totals are keyed by product name, so they can be merged with totals of other frames
+    totals.index = plain_index(totals.index)
+    return totals.fillna(0)
+
+@timed
+def demand_window_totals(df: pd.DataFrame, period_days: int = 14) -> pd.DataFrame:
+    """
+    Running per-product sales totals for the recent and previous periods
+    The data is expected to be sorted by date, as returned by preprocess_retail_data
+    """
+    if df.empty:
+        return pd.DataFrame(columns=['current_period_total', 'previous_period_total'])
+    
+    max_date = df['date'].iloc[-1]
+    _, previous_start = _window_bounds(max_date, period_days)
+    
+    # Only the rows inside the two windows are scanned
+    window = df.iloc[df['date'].searchsorted(previous_start):]
+    return window_totals_at(window, max_date, period_days)
+
+@timed
+def update_demand_window_totals(totals: pd.DataFrame, merged: pd.DataFrame, new_rows: pd.DataFrame,
+                                previous_max_date: pd.Timestamp, period_days: int = 14) -> pd.DataFrame:
+    """
+    Update running window totals after new_rows were merged into the data
+    If the latest date moved the windows slide and only their rows are rescanned,
+    otherwise the new quantities are simply added to the windows they fall in
+    """
+    if new_rows.empty:
+        return totals
+    
+    if merged['date'].iloc[-1] > previous_max_date:
+        return demand_window_totals(merged, period_days)
+    
+    delta = window_totals_at(new_rows, previous_max_date, period_days)
+    return totals.add(delta, fill_value=0)
+
+@timed
+def demand_trends_from_totals(totals: pd.DataFrame) -> Dict:
+    """
+    Calculate demand trends from per-product recent and previous period totals
+    """
     trends = {}
-    for product in set(recent_totals.keys()) | set(previous_totals.keys()):
-        recent_val = recent_totals.get(product, 0)
-        previous_val = previous_totals.get(product, 0)
-        
+    for product, recent_val, previous_val in zip(totals.index, totals['current_period_total'], totals['previous_period_total']):
         if previous_val > 0:
             change_pct = ((recent_val - previous_val) / previous_val) * 100
         elif recent_val > 0:
@@ -99,11 +172,168 @@ def calculate_demand_trends(df: pd.DataFrame, period_days: int = 14) -> Dict:
     
     return trends
 
+@timed
+def calculate_demand_trends(df: pd.DataFrame, period_days: int = 14) -> Dict:
+    """
+    Calculate demand trends comparing recent period to previous period
+    """
+    if df.empty:
+        return {}
+    
+    return demand_trends_from_totals(rolling_window_totals(df, [period_days])[period_days])
+
+@timed
+def demand_matrix(df: pd.DataFrame, span_days: int) -> Tuple[pd.Index, pd.Timestamp, np.ndarray, np.ndarray]:
+    """
+    Dense product x day matrices over the span_days days up to the latest date, zero-filled
+    on days without sales, returned as cumulative sums along the days with a leading zero column
+    so the total of any day range is one subtraction
+    Returns the products, the first day, cumulative quantities and cumulative row counts
+    """
+    dates = df['date']
+    if dates.is_monotonic_increasing:
+        # Processed data is sorted by date, so the span is a tail of the frame
+        start = dates.iloc[-1] - timedelta(days=span_days)
+        window = df.iloc[dates.searchsorted(start):]
+    else:
+        start = dates.max() - timedelta(days=span_days)
+        window = df[dates >= start]
+    
+    codes, products = pd.factorize(window['product'], sort=True)
+    day = (window['date'] - start).dt.days.to_numpy()
+    cells = codes * (span_days + 1) + day
+    shape = (len(products), span_days + 1)
+    quantity = np.bincount(cells, weights=widen(window['sales_quantity']).to_numpy(dtype='float64'),
+                           minlength=shape[0] * shape[1]).reshape(shape)
+    rows = np.bincount(cells, minlength=shape[0] * shape[1]).reshape(shape).astype(np.int32)
+    
+    zeros = np.zeros((shape[0], 1))
+    quantity_cum = np.concatenate([zeros, quantity.cumsum(axis=1)], axis=1)
+    rows_cum = np.concatenate([zeros.astype(np.int32), rows.cumsum(axis=1, dtype=np.int32)], axis=1)
+    return plain_index(pd.Index(products, name='product')), start, quantity_cum, rows_cum
+
+def _range_sum(cumulative: np.ndarray, first: int, last: int) -> np.ndarray:
+    """
+    Per-product total over the day offsets first..last inclusive (clipped to the matrix)
+    """
+    return cumulative[:, last + 1] - cumulative[:, max(first, 0)]
+
+@timed
+def rolling_window_totals(df: pd.DataFrame, windows: List[int]) -> Dict[int, pd.DataFrame]:
+    """
+    Recent and previous period totals for several window lengths from one product x day pass
+    Each window has the same bounds as window_totals_at: the recent period runs from
+    max_date - days to max_date and the previous one ends where it starts
+    """
+    empty = pd.DataFrame(columns=['current_period_total', 'previous_period_total'])
+    if df.empty:
+        return {days: empty for days in windows}
+    
+    span = 2 * max(windows)
+    products, _, quantity_cum, rows_cum = demand_matrix(df, span)
+    integral = df['sales_quantity'].dtype.kind in 'iu'
+    
+    results = {}
+    for days in windows:
+        # Only products with rows in either period are reported, as with the masked version
+        present = _range_sum(rows_cum, span - 2 * days, span) > 0
+        totals = pd.DataFrame({
+            'current_period_total': _range_sum(quantity_cum, span - days, span)[present],
+            'previous_period_total': _range_sum(quantity_cum, span - 2 * days, span - days)[present]
+        }, index=products[present])
+        if integral:
+            totals = totals.round().astype(np.int64)
+        results[days] = totals
+    return results
+
+@timed
+def cube_window_totals(cube: ProductDayCube, windows: List[int]) -> Dict[int, pd.DataFrame]:
+    """
+    Recent and previous period totals for several window lengths, summed over day slices
+    of the cube; same bounds and products as rolling_window_totals
+    """
+    with cube.lock:
+        return _cube_window_totals(cube, windows)
+
+def _cube_window_totals(cube: ProductDayCube, windows: List[int]) -> Dict[int, pd.DataFrame]:
+    empty = pd.DataFrame(columns=['current_period_total', 'previous_period_total'])
+    if cube.retail_last < 0:
+        return {days: empty for days in windows}
+    
+    last = cube.retail_last
+    rows = cube.sorted_rows()
+    results = {}
+    for days in windows:
+        # Only products with sales in either period are reported
+        present = rows[day_slice_sum(cube.has_sales, last - 2 * days, last)[rows] > 0]
+        totals = pd.DataFrame({
+            'current_period_total': day_slice_sum(cube.quantity, last - days, last)[present],
+            'previous_period_total': day_slice_sum(cube.quantity, last - 2 * days, last - days)[present]
+        }, index=cube.products(present))
+        if cube.quantity_integral:
+            totals = totals.round().astype(np.int64)
+        results[days] = totals
+    return results
+
+@timed
+def weekly_demand(df: pd.DataFrame, weeks: int) -> Dict:
+    """
+    Week-over-week sales per product: totals of consecutive 7-day blocks ending at the latest date,
+    oldest first
+    """
+    if df.empty or weeks <= 0:
+        return {'week_ending': [], 'products': {}}
+    
+    span = 7 * weeks - 1
+    products, start, quantity_cum, _ = demand_matrix(df, span)
+    ends = np.arange(6, span + 1, 7)
+    totals = quantity_cum[:, ends + 1] - quantity_cum[:, ends - 6]
+    if df['sales_quantity'].dtype.kind in 'iu':
+        totals = totals.round().astype(np.int64)
+    
+    return {
+        'week_ending': [(start + timedelta(days=int(end))).strftime('%Y-%m-%d') for end in ends],
+        'products': {product: row.tolist() for product, row in zip(products, totals)}
+    }
+
+@timed
+def cube_weekly_demand(cube: ProductDayCube, weeks: int) -> Dict:
+    """
+    weekly_demand read from the cube: totals of consecutive 7-day blocks ending at the latest
+    sales day, oldest first
+    """
+    with cube.lock:
+        if cube.retail_last < 0 or weeks <= 0:
+            return {'week_ending': [], 'products': {}}
+        
+        last = cube.retail_last
+        first = last - (7 * weeks - 1)
+        rows = cube.sorted_rows()
+        present = rows[day_slice_sum(cube.has_sales, first, last)[rows] > 0]
+        ends = np.arange(first + 6, last + 1, 7)
+        totals = np.column_stack([day_slice_sum(cube.quantity, end - 6, end)[present] for end in ends])
+        if cube.quantity_integral:
+            totals = totals.round().astype(np.int64)
+        products = cube.products(present)
+        week_ending = cube.dates(ends)
+    
+    return {
+        'week_ending': [pd.Timestamp(day).strftime('%Y-%m-%d') for day in week_ending],
+        'products': {product: row.tolist() for product, row in zip(products, totals)}
+    }
+
+@timed
 def get_demand_signals(df: pd.DataFrame) -> List[Dict]:
     """
     Generate demand signals in human-readable format
     """
-    trends = calculate_demand_trends(df)
+    return demand_signals_from_trends(calculate_demand_trends(df))
+
+@timed
+def demand_signals_from_trends(trends: Dict) -> List[Dict]:
+    """
+    Turn demand trends into human-readable signals
+    """
     signals = []
     
     for product, data in trends.items():
@@ -0,0 +1,260 @@
+import gzip
+import io
+import json
+import math
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # Falls back to the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Brotli is only offered when installed
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:  # MessagePack responses are optional
+    msgpack = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow IPC responses are optional
+    pa = None
+
+# Version of the analysis response layout, sent with every response; bumped when a field is renamed or removed
+SCHEMA_VERSION = 1
+
+# Bodies smaller than this are sent uncompressed, as the saving would not cover the cost
+MIN_COMPRESS_BYTES = int(os.environ.get("AGRIS_MIN_COMPRESS_BYTES", "1024"))
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Compact mode codes a string field of a record list with at most this many distinct values
+MAX_ENUM_VALUES = 256
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream"
+}
+FORMATS = tuple(MEDIA_TYPES)
+
+# Query parameters that choose the representation, not the result, so they are not part of its cache key
+PARAMS = ("format", "compact")
+
+def finite(content: Any) -> Any:
+    """
+    Payload with NaN and infinite floats (no data, demand from nothing) replaced by None,
+    as orjson writes them
+    """
+    if isinstance(content, float):
+        return content if math.isfinite(content) else None
+    if isinstance(content, dict):
+        return {key: finite(value) for key, value in content.items()}
+    if isinstance(content, (list, tuple)):
+        return [finite(value) for value in content]
+    return content
+
+def dumps(content: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """
+    UTF-8 JSON of a payload, with orjson when installed
+    default converts values neither encoder knows, e.g. jsonable_encoder
+    Both encoders write NaN and infinite floats as null, so a body does not depend on which is installed
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    if default is not None:
+        content = default(content)
+    # As JSONResponse renders it, which would reject the non-finite floats
+    return json.dumps(finite(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def loads(body: bytes) -> Any:
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+def compact(content: Any) -> Dict:
+    """
+    Payload with every list of records turned into columns, and the string columns with few
+    distinct values (signal levels, trends, recommendations) replaced by codes into lookup
+    tables shared by field name across the payload:
+
+        {"schema_version": 1, "enums": {"signal_level": ["watch", ...]},
+         "data": {"gap_analysis": {"$columns": {"product": [...], "signal_level": [0, ...]},
+                                   "$coded": ["signal_level"]}, ...}}
+    """
+    enums: Dict[str, List[str]] = {}
+    codes: Dict[str, Dict[str, int]] = {}
+
+    def code(field: str, values: List[str]) -> Optional[List[int]]:
+        index = codes.get(field, {})
+        added = set(values).difference(index)
+        if len(index) + len(added) > MAX_ENUM_VALUES or len(added) >= len(values):
+            return None
+        if field not in codes:
+            codes[field], enums[field] = index, []
+        for value in sorted(added):
+            index[value] = len(enums[field])
+            enums[field].append(value)
+        return [index[value] for value in values]
+
+    def table(records: List[Dict]) -> Dict:
+        columns, coded = {}, []
+        for field in records[0]:
+            values = [record[field] for record in records]
+            if all(type(value) is str for value in values):
+                codes_of = code(field, values)
+                if codes_of is not None:
+                    columns[field] = codes_of
+                    coded.append(field)
+                    continue
+            if any(isinstance(value, (dict, list, tuple)) for value in values):
+                values = [walk(value) for value in values]
+            columns[field] = values
+        return {"$columns": columns, "$coded": coded}
+
+    def walk(value: Any) -> Any:
+        if isinstance(value, dict):
+            return {key: walk(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            # Only lists whose records all have the same fields become columns
+            if value and all(isinstance(item, dict) for item in value):
+                keys = value[0].keys()
+                if keys and all(item.keys() == keys for item in value):
+                    return table(value)
+            return [walk(item) for item in value]
+        return value
+
+    data = walk(content)
+    return {"schema_version": SCHEMA_VERSION, "enums": enums, "data": data}
+
+def expand(content: Dict) -> Any:
+    """
+    Inverse of compact
+    """
+    enums = content["enums"]
+
+    def walk(value: Any) -> Any:
+        if isinstance(value, dict):
+            if "$columns" in value:
+                columns, coded = value["$columns"], set(value["$coded"])
+                decoded = {field: [enums[field][code] for code in values] if field in coded else [walk(item) for item in values]
+                           for field, values in columns.items()}
+                count = len(next(iter(decoded.values()), []))
+                return [{field: values[i] for field, values in decoded.items()} for i in range(count)]
+            return {key: walk(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [walk(item) for item in value]
+        return value
+
+    return walk(content["data"])
+
+def to_arrow(content: Any) -> bytes:
+    """
+    Arrow IPC stream of the payload's largest list of records, for loading into pandas or
+    polars; the other top-level fields travel as JSON in the schema metadata under "agris"
+    """
+    if pa is None:
+        raise ValueError("Arrow output requires pyarrow to be installed")
+    tables = {}
+    if isinstance(content, dict):
+        tables = {key: value for key, value in content.items()
+                  if isinstance(value, list) and value and all(isinstance(item, dict) for item in value)}
+    if not tables:
+        raise ValueError("Arrow output needs a response with a list of records")
+    name = max(tables, key=lambda key: len(tables[key]))
+    try:
+        table = pa.Table.from_pylist(tables[name])
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as exc:
+        raise ValueError(f"{name} cannot be encoded as Arrow: {exc}")
+    rest = {key: value for key, value in content.items() if key != name}
+    metadata = {"table": name, "schema_version": SCHEMA_VERSION, "fields": rest}
+    table = table.replace_schema_metadata({b"agris": dumps(metadata)})
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def available(fmt: str) -> bool:
+    return fmt == "json" or (fmt == "msgpack" and msgpack is not None) or (fmt == "arrow" and pa is not None)
+
+def negotiate_format(fmt: Optional[str], accept: Optional[str]) -> str:
+    """
+    Format asked for by the format query parameter, else by the Accept header, else JSON
+    """
+    if fmt is not None:
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        if not available(fmt):
+            required = "msgpack" if fmt == "msgpack" else "pyarrow"
+            raise ValueError(f"{fmt} output requires {required} to be installed")
+        return fmt
+    if accept:
+        for candidate in ("msgpack", "arrow"):
+            if MEDIA_TYPES[candidate] in accept and available(candidate):
+                return candidate
+    return "json"
+
+def parse_flag(value: Optional[str]) -> bool:
+    if value is None:
+        return False
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no", ""):
+        return False
+    raise ValueError("compact must be true or false")
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Content coding for an Accept-Encoding header: br when available and accepted, else gzip
+    Codings given q=0 are refused
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip()] = quality
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output, and so the cached body, the same for the same input
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+def encode(content: Any, fmt: str, compact_mode: bool) -> bytes:
+    """
+    Body of a decoded JSON payload in a format, compacted first if asked
+    Arrow carries its own column types, so it ignores compact mode
+    """
+    if fmt == "arrow":
+        return to_arrow(content)
+    if compact_mode:
+        content = compact(content)
+    if fmt == "msgpack":
+        return msgpack.packb(content, use_bin_type=True)
+    return dumps(content)
+
+def variant(fmt: str, compact_mode: bool) -> Tuple:
+    """
+    Cache key suffix of a representation; the plain JSON body has none
+    """
+    if fmt == "json" and not compact_mode:
+        return ()
+    return (("$format", fmt, compact_mode),)
@@ -0,0 +1,464 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+from instrumentation import timed
+
+# Days of history, counted back from each series' latest quote, that models are fitted on
+HISTORY_DAYS = int(os.environ.get("AGRIS_FORECAST_HISTORY_DAYS", "365"))
+
+# Fitted models kept per namespace; a fitted model is a handful of floats
+MODEL_CACHE_SIZE = int(os.environ.get("AGRIS_FORECAST_CACHE_SIZE", "20000"))
+
+# Series fitted per batch, bounding the size of the series x day matrix
+FIT_BATCH = 4096
+
+# Length of the seasonal cycle in days; mandi prices follow the weekly market rhythm
+SEASON_DAYS = 7
+
+class Forecaster(ABC):
+    """
+    A forecasting model fitted to many price series at once
+    fit() takes a (series x day) matrix whose last column is each series' latest day and
+    NaN where a series has no quote, and returns one row of parameters per series;
+    predict() turns parameter rows into forecasts for days 1..horizon after the last column
+    """
+    name = None
+    # Series with fewer quotes than this are not fitted
+    min_points = 3
+
+    @abstractmethod
+    def fit(self, y: np.ndarray) -> np.ndarray:
+        ...
+
+    @abstractmethod
+    def predict(self, params: np.ndarray, horizon: int) -> np.ndarray:
+        ...
+
+def _day_offsets(n_days: int) -> np.ndarray:
+    # Day of every column relative to the last one, which is day 0
+    return np.arange(n_days, dtype=np.float64) - (n_days - 1)
+
+class LinearForecaster(Forecaster):
+    """
+    Least squares straight line, the model behind the price trends
+    """
+    name = "linear"
+    min_points = 3
+
+    def fit(self, y: np.ndarray) -> np.ndarray:
+        observed = ~np.isnan(y)
+        x = np.where(observed, _day_offsets(y.shape[1]), 0.0)
+        values = np.where(observed, y, 0.0)
+        n = observed.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_x = x.sum(axis=1) / n
+            mean_y = values.sum(axis=1) / n
+            dx = np.where(observed, x - mean_x[:, None], 0.0)
+            sxx = (dx * dx).sum(axis=1)
+            slope = np.where(sxx > 0, (dx * values).sum(axis=1) / sxx, 0.0)
+        return np.column_stack([mean_y - slope * mean_x, slope])
+
+    def predict(self, params: np.ndarray, horizon: int) -> np.ndarray:
+        steps = np.arange(1, horizon + 1)
+        return params[:, :1] + params[:, 1:2] * steps
+
+class PolynomialForecaster(Forecaster):
+    """
+    Least squares polynomial in time, fitted to all series through batched normal equations
+    """
+    min_points = 4
+    # Days per unit of the time variable, keeping the normal equations well conditioned
+    scale = 30.0
+
+    def __init__(self, degree: int = 2):
+        self.degree = degree
+        self.name = "polynomial" if degree == 2 else f"polynomial{degree}"
+
+    def _design(self, days: np.ndarray) -> np.ndarray:
+        return np.vander(days / self.scale, self.degree + 1, increasing=True)
+
+    def fit(self, y: np.ndarray) -> np.ndarray:
+        observed = ~np.isnan(y)
+        design = self._design(_day_offsets(y.shape[1]))
+        weights = observed.astype(np.float64)
+        gram = np.einsum('sd,di,dj->sij', weights, design, design)
+        moments = np.where(observed, y, 0.0) @ design
+        # The pseudo-inverse also copes with series whose points cannot pin down every term
+        return np.einsum('sij,sj->si', np.linalg.pinv(gram), moments)
+
+    def predict(self, params: np.ndarray, horizon: int) -> np.ndarray:
+        return params @ self._design(np.arange(1, horizon + 1, dtype=np.float64)).T
+
+class HoltWintersForecaster(Forecaster):
+    """
+    Additive Holt-Winters exponential smoothing (level, trend and weekly season) with fixed
+    smoothing factors, run over the days of all series together
+    Days without a quote advance the level by the trend without an update
+    """
+    name = "holt_winters"
+
+    def __init__(self, alpha: float = 0.3, beta: float = 0.1, gamma: float = 0.1, season: int = SEASON_DAYS):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.season = season
+        self.min_points = 2 * season
+
+    def fit(self, y: np.ndarray) -> np.ndarray:
+        n_series, n_days = y.shape
+        level = np.full(n_series, np.nan)
+        trend = np.zeros(n_series)
+        seasonal = np.zeros((n_series, self.season))
+        for day in range(n_days):
+            value = y[:, day]
+            slot = day % self.season
+            observed = ~np.isnan(value)
+            started = ~np.isnan(level)
+
+            first = observed & ~started
+            level[first] = value[first]
+
+            update = observed & started
+            s = seasonal[update, slot]
+            previous = level[update]
+            level[update] = self.alpha * (value[update] - s) + (1 - self.alpha) * (previous + trend[update])
+            trend[update] = self.beta * (level[update] - previous) + (1 - self.beta) * trend[update]
+            seasonal[update, slot] = self.gamma * (value[update] - level[update]) + (1 - self.gamma) * s
+
+            gap = started & ~observed
+            level[gap] += trend[gap]
+        # Rotate the seasonal terms so the first one belongs to the day after the last column
+        seasonal = np.roll(seasonal, -(n_days % self.season), axis=1)
+        return np.column_stack([level, trend, seasonal])
+
+    def predict(self, params: np.ndarray, horizon: int) -> np.ndarray:
+        steps = np.arange(1, horizon + 1)
+        seasonal = params[:, 2:][:, (steps - 1) % self.season]
+        return params[:, :1] + params[:, 1:2] * steps + seasonal
+
+class SeasonalNaiveForecaster(Forecaster):
+    """
+    Repeats the last full season, each day forecast as the price on the same weekday before
+    """
+    name = "seasonal_naive"
+
+    def __init__(self, season: int = SEASON_DAYS):
+        self.season = season
+        self.min_points = season
+
+    def fit(self, y: np.ndarray) -> np.ndarray:
+        # Days without a quote carry the previous price
+        filled = pd.DataFrame(y).ffill(axis=1).to_numpy()
+        last_season = filled[:, -self.season:]
+        if last_season.shape[1] < self.season:
+            last_season = np.pad(last_season, ((0, 0), (self.season - last_season.shape[1], 0)),
+                                 constant_values=np.nan)
+        # Series younger than a season repeat their latest price
+        return np.where(np.isnan(last_season), filled[:, -1:], last_season)
+
+    def predict(self, params: np.ndarray, horizon: int) -> np.ndarray:
+        return params[:, (np.arange(horizon) % self.season)]
+
+MODELS = {}
+
+def register_model(model: Forecaster):
+    """
+    Make a forecaster available to the forecast and backtest endpoints under its name
+    """
+    MODELS[model.name] = model
+
+for _model in (LinearForecaster(), PolynomialForecaster(), HoltWintersForecaster(), SeasonalNaiveForecaster()):
+    register_model(_model)
+
+class SeriesSet:
+    """
+    Price series of a processed mandi frame, one per product or (product, location),
+    stored sorted by series so the quotes of any set of series can be gathered into a
+    right-aligned (series x day) matrix without regrouping the frame
+    """
+
+    def __init__(self, df: pd.DataFrame, by_location: bool = False, history_days: int = HISTORY_DAYS):
+        self.by_location = by_location
+        columns = ['product', 'location'] if by_location else ['product']
+        if df.empty:
+            codes = np.zeros(0, dtype=np.int64)
+            names = []
+        elif by_location:
+            codes, names = pd.factorize(pd.MultiIndex.from_frame(df[columns].astype(object)), sort=True)
+        else:
+            codes, names = pd.factorize(df['product'].astype(object), sort=True)
+        # Series keys are (product, location) pairs, with location None for product-level series
+        self.keys = [tuple(name) for name in names] if by_location else [(name, None) for name in names]
+
+        order = np.argsort(codes, kind='stable')
+        self.codes = codes[order]
+        self.days = df['date'].to_numpy(dtype='datetime64[D]')[order]
+        self.prices = df['price'].to_numpy(dtype=np.float64)[order]
+        self.offsets = np.searchsorted(self.codes, np.arange(len(self.keys) + 1))
+        self.counts = np.diff(self.offsets)
+
+        if len(self.keys):
+            self.last_days = np.maximum.reduceat(self.days.astype(np.int64), self.offsets[:-1]).astype('datetime64[D]')
+            span = int((self.last_days[self.codes] - self.days).astype(np.int64).max()) + 1
+        else:
+            self.last_days = np.zeros(0, dtype='datetime64[D]')
+            span = 1
+        self.n_days = max(1, min(history_days, span))
+
+        # Quotes inside the fitted window; older ones do not count towards min_points
+        if len(self.keys):
+            recent = self.days >= self.last_days[self.codes] - (self.n_days - 1)
+            self.recent_counts = np.add.reduceat(recent.astype(np.int64), self.offsets[:-1])
+        else:
+            self.recent_counts = self.counts
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def matrix(self, rows: np.ndarray) -> np.ndarray:
+        """
+        (series x day) prices of the given series, the last column being each series' latest day
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.offsets[rows]
+        lengths = self.offsets[rows + 1] - starts
+        row_of = np.repeat(np.arange(len(rows)), lengths)
+        positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+
+        column = (self.n_days - 1) - (self.last_days[rows][row_of] - self.days[positions]).astype(np.int64)
+        keep = column >= 0
+        y = np.full((len(rows), self.n_days), np.nan)
+        y[row_of[keep], column[keep]] = self.prices[positions[keep]]
+        return y
+
+    def select(self, product: Optional[str] = None, location: Optional[str] = None) -> np.ndarray:
+        """
+        Positions of the series of a product and/or location, all series without either
+        """
+        if product is None and location is None:
+            return np.arange(len(self.keys))
+        return np.array([i for i, (p, l) in enumerate(self.keys)
+                         if (product is None or p == product) and (location is None or l == location)], dtype=np.int64)
+
+class ModelCache:
+    """
+    Fitted model parameters per (product, location, model, series version)
+    A series' version changes only when new data arrives for it, so appends to other
+    series leave its fitted models usable; least recently used models are dropped first
+    """
+
+    def __init__(self, max_entries: int = MODEL_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def invalidate(self, series: Optional[Iterable[Tuple]] = None):
+        """
+        Mark series as changed; without series, everything (a replaced or reloaded dataset)
+        """
+        with self._lock:
+            if series is None:
+                self._generation += 1
+                self._versions.clear()
+                self._entries.clear()
+                return
+            for key in series:
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def _key(self, series: Tuple, model: str) -> Hashable:
+        return (*series, model, (self._generation, self._versions.get(series, 0)))
+
+    def lookup(self, keys: List[Tuple], model: str) -> List[Optional[np.ndarray]]:
+        found = []
+        with self._lock:
+            for series in keys:
+                key = self._key(series, model)
+                params = self._entries.get(key)
+                if params is not None:
+                    self._entries.move_to_end(key)
+                found.append(params)
+            hits = sum(params is not None for params in found)
+            self.hits += hits
+            self.misses += len(found) - hits
+        return found
+
+    def store(self, keys: List[Tuple], model: str, params: np.ndarray):
+        with self._lock:
+            for series, row in zip(keys, params):
+                self._entries[self._key(series, model)] = row
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups > 0 else 0
+            }
+
+def changed_series(rows: pd.DataFrame) -> List[Tuple]:
+    """
+    Series keys touched by changed mandi rows: every product, and every (product, location)
+    when the rows have a location
+    """
+    products = [(product, None) for product in rows['product'].astype(object).unique()]
+    if 'location' not in rows.columns:
+        return products
+    pairs = rows[['product', 'location']].astype(object).drop_duplicates()
+    return products + list(pairs.itertuples(index=False, name=None))
+
+def batches(rows: np.ndarray, size: int = FIT_BATCH) -> List[np.ndarray]:
+    return [rows[i:i + size] for i in range(0, len(rows), size)]
+
+@timed
+def fitted_params(series: SeriesSet, model: Forecaster, cache: Optional[ModelCache] = None,
+                  rows: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Parameters of model for the given series, fitting only those without a cached fit
+    """
+    rows = np.arange(len(series)) if rows is None else np.asarray(rows, dtype=np.int64)
+    keys = [series.keys[i] for i in rows]
+    cached = cache.lookup(keys, model.name) if cache is not None else [None] * len(rows)
+    missing = np.array([i for i, params in enumerate(cached) if params is None], dtype=np.int64)
+
+    fitted = {}
+    for batch in batches(missing):
+        params = model.fit(series.matrix(rows[batch]))
+        if cache is not None:
+            cache.store([keys[i] for i in batch], model.name, params)
+        fitted.update(zip(batch.tolist(), params))
+
+    if not len(rows):
+        return np.zeros((0, 0))
+    return np.vstack([fitted[i] if params is None else params for i, params in enumerate(cached)])
+
+@timed
+def forecast_series(series: SeriesSet, model: Forecaster, horizon: int, cache: Optional[ModelCache] = None,
+                    rows: Optional[np.ndarray] = None) -> Dict:
+    """
+    Forecast the given series (all by default) that have enough history, reusing cached fits
+    """
+    rows = np.arange(len(series)) if rows is None else rows
+    eligible = rows[series.recent_counts[rows] >= model.min_points]
+    forecasts = []
+    if len(eligible):
+        prices = model.predict(fitted_params(series, model, cache, eligible), horizon)
+        prices = np.round(np.maximum(prices, 0), 2)  # Ensure non-negative prices
+        steps = np.arange(1, horizon + 1)
+        dates = np.datetime_as_string(series.last_days[eligible][:, None] + steps, unit='D')
+        for i, row in enumerate(eligible):
+            product, location = series.keys[row]
+            forecast = {'product': product}
+            if series.by_location:
+                forecast['location'] = location
+            forecast.update({
+                'last_date': str(series.last_days[row]),
+                'forecast_dates': dates[i].tolist(),
+                'forecast_prices': prices[i].tolist()
+            })
+            forecasts.append(forecast)
+    return {
+        'model': model.name,
+        'horizon': horizon,
+        'forecasts': forecasts,
+        'count': len(forecasts),
+        'insufficient_history': len(rows) - len(eligible)
+    }
+
+def backtest_matrix(y: np.ndarray, models: List[str], horizon: int) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Hold out the last horizon days of every series, fit each model on the days before and
+    score its forecasts against the held-out prices
+    Returns per-series absolute and percentage error sums and point counts per model
+    """
+    train, test = y[:, :-horizon], y[:, -horizon:]
+    observed = ~np.isnan(test)
+    history = (~np.isnan(train)).sum(axis=1)
+    results = {}
+    for name in models:
+        model = MODELS[name]
+        usable = (history >= model.min_points) & observed.any(axis=1)
+        errors = np.full(test.shape, np.nan)
+        if usable.any():
+            predicted = np.maximum(model.predict(model.fit(train[usable]), horizon), 0)
+            errors[usable] = predicted - test[usable]
+        scored = observed & ~np.isnan(errors)
+        absolute = np.where(scored, np.abs(errors), 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percentage = np.where(scored & (test > 0), absolute / test * 100, 0.0)
+        results[name] = {
+            'abs_error': absolute.sum(axis=1),
+            'pct_error': percentage.sum(axis=1),
+            'sq_error': (absolute * absolute).sum(axis=1),
+            'points': scored.sum(axis=1),
+            'pct_points': (scored & (test > 0)).sum(axis=1)
+        }
+    return results
+
+def backtest_rows(series: SeriesSet, horizon: int) -> np.ndarray:
+    # Series with more quotes than the held-out days
+    return np.flatnonzero(series.recent_counts > horizon)
+
+@timed
+def backtest_summary(parts: List[Dict[str, Dict[str, np.ndarray]]], models: List[str], horizon: int,
+                     n_series: int) -> Dict:
+    """
+    Combine per-batch backtest errors into per-model error metrics and the number of
+    series on which each model had the lowest mean absolute error
+    """
+    merged = {name: {metric: np.concatenate([part[name][metric] for part in parts]) if parts else np.zeros(0)
+                     for metric in ('abs_error', 'pct_error', 'sq_error', 'points', 'pct_points')}
+              for name in models}
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_series_mae = np.vstack([merged[name]['abs_error'] / merged[name]['points'] for name in models])
+    scored = ~np.isnan(per_series_mae).all(axis=0) if per_series_mae.size else np.zeros(0, dtype=bool)
+    best = np.nanargmin(np.where(np.isnan(per_series_mae), np.inf, per_series_mae), axis=0)[scored] \
+        if scored.any() else np.zeros(0, dtype=np.int64)
+    wins = np.bincount(best, minlength=len(models))
+
+    results = []
+    for i, name in enumerate(models):
+        m = merged[name]
+        points = int(m['points'].sum())
+        pct_points = int(m['pct_points'].sum())
+        results.append({
+            'model': name,
+            'series': int((m['points'] > 0).sum()),
+            'points': points,
+            'mae': round(float(m['abs_error'].sum() / points), 4) if points else None,
+            'rmse': round(float(np.sqrt(m['sq_error'].sum() / points)), 4) if points else None,
+            'mape': round(float(m['pct_error'].sum() / pct_points), 2) if pct_points else None,
+            'best_for_series': int(wins[i])
+        })
+    ranked = sorted((r for r in results if r['mae'] is not None), key=lambda r: r['mae'])
+    return {
+        'horizon': horizon,
+        'series': n_series,
+        'evaluated_series': int(scored.sum()),
+        'models': results,
+        'best_model': ranked[0]['model'] if ranked else None
+    }
+
+@timed
+def backtest_series(series: SeriesSet, models: List[str], horizon: int) -> Dict:
+    """
+    Backtest models on every series long enough, one vectorized fit per model and batch
+    """
+    parts = [backtest_matrix(series.matrix(batch), models, horizon) for batch in batches(backtest_rows(series, horizon))]
+    return backtest_summary(parts, models, horizon, len(series))
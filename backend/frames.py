@@ -0,0 +1,108 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from typing import List
+
+# Set AGRIS_COMPACT_FRAMES=0 to keep product/location as plain strings and 64-bit numbers
+COMPACT = os.environ.get("AGRIS_COMPACT_FRAMES", "1") != "0"
+
+# Columns interned as categoricals: each distinct name is stored once, rows hold integer codes
+KEY_COLUMNS = ['product', 'location']
+
+# Count-like columns stored in the narrowest integer type that holds them
+COUNT_COLUMNS = ['sales_quantity', 'price_count']
+
+def compact_keys(df: pd.DataFrame, columns: List[str] = KEY_COLUMNS) -> pd.DataFrame:
+    """
+    Intern the product/location columns of a frame in place
+    Categories are sorted, so grouping on the codes gives the same order as on the strings
+    """
+    if not COMPACT:
+        return df
+    for col in columns:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = pd.Categorical(df[col])
+    return df
+
+def compact_counts(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Downcast integer count columns of an aggregated frame in place
+    Prices and values stay float64, the regression sums are accumulated from them
+    """
+    if not COMPACT:
+        return df
+    for col in COUNT_COLUMNS:
+        if col in df.columns and df[col].dtype.kind in 'iu':
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+def widen(series: pd.Series) -> pd.Series:
+    """
+    A count column as int64/float64 before it is summed, so narrow integers cannot overflow
+    """
+    if series.dtype.kind in 'iu':
+        return series.astype(np.int64)
+    return series
+
+def plain_index(index: pd.Index) -> pd.Index:
+    """
+    Index of product (and location) names for per-series results, so results of
+    frames with different categories can be aligned and merged
+    """
+    if isinstance(index, pd.MultiIndex):
+        return pd.MultiIndex.from_arrays(
+            [index.get_level_values(i).astype(object) for i in range(index.nlevels)], names=index.names
+        )
+    if isinstance(index, pd.CategoricalIndex):
+        return index.astype(object)
+    return index
+
+def concat_frames(frames: List[pd.DataFrame], **kwargs) -> pd.DataFrame:
+    """
+    pd.concat that keeps interned columns categorical: frames interned separately (e.g. CSV chunks)
+    have different categories, which plain concat would turn back into strings
+    """
+    frames = list(frames)
+    for col in KEY_COLUMNS:
+        columns = [frame[col] for frame in frames if col in frame.columns]
+        if len(columns) < 2 or not any(isinstance(c.dtype, pd.CategoricalDtype) for c in columns):
+            continue
+        if all(c.dtype == columns[0].dtype for c in columns):
+            continue
+        categories = union_categoricals([pd.Categorical(c) for c in columns], sort_categories=True).categories
+        dtype = pd.CategoricalDtype(categories)
+        frames = [frame.assign(**{col: frame[col].astype(dtype)}) if col in frame.columns else frame
+                  for frame in frames]
+    return pd.concat(frames, **kwargs)
+
+def frame_mb(df: pd.DataFrame) -> float:
+    """
+    Memory held by a frame in MB, including the strings behind object columns
+    """
+    return round(df.memory_usage(deep=True).sum() / 1024 / 1024, 2)
+
+def plain_frame_mb(df: pd.DataFrame) -> float:
+    """
+    Memory the same frame would hold with string keys and 64-bit counts, computed from
+    the category sizes without building it
+    """
+    total = df.index.memory_usage(deep=True)
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            categories = series.cat.categories
+            if categories.dtype == object:
+                # Every row holds a pointer to its own Python string
+                sizes = np.array([sys.getsizeof(name) for name in categories], dtype=np.int64)
+            else:
+                # Arrow-backed strings: the UTF-8 bytes of every row plus an offset
+                sizes = np.array([len(str(name).encode()) for name in categories], dtype=np.int64)
+            codes = series.cat.codes.to_numpy()
+            total += 8 * len(series) + int(sizes[codes[codes >= 0]].sum())
+        elif col in COUNT_COLUMNS and series.dtype.kind in 'iu':
+            total += 8 * len(series)
+        else:
+            total += series.memory_usage(deep=True, index=False)
+    return round(total / 1024 / 1024, 2)
@@ -1,118 +1,176 @@
-from typing import Dict, List
+import json
+import os
+from collections import Counter
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
 from enum import Enum
+from instrumentation import timed
 
 class SignalLevel(Enum):
     OPPORTUNITY = "opportunity"  # Green: High demand + rising price
     WATCH = "watch"             # Yellow: Mixed signals
     RISK = "risk"               # Red: Falling demand + falling price
 
-def analyze_supply_demand_gap(demand_signals: List[Dict], price_signals: List[Dict]) -> List[Dict]:
+SIGNAL_COLORS = {
+    SignalLevel.OPPORTUNITY.value: "🟢",
+    SignalLevel.WATCH.value: "🟡",
+    SignalLevel.RISK.value: "🔴"
+}
+
+# (demand_direction, price_direction) -> (signal level, recommendation)
+DEFAULT_RULES = {
+    # High demand + rising price = Opportunity
+    ("up", "up"): (SignalLevel.OPPORTUNITY.value, "HOLD / PROCURE - High demand with rising prices"),
+    # Falling demand + falling price = Risk
+    ("down", "down"): (SignalLevel.RISK.value, "SELL FAST - Falling demand and prices"),
+    # Rising demand + falling price = Opportunity (buy low, demand high)
+    ("up", "down"): (SignalLevel.OPPORTUNITY.value, "BUY & STORE - High demand but prices still falling"),
+    # Falling demand + rising price = Risk (high price, low demand)
+    ("down", "up"): (SignalLevel.RISK.value, "AVOID BUYING - Low demand but high prices"),
+}
+
+# Applied to every direction pair without a rule of its own
+DEFAULT_FALLBACK = (SignalLevel.WATCH.value, "MONITOR - Mixed signals, proceed with caution")
+
+class RuleTable:
+    """
+    Declarative mapping of (demand_direction, price_direction) to a signal level and recommendation
+    """
+
+    def __init__(self, rules: Dict = DEFAULT_RULES, fallback: tuple = DEFAULT_FALLBACK):
+        levels = {level.value for level in SignalLevel}
+        for level, _ in list(rules.values()) + [fallback]:
+            if level not in levels:
+                raise ValueError(f"Unknown signal level '{level}', expected one of {sorted(levels)}")
+        self.rules = dict(rules)
+        self.fallback = fallback
+        self.index = pd.MultiIndex.from_tuples(list(self.rules), names=['demand_direction', 'price_direction'])
+        # Row i holds rule i; the last row is the fallback, picked for pairs without a rule
+        outcomes = list(self.rules.values()) + [fallback]
+        self.levels = np.array([level for level, _ in outcomes], dtype=object)
+        self.recommendations = np.array([recommendation for _, recommendation in outcomes], dtype=object)
+
+    @classmethod
+    def from_file(cls, path: str) -> "RuleTable":
+        """
+        Load a rule table from JSON:
+        {"rules": [{"demand": "up", "price": "up", "signal_level": "opportunity", "recommendation": "..."}, ...],
+         "default": {"signal_level": "watch", "recommendation": "..."}}
+        """
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        rules = {(rule['demand'], rule['price']): (rule['signal_level'], rule['recommendation'])
+                 for rule in config.get('rules', [])}
+        default = config.get('default')
+        fallback = (default['signal_level'], default['recommendation']) if default else DEFAULT_FALLBACK
+        return cls(rules, fallback)
+
+    def lookup(self, demand_directions: np.ndarray, price_directions: np.ndarray) -> np.ndarray:
+        """
+        Position of the matching rule for every direction pair, the fallback's where none matches
+        """
+        if not self.rules:
+            return np.full(len(demand_directions), len(self.levels) - 1)
+        positions = self.index.get_indexer(pd.MultiIndex.from_arrays([demand_directions, price_directions]))
+        return np.where(positions < 0, len(self.levels) - 1, positions)
+
+# Set AGRIS_GAP_RULES to a JSON rule table to replace the built-in rules
+RULES_PATH = os.environ.get("AGRIS_GAP_RULES")
+RULES = RuleTable.from_file(RULES_PATH) if RULES_PATH else RuleTable()
+
+def price_direction_from_label(label: str) -> str:
+    # Extract trend direction from price signal
+    if 'up' in label.lower():
+        return "up"
+    elif 'down' in label.lower():
+        return "down"
+    return "stable"
+
+def _signal_frame(signals: List[Dict], columns: List[str]) -> pd.DataFrame:
+    frame = pd.DataFrame.from_records(signals, columns=columns) if signals else pd.DataFrame(columns=columns)
+    # A product listed twice keeps its last signal
+    return frame.drop_duplicates('product', keep='last')
+
+def _gap_columns(demand_signals: List[Dict], price_signals: List[Dict], rules: Optional[RuleTable]) -> Dict[str, np.ndarray]:
+    """
+    Join demand and price signals on product and classify every product through the rule table
+    One entry per product, sorted by product
+    """
+    rules = RULES if rules is None else rules
+    demand = _signal_frame(demand_signals, ['product', 'direction', 'signal'])
+    price = _signal_frame(price_signals, ['product', 'trend_label', 'signal'])
+    joined = demand.merge(price, on='product', how='outer', suffixes=('_demand', '_price'), sort=True)
+
+    demand_direction = joined['direction'].fillna("stable").to_numpy(dtype=object)
+    # Directions are resolved once per distinct trend label, not once per product
+    labels = joined['trend_label'].fillna("")
+    price_direction = labels.map({label: price_direction_from_label(label) for label in labels.unique()})
+    price_direction = price_direction.to_numpy(dtype=object)
+
+    positions = rules.lookup(demand_direction, price_direction)
+    levels = rules.levels[positions]
+    colors = pd.Series(levels).map(SIGNAL_COLORS).fillna(SIGNAL_COLORS[SignalLevel.WATCH.value]).to_numpy(dtype=object)
+    products = joined['product'].to_numpy(dtype=object)
+
+    return {
+        'product': products,
+        'demand_direction': demand_direction,
+        'price_direction': price_direction,
+        'signal_level': levels,
+        'signal_color': colors,
+        'combined_signal': colors + " " + products,
+        'demand_signal': joined['signal_demand'].fillna("No demand data").to_numpy(dtype=object),
+        'price_signal': joined['signal_price'].fillna("No price data").to_numpy(dtype=object),
+        'recommendation': rules.recommendations[positions]
+    }
+
+@timed
+def gap_frame(demand_signals: List[Dict], price_signals: List[Dict], rules: Optional[RuleTable] = None) -> pd.DataFrame:
+    """
+    Gap classification of every product as a frame, sorted by product
+    """
+    return pd.DataFrame(_gap_columns(demand_signals, price_signals, rules))
+
+@timed
+def analyze_supply_demand_gap(demand_signals: List[Dict], price_signals: List[Dict],
+                              rules: Optional[RuleTable] = None) -> List[Dict]:
     """
     Analyze the gap between supply and demand by combining demand and price signals
     """
-    # Create a mapping of products to their signals
-    demand_map = {signal['product']: signal for signal in demand_signals}
-    price_map = {signal['product']: signal for signal in price_signals}
-    
-    # Get all unique products
-    all_products = set(demand_map.keys()) | set(price_map.keys())
-    
-    gap_analysis = []
-    
-    for product in all_products:
-        demand_signal = demand_map.get(product)
-        price_signal = price_map.get(product)
-        
-        # Determine demand trend
-        demand_direction = "stable"
-        if demand_signal:
-            demand_direction = demand_signal.get('direction', 'stable')
-        
-        # Determine price trend
-        price_direction = "stable"
-        if price_signal:
-            # Extract trend direction from price signal
-            if 'up' in price_signal.get('trend_label', '').lower():
-                price_direction = "up"
-            elif 'down' in price_signal.get('trend_label', '').lower():
-                price_direction = "down"
-        
-        # Determine signal level based on combination of demand and price trends
-        signal_level = SignalLevel.WATCH  # Default to watch
-        signal_color = "🟡"
-        
-        # Define rules for signal levels
-        if demand_direction == "up" and price_direction == "up":
-            # High demand + rising price = Opportunity
-            signal_level = SignalLevel.OPPORTUNITY
-            signal_color = "🟢"
-        elif demand_direction == "down" and price_direction == "down":
-            # Falling demand + falling price = Risk
-            signal_level = SignalLevel.RISK
-            signal_color = "🔴"
-        elif demand_direction == "up" and price_direction == "down":
-            # Rising demand + falling price = Opportunity (buy low, demand high)
-            signal_level = SignalLevel.OPPORTUNITY
-            signal_color = "🟢"
-        elif demand_direction == "down" and price_direction == "up":
-            # Falling demand + rising price = Risk (high price, low demand)
-            signal_level = SignalLevel.RISK
-            signal_color = "🔴"
-        
-        # Create a combined signal
-        gap_signal = {
-            'product': product,
-            'demand_direction': demand_direction,
-            'price_direction': price_direction,
-            'signal_level': signal_level.value,
-            'signal_color': signal_color,
-            'combined_signal': f"{signal_color} {product}",
-            'demand_signal': demand_signal['signal'] if demand_signal else "No demand data",
-            'price_signal': price_signal['signal'] if price_signal else "No price data",
-            'recommendation': get_recommendation_for_signal(signal_level, demand_direction, price_direction)
-        }
-        
-        gap_analysis.append(gap_signal)
-    
-    return gap_analysis
+    if not demand_signals and not price_signals:
+        return []
+    columns = _gap_columns(demand_signals, price_signals, rules)
+    # Records are zipped from the column arrays; a DataFrame round trip would box every value
+    keys = list(columns)
+    return [dict(zip(keys, row)) for row in zip(*(columns[key].tolist() for key in keys))]
 
 def get_recommendation_for_signal(signal_level: SignalLevel, demand_direction: str, price_direction: str) -> str:
     """
     Generate a recommendation based on the signal level and directions
     """
-    if signal_level == SignalLevel.OPPORTUNITY:
-        if demand_direction == "up" and price_direction == "up":
-            return "HOLD / PROCURE - High demand with rising prices"
-        elif demand_direction == "up" and price_direction == "down":
-            return "BUY & STORE - High demand but prices still falling"
-    elif signal_level == SignalLevel.RISK:
-        if demand_direction == "down" and price_direction == "down":
-            return "SELL FAST - Falling demand and prices"
-        elif demand_direction == "down" and price_direction == "up":
-            return "AVOID BUYING - Low demand but high prices"
-    else:  # WATCH
-        return "MONITOR - Mixed signals, proceed with caution"
-    
-    return "No clear recommendation"
+    level, recommendation = RULES.rules.get((demand_direction, price_direction), RULES.fallback)
+    if level != signal_level.value:
+        return "No clear recommendation"
+    return recommendation
+
+def summary_from_counts(counts: Dict[str, int], total_products: int) -> Dict:
+    def percentage(level: str) -> float:
+        return round(counts.get(level, 0) / total_products * 100, 2) if total_products > 0 else 0
 
+    return {
+        'total_products': total_products,
+        'opportunities': int(counts.get('opportunity', 0)),
+        'watches': int(counts.get('watch', 0)),
+        'risks': int(counts.get('risk', 0)),
+        'opportunity_percentage': percentage('opportunity'),
+        'watch_percentage': percentage('watch'),
+        'risk_percentage': percentage('risk')
+    }
+
+@timed
 def get_gap_summary(gap_analysis: List[Dict]) -> Dict:
     """
-    Get a summary of the gap analysis
+    Get a summary of the gap analysis, counting all signal levels in one pass
     """
-    total_products = len(gap_analysis)
-    
-    opportunities = [item for item in gap_analysis if item['signal_level'] == 'opportunity']
-    watches = [item for item in gap_analysis if item['signal_level'] == 'watch']
-    risks = [item for item in gap_analysis if item['signal_level'] == 'risk']
-    
-    summary = {
-        'total_products': total_products,
-        'opportunities': len(opportunities),
-        'watches': len(watches),
-        'risks': len(risks),
-        'opportunity_percentage': round(len(opportunities) / total_products * 100, 2) if total_products > 0 else 0,
-        'watch_percentage': round(len(watches) / total_products * 100, 2) if total_products > 0 else 0,
-        'risk_percentage': round(len(risks) / total_products * 100, 2) if total_products > 0 else 0
-    }
-    
-    return summary
\ No newline at end of file
+    return summary_from_counts(Counter(item['signal_level'] for item in gap_analysis), len(gap_analysis))
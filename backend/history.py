@@ -0,0 +1,195 @@
+import math
+import numpy as np
+from collections import Counter
+from typing import Dict, List, Optional
+from instrumentation import timed
+from cube import ProductDayCube, row_blocks
+from gap_analyzer import RULES, RuleTable, summary_from_counts
+from price_engine import TREND_SLOPE
+from scenarios import DEMAND_DIRECTIONS, NO_PRICE, PRICE_LABELS, STABLE_DEMAND, demand_change, rule_grid
+
+# Demand code of products without demand data on a day
+NO_DEMAND = -1
+
+class SignalHistory:
+    """
+    Demand, price and gap signals of every product on every day of the cube, as (product x day)
+    columns: the demand change and price slope and current price as float32, the demand and price
+    codes as int8. Day t holds what the live analysis reports when the data ends at day t
+    Products are in name order; a product's row and a date's column are found by lookup, so
+    a product's series or one day's signals are slices, not recomputations
+    """
+
+    def __init__(self, products: np.ndarray, start: np.datetime64, n_days: int):
+        self.products = products
+        self.rows = {product: i for i, product in enumerate(products.tolist())}
+        self.start = start
+        self.n_days = n_days
+        shape = (len(products), n_days)
+        self.change = np.full(shape, np.nan, dtype=np.float32)
+        self.slope = np.full(shape, np.nan, dtype=np.float32)
+        self.current_price = np.full(shape, np.nan, dtype=np.float32)
+        self.demand = np.full(shape, NO_DEMAND, dtype=np.int8)
+        self.price = np.full(shape, NO_PRICE, dtype=np.int8)
+
+    @classmethod
+    @timed
+    def build(cls, cube: ProductDayCube, period_days: int) -> "SignalHistory":
+        """
+        Signals of every day in one pass over the cube: running sums along the day axis give
+        each day's demand windows and price regression without refitting per day
+        """
+        with cube.lock:
+            rows = cube.sorted_rows()
+            n_days = max(cube.retail_last, cube.mandi_last) + 1
+            history = cls(np.array(cube.names, dtype=object)[rows], cube.start, n_days)
+            if not len(rows) or n_days <= 0:
+                return history
+            day = np.arange(n_days)
+            # The live demand windows end at the latest day with any sales, not at the requested day
+            with_sales = cube.has_sales[:, :n_days].any(axis=0)
+            anchor = np.maximum.accumulate(np.where(with_sales, day, -1))
+            for block in row_blocks(len(rows), n_days):
+                selected = rows[block]
+                history._demand(block, cube.quantity[selected, :n_days], cube.has_sales[selected, :n_days],
+                                anchor, period_days)
+                history._price(block, cube.price[selected, :n_days], cube.has_price[selected, :n_days])
+        return history
+
+    def _demand(self, block: slice, quantity: np.ndarray, has_sales: np.ndarray, anchor: np.ndarray,
+                period_days: int):
+        # Running totals with a leading zero column: the sum of days first..last is cum[last + 1] - cum[first]
+        cum = np.concatenate([np.zeros((len(quantity), 1)), np.cumsum(quantity, axis=1)], axis=1)
+        counts = np.concatenate([np.zeros((len(quantity), 1), dtype=np.int64), np.cumsum(has_sales, axis=1)], axis=1)
+        known = anchor >= 0
+        last = np.where(known, anchor, 0)
+
+        def total(grid: np.ndarray, first: np.ndarray, end: np.ndarray) -> np.ndarray:
+            # Days first..end inclusive, clipped to day 0 as day_slice_sum clips them
+            stop = np.maximum(end + 1, 0)
+            return grid[:, stop] - grid[:, np.minimum(np.maximum(first, 0), stop)]
+
+        current = total(cum, last - period_days, last)
+        previous = total(cum, last - 2 * period_days, last - period_days)
+        present = known & (total(counts, last - 2 * period_days, last) > 0)
+
+        change = demand_change(current, previous)
+        codes = np.where(change > 0, 0, np.where(change < 0, 1, STABLE_DEMAND))
+        self.change[block] = np.where(present, np.round(change, 2), np.nan)
+        self.demand[block] = np.where(present, codes, NO_DEMAND)
+
+    def _price(self, block: slice, prices: np.ndarray, observed: np.ndarray):
+        # Regression sums over the days up to each day, x counted from each product's first quote
+        day = np.arange(prices.shape[1], dtype=np.float64)
+        first = observed.argmax(axis=1)
+        x = np.where(observed, day - first[:, None], 0.0)
+        y = np.where(observed, prices, 0.0)
+        n = np.cumsum(observed, axis=1)
+        sum_x = np.cumsum(x, axis=1)
+        sum_y = np.cumsum(y, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sxx = np.cumsum(x * x, axis=1) - sum_x * sum_x / n
+            sxy = np.cumsum(x * y, axis=1) - sum_x * sum_y / n
+            slope = np.where(sxx > 0, sxy / sxx, 0.0)
+        latest = np.maximum.accumulate(np.where(observed, day.astype(np.int64), -1), axis=1)
+        current_price = np.round(np.take_along_axis(prices, np.maximum(latest, 0), axis=1), 2)
+
+        # Need at least 3 data points for trend, as price_trends_from_stats
+        trended = n >= 3
+        codes = np.where(slope > TREND_SLOPE, 0, np.where(slope < -TREND_SLOPE, 1, 2))
+        self.slope[block] = np.where(trended, slope, np.nan)
+        self.current_price[block] = np.where(trended, current_price, np.nan)
+        self.price[block] = np.where(trended, codes, NO_PRICE)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def day_of(self, date: str) -> int:
+        return int((np.datetime64(date, 'D') - self.start).astype(np.int64))
+
+    def date_of(self, day: int) -> str:
+        return str(self.start + np.timedelta64(int(day), 'D'))
+
+    @property
+    def last_date(self) -> Optional[str]:
+        return self.date_of(self.n_days - 1) if self.n_days > 0 else None
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.change, self.slope, self.current_price, self.demand, self.price))
+
+    def stats(self) -> Dict:
+        return {
+            'products': len(self.products),
+            'days': self.n_days,
+            'start': str(self.start),
+            'mb': round(self.nbytes / 1024 / 1024, 2)
+        }
+
+    def records(self, rows: np.ndarray, days: np.ndarray, rules: Optional[RuleTable] = None) -> List[Dict]:
+        """
+        Gap records of (product row, day) cells, skipping cells where a product has neither
+        demand nor price data
+        """
+        rules = RULES if rules is None else rules
+        demand = self.demand[rows, days]
+        price = self.price[rows, days]
+        present = (demand != NO_DEMAND) | (price != NO_PRICE)
+        rows, days, demand, price = rows[present], days[present], demand[present], price[present]
+        positions = rule_grid(rules)[np.where(demand == NO_DEMAND, STABLE_DEMAND, demand), price]
+        levels = rules.levels[positions]
+        change = self.change[rows, days].astype(np.float64).tolist()
+        slope = self.slope[rows, days].astype(np.float64).tolist()
+        current_price = self.current_price[rows, days].astype(np.float64).tolist()
+
+        levels, recommendations = levels.tolist(), rules.recommendations[positions].tolist()
+        demand, price = demand.tolist(), price.tolist()
+
+        records = []
+        for i, (row, day) in enumerate(zip(rows.tolist(), days.tolist())):
+            has_demand, has_price = demand[i] != NO_DEMAND, price[i] != NO_PRICE
+            records.append({
+                'product': self.products[row],
+                'date': self.date_of(day),
+                'demand_direction': DEMAND_DIRECTIONS[demand[i]] if has_demand else None,
+                # float32 columns are rounded back to the precision the live signals report
+                'demand_change_percentage': round(change[i], 2) if has_demand and math.isfinite(change[i]) else None,
+                'price_trend': PRICE_LABELS[price[i]],
+                'price_slope': round(slope[i], 4) if has_price else None,
+                'current_price': round(current_price[i], 2) if has_price else None,
+                'signal_level': levels[i],
+                'recommendation': recommendations[i]
+            })
+        return records
+
+    @timed
+    def product_series(self, product: str, first: Optional[str] = None, last: Optional[str] = None) -> Dict:
+        """
+        One product's signals on every day from first to last inclusive (the whole history by default)
+        """
+        row = self.rows.get(product)
+        start = 0 if first is None else max(self.day_of(first), 0)
+        end = self.n_days - 1 if last is None else min(self.day_of(last), self.n_days - 1)
+        days = np.arange(start, end + 1) if row is not None else np.zeros(0, dtype=np.int64)
+        history = self.records(np.full(len(days), row if row is not None else 0), days)
+        return {'product': product, 'history': history, 'count': len(history)}
+
+    @timed
+    def as_of(self, date: str, product: Optional[str] = None) -> Dict:
+        """
+        Signals of every product, or one, as the live analysis reported them on a date
+        Dates after the latest day are answered with the latest day
+        """
+        day = min(self.day_of(date), self.n_days - 1)
+        if product is None:
+            rows = np.arange(len(self.products))
+        else:
+            rows = np.array([self.rows[product]] if product in self.rows else [], dtype=np.int64)
+        signals = self.records(rows, np.full(len(rows), day)) if day >= 0 else []
+        counts = Counter(signal['signal_level'] for signal in signals)
+        return {
+            'as_of': self.date_of(day) if day >= 0 else date,
+            'signals': signals,
+            'summary': summary_from_counts(counts, len(signals)),
+            'count': len(signals)
+        }
@@ -0,0 +1,88 @@
+import os
+import time
+import pandas as pd
+from instrumentation import timed
+from frames import frame_mb, plain_frame_mb
+from schema import Schema, sniff_csv
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Number of CSV rows parsed and preprocessed at a time
+CHUNK_ROWS = int(os.environ.get("AGRIS_CHUNK_ROWS", "250000"))
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident set size of this process in MB, if the platform reports it
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+@timed
+def ingest_csv(source: BinaryIO,
+               preprocess: Callable[[pd.DataFrame], pd.DataFrame],
+               combine: Callable[[List[pd.DataFrame]], pd.DataFrame],
+               chunk_rows: int = CHUNK_ROWS,
+               keep_raw: bool = True,
+               progress: Optional[Callable[[int, int], None]] = None,
+               schema: Optional[Schema] = None) -> Dict:
+    """
+    Parse a CSV file object in chunks, preprocessing each chunk and merging the partial
+    (date, product) aggregates at the end
+    Only one raw chunk is held in memory at a time unless keep_raw is set
+    preprocess and combine are the engine's functions; chunks that are not kept are handed
+    to preprocess with copy=False
+    progress, if given, is called with the rows and chunks parsed so far after every chunk
+    With a schema, the header and a sample of the file are resolved before parsing; unless
+    raw rows are kept, only the columns the engine uses are read, with explicit dtypes and
+    the date format pinned from the sample
+    """
+    start = time.perf_counter()
+
+    options = {}
+    if schema is not None:
+        header, sample = sniff_csv(source)
+        if header:
+            options = schema.read_options(schema.resolve_sample(header, sample), keep_raw)
+
+    partials = []
+    raw_chunks = []
+    columns = []
+    rows = 0
+    chunks = 0
+
+    for chunk in pd.read_csv(source, chunksize=chunk_rows, encoding="utf-8", **options):
+        if chunks == 0:
+            columns = list(chunk.columns)
+        rows += len(chunk)
+        chunks += 1
+        partials.append(preprocess(chunk, copy=keep_raw))
+        if keep_raw:
+            raw_chunks.append(chunk)
+        if progress is not None:
+            progress(rows, chunks)
+
+    processed = combine(partials) if partials else preprocess(pd.DataFrame(columns=columns))
+    raw = None
+    if keep_raw:
+        raw = pd.concat(raw_chunks, ignore_index=True) if raw_chunks else pd.DataFrame(columns=columns)
+
+    elapsed = time.perf_counter() - start
+
+    return {
+        'raw': raw,
+        'processed': processed,
+        'rows': rows,
+        'columns': columns,
+        'chunks': chunks,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(rows / elapsed, 1) if elapsed > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'processed_mb': frame_mb(processed),
+        'processed_plain_mb': plain_frame_mb(processed)
+    }
@@ -0,0 +1,178 @@
+import cProfile
+import contextvars
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+# Set AGRIS_INSTRUMENTATION=0 to turn stage timing off; the decorators then add one flag check
+ENABLED = os.environ.get("AGRIS_INSTRUMENTATION", "1") != "0"
+
+# Number of functions listed in a ?profile=1 summary
+PROFILE_LINES = 30
+
+# Stage timings of the request being served, if any
+_request = contextvars.ContextVar("agris_request", default=None)
+
+_lock = threading.Lock()
+_stages = {}    # name -> [calls, seconds, rows]
+_requests = {}  # (method, path, status) -> [count, seconds]
+
+def _record_stage(name: str, seconds: float, rows: Optional[int]):
+    with _lock:
+        entry = _stages.setdefault(name, [0, 0.0, 0])
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] += rows or 0
+    request = _request.get()
+    if request is not None:
+        request['stages'].append((name, seconds, rows))
+
+def _row_count(value) -> Optional[int]:
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+@contextmanager
+def stage(name: str, rows: Optional[int] = None):
+    """
+    Time a block of code as a named pipeline stage
+    """
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_stage(name, time.perf_counter() - start, rows)
+
+def timed(fn: Callable) -> Callable:
+    """
+    Record the duration and input row count of every call to an engine function
+    """
+    name = f"{fn.__module__}.{fn.__name__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _record_stage(name, time.perf_counter() - start, _row_count(args[0]) if args else None)
+
+    return wrapper
+
+def begin_request(profile: bool = False) -> Dict:
+    """
+    Start collecting stage timings (and optionally a profile) for the current request
+    """
+    request = {'stages': [], 'profile': profile, 'profile_text': None}
+    _request.set(request)
+    return request
+
+def profiling_requested() -> bool:
+    request = _request.get()
+    return request is not None and request['profile']
+
+def profile_call(fn: Callable):
+    """
+    Run fn under cProfile when the current request asked for ?profile=1
+    The profile has to be taken in the thread doing the work, not in the middleware
+    """
+    request = _request.get()
+    if request is None or not request['profile']:
+        return fn()
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return fn()
+    finally:
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        request['profile_text'] = out.getvalue()
+
+def record_request(method: str, path: str, status: int, seconds: float):
+    with _lock:
+        entry = _requests.setdefault((method, path, status), [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+def stage_summary(request: Dict) -> List[Dict]:
+    """
+    Stage timings of a request, summed per stage name in order of first occurrence
+    """
+    totals = {}
+    for name, seconds, rows in request['stages']:
+        entry = totals.setdefault(name, {'stage': name, 'calls': 0, 'ms': 0.0, 'rows': 0})
+        entry['calls'] += 1
+        entry['ms'] += seconds * 1000
+        entry['rows'] += rows or 0
+    for entry in totals.values():
+        entry['ms'] = round(entry['ms'], 3)
+    return list(totals.values())
+
+def server_timing_header(request: Dict, total_seconds: float) -> str:
+    """
+    Server-Timing header value listing every stage of the request and the total
+    """
+    parts = [f'{entry["stage"]};dur={entry["ms"]}' for entry in stage_summary(request)]
+    parts.append(f"total;dur={round(total_seconds * 1000, 3)}")
+    return ", ".join(parts)
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prometheus_metrics(extra: Optional[Dict[str, float]] = None) -> str:
+    """
+    All collected metrics in the Prometheus text exposition format
+    """
+    with _lock:
+        stages = {name: list(values) for name, values in _stages.items()}
+        requests = {key: list(values) for key, values in _requests.items()}
+
+    lines = [
+        "# HELP agris_stage_calls_total Number of calls per pipeline stage",
+        "# TYPE agris_stage_calls_total counter"
+    ]
+    lines += [f'agris_stage_calls_total{{stage="{_label(name)}"}} {calls}' for name, (calls, _, _) in stages.items()]
+    lines += [
+        "# HELP agris_stage_seconds_total Time spent per pipeline stage",
+        "# TYPE agris_stage_seconds_total counter"
+    ]
+    lines += [f'agris_stage_seconds_total{{stage="{_label(name)}"}} {seconds:.6f}' for name, (_, seconds, _) in stages.items()]
+    lines += [
+        "# HELP agris_stage_rows_total Input rows processed per pipeline stage",
+        "# TYPE agris_stage_rows_total counter"
+    ]
+    lines += [f'agris_stage_rows_total{{stage="{_label(name)}"}} {rows}' for name, (_, _, rows) in stages.items()]
+    lines += [
+        "# HELP agris_http_requests_total HTTP requests served",
+        "# TYPE agris_http_requests_total counter"
+    ]
+    lines += [
+        f'agris_http_requests_total{{method="{method}",path="{_label(path)}",status="{status}"}} {count}'
+        for (method, path, status), (count, _) in requests.items()
+    ]
+    lines += [
+        "# HELP agris_http_request_seconds_total Time spent serving HTTP requests",
+        "# TYPE agris_http_request_seconds_total counter"
+    ]
+    lines += [
+        f'agris_http_request_seconds_total{{method="{method}",path="{_label(path)}",status="{status}"}} {seconds:.6f}'
+        for (method, path, status), (_, seconds) in requests.items()
+    ]
+    for name, value in (extra or {}).items():
+        metric_type = "counter" if name.endswith("_total") else "gauge"
+        lines += [f"# TYPE {name} {metric_type}", f"{name} {value}"]
+
+    return "\n".join(lines) + "\n"
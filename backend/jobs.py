@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+# Finished jobs kept for polling; the oldest are forgotten first
+MAX_FINISHED_JOBS = int(os.environ.get("AGRIS_MAX_JOBS", "100"))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job when cancellation was requested
+    """
+    pass
+
+class Job:
+    """
+    A unit of background work with progress that can be polled while it runs
+    """
+
+    def __init__(self, kind: str, params: Optional[Dict] = None, on_finish: Optional[Callable[[], None]] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.status = QUEUED
+        self.stage = None
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Bumped on every change so subscribers can tell when to send an update
+        self.revision = 0
+        self.future = None
+        # Cleanup of the resources the job holds, run once however the job ends, even if it never starts
+        self.on_finish = on_finish
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def _update(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.revision += 1
+
+    def set_stage(self, stage: str, cancellable: bool = True):
+        """
+        Move to the next stage; stages that must run to completion once started
+        (e.g. after the data was replaced) pass cancellable=False
+        """
+        if cancellable:
+            self.check_cancelled()
+        self._update(stage=stage)
+
+    def report(self, **progress):
+        """
+        Record progress counters (e.g. rows parsed) and stop here if the job was cancelled
+        """
+        self.check_cancelled()
+        with self._lock:
+            self.progress = {**self.progress, **progress}
+            self.revision += 1
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "params": self.params,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": dict(self.progress),
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "revision": self.revision
+            }
+
+class JobRegistry:
+    """
+    All jobs by id; runs job functions and records how they ended
+    """
+
+    def __init__(self, max_finished: int = MAX_FINISHED_JOBS):
+        self.max_finished = max_finished
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, kind: str, params: Optional[Dict] = None, on_finish: Optional[Callable[[], None]] = None) -> Job:
+        job = Job(kind, params, on_finish)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        return job
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job_id]
+
+    def _release(self, job: Job):
+        with job._lock:
+            on_finish, job.on_finish = job.on_finish, None
+        if on_finish is not None:
+            on_finish()
+
+    def discard(self, job: Job):
+        """
+        Forget a job that was never submitted, releasing what it holds
+        """
+        with self._lock:
+            self._jobs.pop(job.id, None)
+        self._release(job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def execute(self, job: Job, fn: Callable, *args):
+        """
+        Run fn(job, *args) as the body of the job; meant to be called on a worker thread
+        """
+        try:
+            if job.cancel_requested:
+                job._update(status=CANCELLED, finished_at=time.time())
+                return
+            job._update(status=RUNNING, started_at=time.time())
+            result = fn(job, *args)
+            job._update(status=SUCCEEDED, stage="done", result=result, finished_at=time.time())
+        except JobCancelled:
+            job._update(status=CANCELLED, finished_at=time.time())
+        except Exception as e:
+            job._update(status=FAILED, error=str(getattr(e, "detail", e)), finished_at=time.time())
+        finally:
+            self._release(job)
+            with self._lock:
+                self._trim()
+
+    def cancel(self, job: Job) -> bool:
+        """
+        Request cancellation; a queued job never starts and a running one stops at its
+        next progress report. Returns False if the job had already finished
+        """
+        if job.finished:
+            return False
+        job._cancel.set()
+        if job.future is not None and job.future.cancel():
+            # execute never runs, so the job's resources are released here
+            job._update(status=CANCELLED, finished_at=time.time())
+            self._release(job)
+        return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in (QUEUED, RUNNING) + FINISHED}
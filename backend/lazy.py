@@ -0,0 +1,26 @@
+import importlib
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access
+    Keeps pandas, numpy and the engines off the import path of the API process, so the
+    server starts, and answers health checks, before any of them are loaded
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr: str):
+        # Only reached for names the stand-in itself does not have, i.e. those of the module
+        if self._module is None:
+            # import_module holds the import lock, so concurrent first uses import once
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy module '{self._name}'{' (loaded)' if self.loaded else ''}>"
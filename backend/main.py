@@ -1,15 +1,50 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from __future__ import annotations
+
+import os
+import threading
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-import pandas as pd
-import io
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+import asyncio
+import hashlib
 import json
-from typing import Optional
+import shutil
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import date
+from functools import partial
+from typing import TYPE_CHECKING, BinaryIO, Callable, List, Optional, Union
+
+# Import our modules; the engines (and with them pandas and numpy) load on first use
+from lazy import LazyModule
+from settings import DEFAULT_DATASET, DATASET_NAME, MAX_TOP_K, MAX_HORIZON, DEFAULT_MODEL, MAX_SCENARIOS
+from cache import etag_matches
+from alerts import AlertFeed
+from instrumentation import (
+    begin_request, record_request, server_timing_header, stage_summary, prometheus_metrics,
+    profile_call, profiling_requested, stage
+)
+from concurrency import JOB_THREADS, MAX_QUEUED_JOBS, PoolSaturated, SingleFlight, WorkPool
+from jobs import FINISHED, Job, JobCancelled, JobRegistry
 
-# Import our modules
-from demand_engine import preprocess_retail_data, get_demand_signals
-from price_engine import preprocess_mandi_data, get_price_signals
-from gap_analyzer import analyze_supply_demand_gap, get_gap_summary
-from recommendation_engine import generate_alerts_and_recommendations, get_actionable_insights
+if TYPE_CHECKING:
+    import pandas as pd
+    from datasets import Dataset, DatasetRegistry
+
+demand_engine = LazyModule("demand_engine")
+price_engine = LazyModule("price_engine")
+gap_analyzer = LazyModule("gap_analyzer")
+ranking = LazyModule("ranking")
+forecasting = LazyModule("forecasting")
+ingestion = LazyModule("ingestion")
+pagination = LazyModule("pagination")
+parallel = LazyModule("parallel")
+namespaces = LazyModule("datasets")
+encoding = LazyModule("encoding")
 
 app = FastAPI(title="Agris Intelligence Layer API")
 
@@ -20,111 +55,858 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browser clients check the layout version of analysis responses
+    expose_headers=["X-Schema-Version"],
 )
 
-# In-memory storage for demo purposes
-retail_data = None
-mandi_data = None
-processed_retail_data = None
-processed_mandi_data = None
+UPLOAD_MODES = ("replace", "append")
+
+# Longest demand window and week-over-week series served; the product x day matrix grows with them
+MAX_WINDOW_DAYS = 366
+MAX_WEEKS = 104
+
+# Named dataset namespaces, created on first use; routes without a /datasets/{dataset} prefix use the default one
+_datasets = None
+_datasets_lock = threading.Lock()
+
+# Set AGRIS_PRELOAD=1 to restore persisted data in the background right after startup
+# instead of on the first request that needs it
+PRELOAD = os.environ.get("AGRIS_PRELOAD", "0") == "1"
+
+# CPU-heavy handler work runs here instead of on the event loop; full pool answers 429
+work_pool = WorkPool()
+single_flight = SingleFlight()
+
+# Background jobs run on their own threads, so a few long ones cannot hold up interactive reads
+job_pool = WorkPool(JOB_THREADS, MAX_QUEUED_JOBS)
+
+# Background uploads and analyses, polled through /jobs
+jobs = JobRegistry()
+
+# Products per ranking returned by /analysis/recommendations when k is not given
+DEFAULT_TOP_K = 3
+
+# Analyses a job can precompute, by cache name
+ANALYSES = ("demand", "price", "gap", "recommendations")
+
+# Seconds between state checks, and between keep-alive comments, of job and alert event streams
+EVENT_STREAM_INTERVAL = 0.25
+EVENT_STREAM_KEEPALIVE = 15
+
+def route_path(request: Request) -> str:
+    """
+    Path template of the matched route, so metrics are not labelled per product or id
+    """
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    timings = begin_request(profile=request.query_params.get("profile") == "1")
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    record_request(request.method, route_path(request), response.status_code, elapsed)
+    
+    if timings['profile_text'] is not None:
+        return JSONResponse(content={
+            "path": request.url.path,
+            "status_code": response.status_code,
+            "total_ms": round(elapsed * 1000, 3),
+            "stages": stage_summary(timings),
+            "profile": timings['profile_text'].splitlines()
+        })
+    
+    response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
+@app.exception_handler(PoolSaturated)
+async def pool_saturated(request: Request, exc: PoolSaturated):
+    return JSONResponse(status_code=429, content={"detail": "Server busy, retry later"},
+                        headers={"Retry-After": "1"})
+
+def get_datasets() -> DatasetRegistry:
+    """
+    The namespace registry, created on first use by restoring the default namespace from the
+    columnar store, so a restart does not need a re-upload. Other persisted namespaces are
+    registered and loaded on first use
+    Raw rows are not persisted, only the processed frames and the aggregates derived from them
+    """
+    global _datasets
+    if _datasets is None:
+        with _datasets_lock:
+            if _datasets is None:
+                registry = namespaces.DatasetRegistry()
+                registry.discover()
+                registry.enforce_limit()
+                _datasets = registry
+    return _datasets
+
+@app.on_event("startup")
+def start_preload():
+    # Startup itself imports nothing heavy, so health checks pass while data loads
+    if PRELOAD:
+        threading.Thread(target=get_datasets, name="agris-preload", daemon=True).start()
+
+@app.on_event("shutdown")
+def stop_workers():
+    work_pool.shutdown()
+    job_pool.shutdown()
+    if parallel.loaded:
+        parallel.shutdown_pool()
 
 @app.get("/")
 def read_root():
     return {"message": "Agris Intelligence Layer API", "status": "running"}
 
-@app.post("/upload/retail")
-async def upload_retail_data(file: UploadFile = File(...)):
-    global retail_data, processed_retail_data
+def check_upload_mode(mode: str):
+    if mode not in UPLOAD_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid mode '{mode}', expected one of {list(UPLOAD_MODES)}")
+
+def check_dataset_name(name: str):
+    if not DATASET_NAME.match(name):
+        raise HTTPException(status_code=400, detail=f"Invalid dataset name '{name}', expected up to 64 letters, digits, '_' or '-'")
+
+def parse_windows(windows: str) -> List[int]:
     try:
-        contents = await file.read()
-        df = pd.read_csv(io.StringIO(contents.decode("utf-8")))
-        retail_data = df
-        processed_retail_data = preprocess_retail_data(df)
-        return {"filename": file.filename, "rows": len(df), "columns": list(df.columns), "processed": True}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error processing file: {str(e)}")
+        days = sorted({int(value) for value in windows.split(",") if value.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid windows '{windows}', expected comma separated days")
+    if not days or days[0] < 1 or days[-1] > MAX_WINDOW_DAYS:
+        raise HTTPException(status_code=400, detail=f"Windows must be between 1 and {MAX_WINDOW_DAYS} days")
+    return days
+
+def check_models(models: List[str]):
+    unknown = [model for model in models if model not in forecasting.MODELS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown models {unknown}, expected some of {list(forecasting.MODELS)}")
+
+# Fields of a what-if scenario and their defaults
+SCENARIO_FIELDS = {"name": None, "products": None, "demand_change": 0, "price_model": None, "price_change": 0,
+                   "horizon": 7}
+
+def parse_scenarios(body) -> List[dict]:
+    """
+    Validated what-if specs of a scenarios request body, with defaults filled in:
+    {"scenarios": [{"name": "...", "products": ["..."], "demand_change": 10, "price_model": "linear",
+                    "price_change": -5, "horizon": 7}, ...]}
+    """
+    scenarios = body.get("scenarios") if isinstance(body, dict) else None
+    if not isinstance(scenarios, list) or not 1 <= len(scenarios) <= MAX_SCENARIOS:
+        raise HTTPException(status_code=400, detail=f"Expected a 'scenarios' list of 1 to {MAX_SCENARIOS} specs")
+    specs = []
+    for i, scenario in enumerate(scenarios):
+        if not isinstance(scenario, dict):
+            raise HTTPException(status_code=400, detail=f"Scenario {i} must be an object")
+        unknown = sorted(set(scenario) - set(SCENARIO_FIELDS))
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown scenario fields {unknown}, expected some of {list(SCENARIO_FIELDS)}")
+        spec = {**SCENARIO_FIELDS, **scenario}
+        spec["name"] = str(spec["name"]) if spec["name"] is not None else f"scenario_{i + 1}"
+        products = spec["products"]
+        if products is not None and not (isinstance(products, list) and all(isinstance(p, str) for p in products)):
+            raise HTTPException(status_code=400, detail=f"Scenario '{spec['name']}': products must be a list of names")
+        for field in ("demand_change", "price_change"):
+            value = spec[field]
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not -100 <= value <= 1000:
+                raise HTTPException(status_code=400, detail=f"Scenario '{spec['name']}': {field} must be a percentage between -100 and 1000")
+        horizon = spec["horizon"]
+        if isinstance(horizon, bool) or not isinstance(horizon, int) or not 1 <= horizon <= MAX_HORIZON:
+            raise HTTPException(status_code=400, detail=f"Scenario '{spec['name']}': horizon must be between 1 and {MAX_HORIZON} days")
+        if spec["price_model"] is not None:
+            check_models([spec["price_model"]])
+        specs.append(spec)
+    return specs
+
+def parse_date(value: Optional[str], name: str) -> Optional[str]:
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} '{value}', expected YYYY-MM-DD")
+
+def parse_names(names: Optional[str]) -> Optional[List[str]]:
+    if names is None:
+        return None
+    return list(dict.fromkeys(name.strip() for name in names.split(",") if name.strip()))
+
+def acquire_dataset(name: str, create: bool = False) -> Dataset:
+    check_dataset_name(name)
+    try:
+        return get_datasets().acquire(name, create)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset {name}")
+
+def load_dataset(dataset: Dataset):
+    """
+    Bring an evicted namespace back from the store, making room for it if needed
+    """
+    dataset.ensure_loaded()
+    get_datasets().enforce_limit()
+
+@asynccontextmanager
+async def open_dataset(name: str):
+    """
+    Use a namespace for the length of a request, so it is not evicted while it is read
+    """
+    if _datasets is None:
+        # The first request after startup restores the persisted data off the event loop
+        await run_in_threadpool(get_datasets)
+    dataset = acquire_dataset(name)
+    try:
+        if dataset.evicted:
+            await work_pool.run(load_dataset, dataset)
+        yield dataset
+    finally:
+        get_datasets().release(dataset)
+
+def read_consistent(dataset: Dataset, fn: Callable, *args):
+    """
+    fn(*args) with the namespace's data held at one version: uploads apply only after it returns
+    """
+    with dataset.update_lock.shared():
+        return fn(*args)
+
+def cache_result(dataset: Dataset, key: tuple, compute: Callable[[], dict]) -> tuple:
+    content = profile_call(compute)
+    with stage("serialize"):
+        body = encoding.dumps(content, default=jsonable_encoder)
+    return dataset.cache.put(key, body)
+
+def cache_variant(dataset: Dataset, key: tuple, base: tuple, fmt: str, compact: bool) -> tuple:
+    """
+    Store another representation of a cached JSON body, built from the body rather than
+    by computing the result again
+    """
+    with stage("serialize"):
+        body = encoding.encode(encoding.loads(base[0]), fmt, compact)
+    return dataset.cache.put(key, body)
+
+def cache_compressed(dataset: Dataset, key: tuple, entry: tuple, coding: str) -> tuple:
+    with stage("compress"):
+        body = encoding.compress(entry[0], coding)
+    return dataset.cache.put(key, body)
+
+async def cached_response(request: Request, dataset: Dataset, name: str, compute: Callable[[], dict],
+                          params: Optional[tuple] = None) -> Response:
+    """
+    Serve an analysis result from the namespace's cache, computing it only once per dataset
+    version and request parameters, and answer 304 when the client already has it
+    The parameters are the query string unless given, e.g. for a request body
+    The computation runs on the work pool, shared by concurrent identical requests, and is
+    cached under the version it read, taken together with the data it is computed from
+    Compact, MessagePack and Arrow representations and the compressed bodies are cached next
+    to the JSON body under their own keys and ETags, derived from it on first request
+    """
+    query = request.query_params
+    try:
+        fmt = encoding.negotiate_format(query.get("format"), request.headers.get("accept"))
+        compact = encoding.parse_flag(query.get("compact"))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if params is None:
+        params = tuple(sorted((k, v) for k, v in query.multi_items() if k not in encoding.PARAMS))
+    base_key = dataset.cache_key(name, params)
+    key = base_key + encoding.variant(fmt, compact)
+    entry = dataset.cache.get(key)
+    
+    def build():
+        # An upload may have applied since the key was made; the result is keyed by the version it read
+        with dataset.update_lock.shared():
+            built_key = dataset.cache_key(name, params)
+            return built_key, cache_result(dataset, built_key, compute)
+    
+    profiling = profiling_requested()
+    if profiling or entry is None:
+        base = None if profiling or key == base_key else dataset.cache.get(base_key)
+        if profiling:
+            base_key, base = await work_pool.run(build)
+        elif base is None:
+            base_key, base = await single_flight.run(base_key, lambda: work_pool.run(build))
+        key = base_key + encoding.variant(fmt, compact)
+        entry = base
+        if key != base_key:
+            try:
+                entry = await single_flight.run(key, lambda: work_pool.run(cache_variant, dataset, key, base, fmt, compact))
+            except ValueError as exc:
+                raise HTTPException(status_code=400, detail=str(exc))
+    
+    coding = encoding.negotiate_encoding(request.headers.get("accept-encoding"))
+    if coding is not None and len(entry[0]) >= encoding.MIN_COMPRESS_BYTES:
+        coded_key = key + (("$encoding", coding),)
+        coded = dataset.cache.get(coded_key)
+        if coded is None:
+            coded = await single_flight.run(coded_key, lambda: work_pool.run(cache_compressed, dataset, coded_key,
+                                                                               entry, coding))
+        entry = coded
+    else:
+        coding = None
+    body, etag = entry
+    
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept, Accept-Encoding",
+               "X-Schema-Version": str(encoding.SCHEMA_VERSION)}
+    if coding is not None:
+        headers["Content-Encoding"] = coding
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        dataset.cache.record_not_modified()
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=encoding.MEDIA_TYPES[fmt], headers=headers)
+
+def upload_report(dataset: Dataset, filename: str, result: dict, mode: str, processed: pd.DataFrame) -> dict:
+    return {"dataset": dataset.name, "filename": filename, "rows": result['rows'], "columns": result['columns'],
+            "processed": True, "mode": mode, "processed_rows": len(processed), "chunks": result['chunks'],
+            "seconds": result['seconds'], "rows_per_sec": result['rows_per_sec'], "peak_rss_mb": result['peak_rss_mb'],
+            "processed_mb": result['processed_mb'], "processed_plain_mb": result['processed_plain_mb']}
+
+def job_progress(job: Optional[Job]) -> Optional[Callable[[int, int], None]]:
+    if job is None:
+        return None
+    return lambda rows, chunks: job.report(rows_parsed=rows, chunks=chunks)
+
+def finish_upload(dataset: Dataset, report: dict, job: Optional[Job]) -> dict:
+    """
+    Background uploads precompute the default analyses before they report success,
+    so the analysis endpoints serve them without computing on demand
+    """
+    if job is not None:
+        job.set_stage("precomputing", cancellable=False)
+        # Shared, so requests read the new data meanwhile
+        with dataset.update_lock.shared():
+            report["precomputed"] = precompute_analyses(dataset)
+    return report
+
+def upload_parsers(kind: str) -> tuple:
+    """
+    Chunk preprocessing and merge functions of an upload kind, and the schema of its columns
+    """
+    if kind == "retail":
+        return demand_engine.preprocess_retail_data, demand_engine.combine_retail_data, demand_engine.RETAIL_SCHEMA
+    return (partial(price_engine.preprocess_mandi_data, by_location=True),
+            partial(price_engine.combine_mandi_data, by_location=True), price_engine.MANDI_SCHEMA)
+
+def ingest_upload(kind: str, name: str, source: BinaryIO, filename: str, mode: str, keep_raw: bool,
+                  job: Optional[Job] = None) -> dict:
+    with get_datasets().checkout(name, create=True) as dataset:
+        try:
+            # Parse the spooled upload in chunks instead of reading it into memory at once
+            source.seek(0)
+            if job is not None:
+                job.set_stage("parsing")
+            preprocess, combine, schema = upload_parsers(kind)
+            result = profile_call(lambda: ingestion.ingest_csv(source, preprocess, combine, keep_raw=keep_raw,
+                                                               progress=job_progress(job), schema=schema))
+            
+            with dataset.update_lock:
+                if job is not None:
+                    # Last point at which the job can be cancelled without touching the data
+                    job.set_stage("applying")
+                if kind == "retail":
+                    alert_changes = dataset.apply_retail(result['raw'], result['processed'], mode)
+                    processed = dataset.processed_retail_data
+                else:
+                    alert_changes = dataset.apply_mandi(result['raw'], result['processed'], mode)
+                    processed = dataset.processed_mandi_data
+                report = upload_report(dataset, filename, result, mode, processed)
+                report["alert_changes"] = alert_changes
+            report = finish_upload(dataset, report, job)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Error processing file: {str(e)}")
+    get_datasets().enforce_limit()
+    return report
+
+async def start_upload_job(kind: str, name: str, file: UploadFile, mode: str, keep_raw: bool) -> JSONResponse:
+    """
+    Queue an upload as a background job and answer 202 with its id
+    The request's upload is closed when the response is sent, so the job reads its own copy
+    """
+    source = tempfile.TemporaryFile()
+    file.file.seek(0)
+    await run_in_threadpool(shutil.copyfileobj, file.file, source)
+    filename = file.filename
+    
+    def run(job: Job) -> dict:
+        return ingest_upload(kind, name, source, filename, mode, keep_raw, job)
+    
+    job = submit_job(f"upload_{kind}", {"dataset": name, "filename": filename, "mode": mode,
+                                        "keep_raw": keep_raw}, run, on_finish=source.close)
+    return job_accepted(job)
+
+async def upload(kind: str, name: str, file: UploadFile, mode: str, keep_raw: bool, background: bool):
+    check_upload_mode(mode)
+    check_dataset_name(name)
+    if background:
+        return await start_upload_job(kind, name, file, mode, keep_raw)
+    return await work_pool.run(ingest_upload, kind, name, file.file, file.filename, mode, keep_raw)
+
+@app.post("/upload/retail")
+@app.post("/datasets/{dataset}/upload/retail")
+async def upload_retail_data(file: UploadFile = File(...), mode: str = Query("replace"), keep_raw: bool = Query(True),
+                             background: bool = Query(False), dataset: str = DEFAULT_DATASET):
+    return await upload("retail", dataset, file, mode, keep_raw, background)
 
 @app.post("/upload/mandi")
-async def upload_mandi_data(file: UploadFile = File(...)):
-    global mandi_data, processed_mandi_data
+@app.post("/datasets/{dataset}/upload/mandi")
+async def upload_mandi_data(file: UploadFile = File(...), mode: str = Query("replace"), keep_raw: bool = Query(True),
+                            background: bool = Query(False), dataset: str = DEFAULT_DATASET):
+    return await upload("mandi", dataset, file, mode, keep_raw, background)
+
+def data_response(dataset: Dataset, kind: str, cursor: Optional[str], limit: Optional[int], product: Optional[str],
+                  start: Optional[str], end: Optional[str], layout: str, format: str):
+    df = dataset.served_data(kind)
+    if df is None:
+        return {"error": f"No {kind} data uploaded"}
+    if layout not in pagination.LAYOUTS:
+        raise HTTPException(status_code=400, detail=f"Invalid layout '{layout}', expected one of {list(pagination.LAYOUTS)}")
+    if format not in pagination.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format '{format}', expected one of {list(pagination.FORMATS)}")
+    
     try:
-        contents = await file.read()
-        df = pd.read_csv(io.StringIO(contents.decode("utf-8")))
-        mandi_data = df
-        processed_mandi_data = preprocess_mandi_data(df)
-        return {"filename": file.filename, "rows": len(df), "columns": list(df.columns), "processed": True}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error processing file: {str(e)}")
+        offset = pagination.decode_cursor(cursor, dataset.version)
+        dates = dataset.served_dates(kind, df) if start is not None or end is not None else None
+        positions = pagination.filter_positions(df, product, dates, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if format == "json":
+        limit = min(limit or pagination.DEFAULT_PAGE_SIZE, pagination.MAX_PAGE_SIZE)
+        return pagination.page_payload(df, positions, offset, limit, layout, dataset.version)
+    
+    # Streamed formats send every matching row from the cursor on unless a limit is given
+    positions = positions[offset:offset + limit] if limit else positions[offset:]
+    if format == "ndjson":
+        return StreamingResponse(pagination.stream_ndjson(df, positions), media_type="application/x-ndjson")
+    if pagination.pa is None:
+        raise HTTPException(status_code=400, detail="Arrow output requires pyarrow to be installed")
+    return StreamingResponse(pagination.stream_arrow(df, positions), media_type="application/vnd.apache.arrow.stream")
 
 @app.get("/data/retail")
-def get_retail_data():
-    global retail_data
-    if retail_data is None:
-        return {"error": "No retail data uploaded"}
-    return retail_data.to_dict(orient='records')
+@app.get("/datasets/{dataset}/data/retail")
+async def get_retail_data(cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1),
+                          product: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None,
+                          layout: str = "records", format: str = "json", dataset: str = DEFAULT_DATASET):
+    async with open_dataset(dataset) as data:
+        return await work_pool.run(read_consistent, data, data_response, data, "retail", cursor, limit, product,
+                                   start, end, layout, format)
 
 @app.get("/data/mandi")
-def get_mandi_data():
-    global mandi_data
-    if mandi_data is None:
-        return {"error": "No mandi data uploaded"}
-    return mandi_data.to_dict(orient='records')
+@app.get("/datasets/{dataset}/data/mandi")
+async def get_mandi_data(cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1),
+                         product: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None,
+                         layout: str = "records", format: str = "json", dataset: str = DEFAULT_DATASET):
+    async with open_dataset(dataset) as data:
+        return await work_pool.run(read_consistent, data, data_response, data, "mandi", cursor, limit, product,
+                                   start, end, layout, format)
+
+def precompute_analyses(dataset: Dataset, names: Optional[List[str]] = None) -> List[str]:
+    """
+    Store the default analysis results of the namespace's current version in its result cache
+    Results that cannot be encoded as JSON are left for the endpoint to report
+    """
+    precomputed = []
+    for name, compute in dataset.default_analyses().items():
+        if names is not None and name not in names:
+            continue
+        try:
+            cache_result(dataset, dataset.cache_key(name), compute)
+        except ValueError:
+            continue
+        precomputed.append(name)
+    return precomputed
 
 @app.get("/analysis/demand")
-def get_demand_analysis():
-    global processed_retail_data
-    if processed_retail_data is None:
-        return {"error": "No retail data uploaded and processed"}
-    
-    signals = get_demand_signals(processed_retail_data)
-    return {"signals": signals, "count": len(signals)}
+@app.get("/datasets/{dataset}/analysis/demand")
+async def get_demand_analysis(request: Request, windows: Optional[str] = None, weeks: int = Query(0, ge=0, le=MAX_WEEKS),
+                              dataset: str = DEFAULT_DATASET):
+    async with open_dataset(dataset) as data:
+        if not data.has_retail:
+            return {"error": "No retail data uploaded and processed"}
+        if windows is None and weeks == 0:
+            return await cached_response(request, data, "demand", data.compute_demand_analysis)
+        
+        days = parse_windows(windows) if windows is not None else None
+        
+        def compute():
+            result = data.compute_demand_windows(days) if days else data.compute_demand_analysis()
+            if weeks:
+                result["weekly"] = data.compute_weekly_demand(weeks)
+            return result
+        
+        return await cached_response(request, data, "demand_windows", compute)
 
 @app.get("/analysis/price")
-def get_price_analysis():
-    global processed_mandi_data
-    if processed_mandi_data is None:
-        return {"error": "No mandi data uploaded and processed"}
-    
-    signals = get_price_signals(processed_mandi_data)
-    return {"signals": signals, "count": len(signals)}
+@app.get("/datasets/{dataset}/analysis/price")
+async def get_price_analysis(request: Request, location: Optional[str] = None, dataset: str = DEFAULT_DATASET):
+    async with open_dataset(dataset) as data:
+        if not data.has_mandi:
+            return {"error": "No mandi data uploaded and processed"}
+        if location is None:
+            return await cached_response(request, data, "price", data.compute_price_analysis)
+        
+        if data.mandi_location_stats is None:
+            return {"error": "Uploaded mandi data has no location column"}
+        signals = (await work_pool.run(read_consistent, data, data.current_location_index)).get(location)
+        if signals is None:
+            return {"error": f"No price data for location {location}"}
+        return {"location": location, "signals": signals, "count": len(signals)}
+
+@app.get("/analysis/price/spread")
+@app.get("/datasets/{dataset}/analysis/price/spread")
+async def get_price_spread(request: Request, product: Optional[str] = None, dataset: str = DEFAULT_DATASET):
+    async with open_dataset(dataset) as data:
+        if not data.has_mandi:
+            return {"error": "No mandi data uploaded and processed"}
+        if data.mandi_location_stats is None:
+            return {"error": "Uploaded mandi data has no location column"}
+        
+        def compute():
+            stats = data.mandi_location_stats
+            if product is not None:
+                stats = stats[stats.index.get_level_values('product') == product]
+            spread = price_engine.calculate_price_spread(stats)
+            return {"spread": spread, "count": len(spread)}
+        
+        return await cached_response(request, data, "price_spread", compute)
+
+@app.get("/analysis/forecast")
+@app.get("/datasets/{dataset}/analysis/forecast")
+async def get_price_forecast(request: Request, model: str = DEFAULT_MODEL, horizon: int = Query(7, ge=1, le=MAX_HORIZON),
+                             product: Optional[str] = None, location: Optional[str] = None,
+                             dataset: str = DEFAULT_DATASET):
+    check_models([model])
+    async with open_dataset(dataset) as data:
+        if not data.has_mandi:
+            return {"error": "No mandi data uploaded and processed"}
+        if location is not None and data.processed_mandi_locations is None:
+            return {"error": "Uploaded mandi data has no location column"}
+        
+        return await cached_response(request, data, "forecast",
+                                     lambda: data.compute_forecast(model, horizon, product, location))
+
+@app.get("/analysis/forecast/backtest")
+@app.get("/datasets/{dataset}/analysis/forecast/backtest")
+async def get_forecast_backtest(request: Request, models: Optional[str] = None,
+                                horizon: int = Query(7, ge=1, le=MAX_HORIZON), by_location: bool = False,
+                                dataset: str = DEFAULT_DATASET):
+    names = parse_names(models) or list(forecasting.MODELS)
+    check_models(names)
+    async with open_dataset(dataset) as data:
+        if not data.has_mandi:
+            return {"error": "No mandi data uploaded and processed"}
+        if by_location and data.processed_mandi_locations is None:
+            return {"error": "Uploaded mandi data has no location column"}
+        
+        return await cached_response(request, data, "forecast_backtest",
+                                     lambda: data.compute_backtest(names, horizon, by_location))
 
 @app.get("/analysis/gap")
-def get_gap_analysis():
-    global processed_retail_data, processed_mandi_data
-    if processed_retail_data is None or processed_mandi_data is None:
-        return {"error": "Both retail and mandi data must be uploaded and processed"}
+@app.get("/datasets/{dataset}/analysis/gap")
+async def get_gap_analysis(request: Request, dataset: str = DEFAULT_DATASET):
+    async with open_dataset(dataset) as data:
+        if not (data.has_retail and data.has_mandi):
+            return {"error": "Both retail and mandi data must be uploaded and processed"}
+        
+        return await cached_response(request, data, "gap", data.compute_gap_analysis)
+
+@app.get("/analysis/recommendations")
+@app.get("/datasets/{dataset}/analysis/recommendations")
+async def get_recommendations(request: Request, dataset: str = DEFAULT_DATASET,
+                              k: Optional[int] = Query(None, ge=1, le=MAX_TOP_K), sort_by: Optional[str] = None,
+                              signal_level: Optional[str] = None, product: Optional[str] = None,
+                              min_demand_change: Optional[float] = Query(None, ge=0),
+                              min_price_slope: Optional[float] = Query(None, ge=0),
+                              min_volatility: Optional[float] = Query(None, ge=0)):
+    async with open_dataset(dataset) as data:
+        if not (data.has_retail and data.has_mandi):
+            return {"error": "Both retail and mandi data must be uploaded and processed"}
+        
+        minimums = {"demand_change": min_demand_change, "price_slope": min_price_slope, "volatility": min_volatility}
+        if k is None and sort_by is None and signal_level is None and product is None and \
+                all(minimum is None for minimum in minimums.values()):
+            return await cached_response(request, data, "recommendations", data.compute_recommendations)
+        
+        if sort_by is not None and sort_by not in ranking.SCORES:
+            raise HTTPException(status_code=400, detail=f"Invalid sort_by '{sort_by}', expected one of {list(ranking.SCORES)}")
+        if signal_level is not None and signal_level not in gap_analyzer.SIGNAL_COLORS:
+            raise HTTPException(status_code=400, detail=f"Invalid signal_level '{signal_level}', expected one of {list(gap_analyzer.SIGNAL_COLORS)}")
+        
+        def compute():
+            return data.compute_ranked_recommendations(k or DEFAULT_TOP_K, sort_by or "demand_change",
+                                                       signal_level, product, minimums)
+        
+        return await cached_response(request, data, "recommendations_ranked", compute)
+
+@app.get("/analysis/history")
+@app.get("/datasets/{dataset}/analysis/history")
+async def get_signal_history(request: Request, product: Optional[str] = None,
+                             first: Optional[str] = Query(None, alias="from"), last: Optional[str] = Query(None, alias="to"),
+                             as_of: Optional[str] = None, dataset: str = DEFAULT_DATASET):
+    first, last, as_of = parse_date(first, "from"), parse_date(last, "to"), parse_date(as_of, "as_of")
+    if product is None and as_of is None:
+        raise HTTPException(status_code=400, detail="Give a product, an as_of date, or both")
+    async with open_dataset(dataset) as data:
+        if not (data.has_retail and data.has_mandi):
+            return {"error": "Both retail and mandi data must be uploaded and processed"}
+        if data.cube is None:
+            return {"error": "Signal history is not kept for datasets larger than AGRIS_CUBE_MAX_CELLS"}
+        
+        return await cached_response(request, data, "history", lambda: data.compute_history(product, first, last, as_of))
+
+@app.post("/analysis/scenarios")
+@app.post("/datasets/{dataset}/analysis/scenarios")
+async def evaluate_scenarios(request: Request, dataset: str = DEFAULT_DATASET):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body must be JSON")
+    specs = parse_scenarios(body)
+    async with open_dataset(dataset) as data:
+        if not (data.has_retail and data.has_mandi):
+            return {"error": "Both retail and mandi data must be uploaded and processed"}
+        
+        # Results are cached per dataset version and set of specs
+        digest = hashlib.sha256(json.dumps(specs, sort_keys=True).encode()).hexdigest()
+        return await cached_response(request, data, "scenarios", lambda: data.compute_scenarios(specs), (digest,))
+
+def compute_batch_gap(batch: List[Dataset]) -> bytes:
+    """
+    Gap analysis for several namespaces in one pass: cached results are reused and the rest
+    are computed together, one task per namespace on the shared worker processes
+    Cached bodies are spliced into the response as they are, without decoding them
+    """
+    bodies = {}
+    pending = []
+    for dataset in batch:
+        load_dataset(dataset)
+        # The key and the signals of one version, taken together; the gap is computed after release
+        with dataset.update_lock.shared():
+            if not (dataset.has_retail and dataset.has_mandi):
+                bodies[dataset.name] = json.dumps({"error": "Both retail and mandi data must be uploaded and processed"}).encode()
+                continue
+            key = dataset.cache_key("gap")
+            entry = dataset.cache.get(key)
+            if entry is not None:
+                bodies[dataset.name] = entry[0]
+                continue
+            bodies[dataset.name] = None
+            pending.append((dataset, key, dataset.current_demand_signals(), dataset.current_price_signals()))
     
-    demand_signals = get_demand_signals(processed_retail_data)
-    price_signals = get_price_signals(processed_mandi_data)
+    products = sum(max(len(demand), len(price)) for _, _, demand, price in pending)
+    results = parallel.batch_gap_analysis([(demand, price) for _, _, demand, price in pending],
+                                          workers=None if parallel.use_parallel(products) else 0)
+    for (dataset, key, _, _), gap_analysis in zip(pending, results):
+        bodies[dataset.name] = cache_result(dataset, key, lambda: namespaces.gap_payload(gap_analysis))[0]
     
-    gap_analysis = analyze_supply_demand_gap(demand_signals, price_signals)
-    summary = get_gap_summary(gap_analysis)
+    results = b",".join(json.dumps(name).encode() + b":" + body for name, body in bodies.items())
+    return b'{"results":{' + results + b'},"count":' + str(len(bodies)).encode() + b'}'
+
+@app.get("/batch/analysis/gap")
+async def get_batch_gap_analysis(names: str):
+    requested = parse_names(names)
+    if not requested:
+        raise HTTPException(status_code=400, detail="No dataset names given")
+    batch = []
+    try:
+        for name in requested:
+            batch.append(acquire_dataset(name))
+        body = await work_pool.run(compute_batch_gap, batch)
+    finally:
+        for dataset in batch:
+            get_datasets().release(dataset)
+    return Response(content=body, media_type="application/json")
+
+@app.get("/datasets")
+def list_datasets():
+    return get_datasets().stats()
+
+def get_dataset_or_404(name: str) -> Dataset:
+    check_dataset_name(name)
+    dataset = get_datasets().get(name)
+    if dataset is None:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset {name}")
+    return dataset
+
+@app.get("/datasets/{dataset}")
+def get_dataset(dataset: str):
+    return get_dataset_or_404(dataset).stats()
+
+def submit_job(kind: str, params: dict, fn: Callable[[Job], dict],
+               on_finish: Optional[Callable[[], None]] = None) -> Job:
+    """
+    Queue fn as a background job; on_finish releases what the job holds once it ends,
+    is cancelled before it starts, or cannot be queued
+    """
+    job = jobs.create(kind, params, on_finish)
+    try:
+        job.future = job_pool.submit(jobs.execute, job, fn)
+    except PoolSaturated:
+        jobs.discard(job)
+        raise
+    return job
+
+def job_accepted(job: Job) -> JSONResponse:
+    url = f"/jobs/{job.id}"
+    return JSONResponse(status_code=202, headers={"Location": url}, content={
+        "job_id": job.id, "status": job.status, "status_url": url, "events_url": f"{url}/events"
+    })
+
+def get_job_or_404(job_id: str) -> Job:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
+@app.post("/jobs/analysis")
+@app.post("/datasets/{dataset}/jobs/analysis")
+async def start_analysis_job(names: Optional[str] = None, dataset: str = DEFAULT_DATASET):
+    requested = parse_names(names)
+    unknown = sorted(set(requested or []) - set(ANALYSES))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown analyses {unknown}, expected some of {list(ANALYSES)}")
+    
+    data = acquire_dataset(dataset)
+    
+    def run(job: Job) -> dict:
+        job.set_stage("computing")
+        load_dataset(data)
+        # Held so the results are computed from, and cached under, one dataset version
+        with data.update_lock.shared():
+            return {"dataset": data.name, "dataset_version": data.version,
+                    "precomputed": precompute_analyses(data, requested)}
     
-    return {
-        "gap_analysis": gap_analysis,
-        "summary": summary,
-        "count": len(gap_analysis)
-    }
+    job = submit_job("analysis", {"dataset": dataset, "names": requested}, run,
+                     on_finish=lambda: get_datasets().release(data))
+    return job_accepted(job)
 
-@app.get("/analysis/recommendations")
-def get_recommendations():
-    global processed_retail_data, processed_mandi_data
-    if processed_retail_data is None or processed_mandi_data is None:
-        return {"error": "Both retail and mandi data must be uploaded and processed"}
-    
-    demand_signals = get_demand_signals(processed_retail_data)
-    price_signals = get_price_signals(processed_mandi_data)
-    
-    gap_analysis = analyze_supply_demand_gap(demand_signals, price_signals)
-    alerts_and_rec = generate_alerts_and_recommendations(gap_analysis, demand_signals, price_signals)
-    actionable_insights = get_actionable_insights(gap_analysis, demand_signals, price_signals)
-    
-    return {
-        "alerts": alerts_and_rec['alerts'],
-        "recommendations": alerts_and_rec['recommendations'],
-        "summary": alerts_and_rec['summary'],
-        "actionable_insights": actionable_insights
-    }
+@app.get("/jobs")
+def list_jobs():
+    snapshots = [job.snapshot() for job in jobs.list()]
+    return {"jobs": snapshots, "count": len(snapshots)}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    return get_job_or_404(job_id).snapshot()
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = get_job_or_404(job_id)
+    if not jobs.cancel(job):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} already {job.status}")
+    return job.snapshot()
+
+def sse_event(kind: str, data: dict, event_id: Optional[Union[int, str]] = None) -> str:
+    event = f"id: {event_id}\n" if event_id is not None else ""
+    return event + f"event: {kind}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+async def job_events(job: Job):
+    """
+    Server-Sent Events: one event per change of the job until it finishes
+    """
+    revision = None
+    idle = 0.0
+    while True:
+        snapshot = job.snapshot()
+        if snapshot["revision"] != revision:
+            revision = snapshot["revision"]
+            idle = 0.0
+            yield sse_event(snapshot['status'], snapshot)
+        elif idle >= EVENT_STREAM_KEEPALIVE:
+            idle = 0.0
+            yield ": keep-alive\n\n"
+        if snapshot["status"] in FINISHED:
+            return
+        await asyncio.sleep(EVENT_STREAM_INTERVAL)
+        idle += EVENT_STREAM_INTERVAL
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    job = get_job_or_404(job_id)
+    return StreamingResponse(job_events(job), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/alerts")
+@app.get("/datasets/{dataset}/alerts")
+async def get_alerts(since: Optional[str] = None, dataset: str = DEFAULT_DATASET):
+    """
+    The current alerts, or with since= only the alerts that were raised, changed or resolved
+    after that cursor; the response's cursor is passed as since= on the next poll
+    """
+    async with open_dataset(dataset) as data:
+        return data.alerts.since(since)
+
+async def alert_events(feed: AlertFeed, cursor: Optional[str]):
+    """
+    Server-Sent Events: a snapshot of the current alerts unless the client resumes from a
+    cursor, then one event per new, changed or resolved alert
+    """
+    idle = 0.0
+    while True:
+        page = feed.since(cursor)
+        if 'alerts' in page:
+            yield sse_event("snapshot", page, page['cursor'])
+        for event in page.get('events', []):
+            yield sse_event(event['type'], event, event['cursor'])
+        if page['cursor'] != cursor or 'alerts' in page:
+            idle = 0.0
+        elif idle >= EVENT_STREAM_KEEPALIVE:
+            idle = 0.0
+            yield ": keep-alive\n\n"
+        cursor = page['cursor']
+        await asyncio.sleep(EVENT_STREAM_INTERVAL)
+        idle += EVENT_STREAM_INTERVAL
+
+@app.get("/alerts/events")
+@app.get("/datasets/{dataset}/alerts/events")
+async def stream_alert_events(request: Request, since: Optional[str] = None, dataset: str = DEFAULT_DATASET):
+    # Reconnecting EventSource clients resume from the last event they received
+    if since is None:
+        since = request.headers.get("last-event-id")
+    async with open_dataset(dataset) as data:
+        feed = data.alerts
+    return StreamingResponse(alert_events(feed, since), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/metrics")
+def get_metrics():
+    datasets = get_datasets()
+    registry = datasets.stats()
+    caches = [dataset['cache'] for dataset in registry['datasets']]
+    pool = work_pool.stats()
+    job_threads = job_pool.stats()
+    flights = single_flight.stats()
+    job_counts = jobs.stats()
+    return PlainTextResponse(prometheus_metrics({
+        "agris_cache_hits_total": sum(cache['hits'] for cache in caches),
+        "agris_cache_misses_total": sum(cache['misses'] for cache in caches),
+        "agris_cache_evictions_total": sum(cache['evictions'] for cache in caches),
+        "agris_cache_entries": sum(cache['entries'] for cache in caches),
+        "agris_dataset_version": datasets.get(DEFAULT_DATASET).version,
+        "agris_datasets": registry['count'],
+        "agris_datasets_loaded": registry['loaded'],
+        "agris_datasets_memory_mb": registry['memory_mb'],
+        "agris_dataset_evictions_total": registry['evictions'],
+        "agris_work_active": pool['active'],
+        "agris_work_rejected_total": pool['rejected'],
+        "agris_single_flight_shared_total": flights['shared'],
+        "agris_jobs_queued": job_counts['queued'],
+        "agris_jobs_running": job_counts['running'],
+        "agris_jobs_rejected_total": job_threads['rejected']
+    }), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+@app.get("/datasets/{dataset}/cache/stats")
+def get_cache_stats(dataset: str = DEFAULT_DATASET):
+    data = get_dataset_or_404(dataset)
+    stats = data.cache.stats()
+    stats["dataset_version"] = data.version
+    stats["forecast_models"] = data.forecasts.stats()
+    stats["schemas"] = {"retail": demand_engine.RETAIL_SCHEMA.stats(), "mandi": price_engine.MANDI_SCHEMA.stats()}
+    return stats
 
 if __name__ == "__main__":
     import uvicorn
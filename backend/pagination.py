@@ -0,0 +1,139 @@
+import base64
+import io
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterator, Optional
+
+from encoding import dumps
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow IPC responses are optional
+    pa = None
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 50000
+
+# Rows serialized per chunk of a streamed response
+STREAM_BATCH_ROWS = 10000
+
+LAYOUTS = ("records", "columns")
+FORMATS = ("json", "ndjson", "arrow")
+
+def encode_cursor(version: int, offset: int) -> str:
+    """
+    Opaque cursor pointing at a row offset of a given dataset version
+    """
+    return base64.urlsafe_b64encode(f"{version}:{offset}".encode("ascii")).decode("ascii")
+
+def decode_cursor(cursor: Optional[str], version: int) -> int:
+    """
+    Return the row offset of a cursor, rejecting cursors from an older dataset version
+    """
+    if not cursor:
+        return 0
+    try:
+        cursor_version, offset = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("ascii").split(":")
+        cursor_version, offset = int(cursor_version), int(offset)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if cursor_version != version:
+        raise ValueError("Cursor expired, the data changed since it was issued")
+    return offset
+
+def filter_positions(df: pd.DataFrame, product: Optional[str] = None,
+                     dates: Optional[pd.Series] = None,
+                     start: Optional[str] = None, end: Optional[str] = None) -> np.ndarray:
+    """
+    Row positions matching the product and date range filters, computed with vectorized masks
+    dates is the parsed date column, so it can be reused across requests
+    """
+    mask = np.ones(len(df), dtype=bool)
+    if product is not None:
+        if 'product' not in df.columns:
+            raise ValueError("Data has no product column to filter on")
+        mask &= (df['product'] == product).to_numpy()
+    if start is not None or end is not None:
+        if dates is None:
+            raise ValueError("Data has no date column to filter on")
+        if start is not None:
+            mask &= (dates >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (dates <= pd.Timestamp(end)).to_numpy()
+    return np.flatnonzero(mask)
+
+def _dates_formatted(page: pd.DataFrame) -> pd.DataFrame:
+    """
+    Copy of the rows with datetime columns formatted as dates
+    """
+    page = page.copy()
+    for col in page.columns:
+        if pd.api.types.is_datetime64_any_dtype(page[col]):
+            page[col] = page[col].dt.strftime('%Y-%m-%d')
+    return page
+
+def _serializable(page: pd.DataFrame) -> pd.DataFrame:
+    """
+    Format datetime columns as dates and replace NaN with None for JSON output
+    """
+    page = _dates_formatted(page)
+    return page.astype(object).where(page.notna(), None)
+
+def page_payload(df: pd.DataFrame, positions: np.ndarray, offset: int, limit: int,
+                 layout: str, version: int) -> Dict:
+    """
+    One page of rows as records or as arrays per column, with the cursor of the next page
+    """
+    selected = positions[offset:offset + limit]
+    page = _serializable(df.iloc[selected])
+    next_offset = offset + len(selected)
+
+    if layout == "columns":
+        data = {col: page[col].tolist() for col in page.columns}
+    else:
+        data = page.to_dict(orient='records')
+
+    return {
+        "data": data,
+        "layout": layout,
+        "count": len(selected),
+        "total": len(positions),
+        "next_cursor": encode_cursor(version, next_offset) if next_offset < len(positions) else None
+    }
+
+def stream_ndjson(df: pd.DataFrame, positions: np.ndarray) -> Iterator[bytes]:
+    """
+    Yield newline-delimited JSON records batch by batch, with the same dates and numbers
+    as the records of the JSON pages
+    """
+    for begin in range(0, len(positions), STREAM_BATCH_ROWS):
+        batch = _dates_formatted(df.iloc[positions[begin:begin + STREAM_BATCH_ROWS]])
+        columns = list(batch.columns)
+        values = [batch[col].tolist() for col in columns]
+        # dumps writes NaN as null, so the rows need no conversion to objects first
+        yield b"".join(dumps(dict(zip(columns, row))) + b"\n" for row in zip(*values))
+
+def stream_arrow(df: pd.DataFrame, positions: np.ndarray) -> Iterator[bytes]:
+    """
+    Yield an Arrow IPC stream, one record batch per chunk of rows
+    """
+    if pa is None:
+        raise ValueError("Arrow output requires pyarrow to be installed")
+
+    schema = pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+
+    def drain() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    yield drain()
+    for begin in range(0, len(positions), STREAM_BATCH_ROWS):
+        batch = df.iloc[positions[begin:begin + STREAM_BATCH_ROWS]]
+        writer.write_batch(pa.RecordBatch.from_pandas(batch, schema=schema, preserve_index=False))
+        yield drain()
+    writer.close()
+    yield drain()
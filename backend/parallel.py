@@ -0,0 +1,214 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+from demand_engine import window_totals_at
+from price_engine import price_regression_stats
+from gap_analyzer import analyze_supply_demand_gap
+from scenarios import evaluate_cells
+from forecasting import SeriesSet, backtest_matrix, backtest_rows, backtest_summary, batches
+
+# Number of worker processes for signal computation; 0 or 1 computes inline
+WORKERS = int(os.environ.get("AGRIS_WORKERS", "0"))
+
+# Below this many products the cost of shipping work to processes outweighs the gain
+MIN_PARALLEL_PRODUCTS = int(os.environ.get("AGRIS_MIN_PARALLEL_PRODUCTS", "2000"))
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Shared process pool, recreated only when the requested size changes
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+def use_parallel(n_products: int, workers: Optional[int] = None) -> bool:
+    workers = WORKERS if workers is None else workers
+    return workers > 1 and n_products >= MIN_PARALLEL_PRODUCTS
+
+def _share(arrays: Dict[str, np.ndarray]) -> Tuple[List[shared_memory.SharedMemory], Dict]:
+    """
+    Copy arrays into shared memory blocks and describe them so workers can attach
+    """
+    blocks = []
+    spec = {}
+    for name, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+        blocks.append(block)
+        spec[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, spec
+
+def _attach(spec: Dict) -> Tuple[List[shared_memory.SharedMemory], Dict[str, np.ndarray]]:
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return blocks, arrays
+
+def _release(blocks: List[shared_memory.SharedMemory], unlink: bool = False):
+    for block in blocks:
+        block.close()
+        if unlink:
+            block.unlink()
+
+def _columnar(df: pd.DataFrame, value_col: str) -> Tuple[Dict[str, np.ndarray], np.ndarray, np.ndarray]:
+    """
+    Encode a processed frame as arrays sorted by product code, so every shard of products
+    is one contiguous row range, and return the product names and row offsets per product
+    """
+    codes, names = pd.factorize(df['product'], sort=True)
+    order = np.argsort(codes, kind='stable')
+    arrays = {
+        'code': codes[order].astype(np.int32),
+        'day': df['date'].to_numpy(dtype='datetime64[D]')[order].astype(np.int64),
+        'value': df[value_col].to_numpy(dtype=np.float64)[order]
+    }
+    offsets = np.searchsorted(arrays['code'], np.arange(len(names) + 1))
+    return arrays, np.asarray(names, dtype=object), offsets
+
+def _shard_frame(arrays: Dict[str, np.ndarray], names: List[str], first_code: int,
+                 start: int, end: int, value_col: str) -> pd.DataFrame:
+    return pd.DataFrame({
+        'date': arrays['day'][start:end].astype('datetime64[D]').astype('datetime64[ns]'),
+        'product': np.asarray(names, dtype=object)[arrays['code'][start:end] - first_code],
+        # Copied so no view into the shared block outlives the shard
+        value_col: arrays['value'][start:end].copy()
+    })
+
+def _price_stats_shard(spec: Dict, names: List[str], first_code: int, start: int, end: int) -> pd.DataFrame:
+    blocks, arrays = _attach(spec)
+    try:
+        df = _shard_frame(arrays, names, first_code, start, end, 'price')
+        return price_regression_stats(df)
+    finally:
+        del arrays
+        _release(blocks)
+
+def _demand_totals_shard(spec: Dict, names: List[str], first_code: int, start: int, end: int,
+                         max_date: pd.Timestamp, period_days: int) -> pd.DataFrame:
+    blocks, arrays = _attach(spec)
+    try:
+        df = _shard_frame(arrays, names, first_code, start, end, 'sales_quantity')
+        return window_totals_at(df, max_date, period_days)
+    finally:
+        del arrays
+        _release(blocks)
+
+def _shards(n_products: int, workers: int) -> List[Tuple[int, int]]:
+    bounds = np.linspace(0, n_products, workers + 1).astype(int)
+    return [(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+def _run_sharded(df: pd.DataFrame, value_col: str, workers: int, task, *args) -> List[pd.DataFrame]:
+    arrays, names, offsets = _columnar(df, value_col)
+    blocks, spec = _share(arrays)
+    try:
+        pool = get_pool(workers)
+        futures = [
+            pool.submit(task, spec, list(names[lo:hi]), lo, int(offsets[lo]), int(offsets[hi]), *args)
+            for lo, hi in _shards(len(names), workers)
+        ]
+        # Results are collected in shard order, so the merge does not depend on timing
+        return [future.result() for future in futures]
+    finally:
+        _release(blocks, unlink=True)
+
+def parallel_price_stats(df: pd.DataFrame, workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    price_regression_stats computed over product shards in worker processes
+    """
+    workers = WORKERS if workers is None else workers
+    parts = _run_sharded(df, 'price', workers, _price_stats_shard)
+    stats = pd.concat(parts)
+    return stats.sort_values('first_date', kind='stable')
+
+def parallel_demand_totals(df: pd.DataFrame, period_days: int = 14, workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    demand_window_totals computed over product shards in worker processes
+    Windows are anchored at the latest date of the whole dataset, not of each shard
+    """
+    workers = WORKERS if workers is None else workers
+    if df.empty:
+        return pd.DataFrame(columns=['current_period_total', 'previous_period_total'])
+    parts = _run_sharded(df, 'sales_quantity', workers, _demand_totals_shard, df['date'].max(), period_days)
+    return pd.concat(parts)
+
+def parallel_gap_analysis(demand_signals: List[Dict], price_signals: List[Dict],
+                          workers: Optional[int] = None) -> List[Dict]:
+    """
+    analyze_supply_demand_gap over product shards in worker processes
+    """
+    workers = WORKERS if workers is None else workers
+    products = sorted({signal['product'] for signal in demand_signals} | {signal['product'] for signal in price_signals})
+    shard_of = {product: i * workers // max(len(products), 1) for i, product in enumerate(products)}
+
+    demand_shards = [[] for _ in range(workers)]
+    price_shards = [[] for _ in range(workers)]
+    for signal in demand_signals:
+        demand_shards[shard_of[signal['product']]].append(signal)
+    for signal in price_signals:
+        price_shards[shard_of[signal['product']]].append(signal)
+
+    pool = get_pool(workers)
+    futures = [pool.submit(analyze_supply_demand_gap, d, p) for d, p in zip(demand_shards, price_shards)]
+    gap_analysis = []
+    for future in futures:
+        gap_analysis.extend(sorted(future.result(), key=lambda item: item['product']))
+    return gap_analysis
+
+def batch_gap_analysis(signal_pairs: List[Tuple[List[Dict], List[Dict]]],
+                       workers: Optional[int] = None) -> List[List[Dict]]:
+    """
+    analyze_supply_demand_gap for several (demand, price) signal pairs, e.g. one per dataset
+    namespace, as one task each on the shared worker processes
+    """
+    workers = WORKERS if workers is None else workers
+    if workers <= 1 or len(signal_pairs) < 2:
+        return [analyze_supply_demand_gap(d, p) for d, p in signal_pairs]
+    pool = get_pool(workers)
+    futures = [pool.submit(analyze_supply_demand_gap, d, p) for d, p in signal_pairs]
+    return [future.result() for future in futures]
+
+def parallel_evaluate_cells(cells: Dict[str, np.ndarray], workers: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    evaluate_cells with the scenario cells split into one slice per worker process
+    """
+    workers = WORKERS if workers is None else workers
+    pool = get_pool(workers)
+    futures = [pool.submit(evaluate_cells, {name: array[start:end] for name, array in cells.items()})
+               for start, end in _shards(len(cells['row']), workers)]
+    parts = [future.result() for future in futures]
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+def parallel_backtest(series: SeriesSet, models: List[str], horizon: int, workers: Optional[int] = None) -> Dict:
+    """
+    backtest_series with the series split into one batch per worker process
+    """
+    workers = WORKERS if workers is None else workers
+    rows = backtest_rows(series, horizon)
+    size = max(1, -(-len(rows) // workers))
+    pool = get_pool(workers)
+    futures = [pool.submit(backtest_matrix, series.matrix(batch), models, horizon) for batch in batches(rows, size)]
+    return backtest_summary([future.result() for future in futures], models, horizon, len(series))
@@ -1,117 +1,347 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-from typing import Dict, List
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.pipeline import make_pipeline
-import warnings
-warnings.filterwarnings('ignore')
+from typing import Dict, List, Optional, Tuple
+from instrumentation import timed
+from frames import compact_counts, compact_keys, concat_frames, plain_index, widen
+from cube import ProductDayCube, row_blocks
+from schema import Schema
 
-def preprocess_mandi_data(df: pd.DataFrame) -> pd.DataFrame:
+# Standard mandi columns and the other names feeds use for them
+MANDI_SCHEMA = Schema(
+    "mandi",
+    {
+        'date': [],
+        'product': ['item', 'commodity'],
+        'price': ['rate', 'value', 'cost'],
+        'location': ['mandi', 'market']
+    },
+    dtypes={'price': 'float64'},
+    keys=['product', 'location']
+)
+
+# Price change per day beyond which a series is reported as rising or falling
+TREND_SLOPE = 0.1
+
+# Trend label of every price direction
+TREND_LABELS = {"up": "Price likely to increase", "down": "Price likely to fall", "stable": "Price stable"}
+
+def _group_keys(df: pd.DataFrame) -> List[str]:
+    """
+    Grouping keys of processed mandi data: (date, product) or (date, product, location)
+    """
+    return ['date', 'product'] + (['location'] if 'location' in df.columns else [])
+
+@timed
+def preprocess_mandi_data(df: pd.DataFrame, by_location: bool = False, copy: bool = True) -> pd.DataFrame:
     """
     Preprocess mandi price data to ensure proper format
     Expected columns: date, product, price, location
+    With by_location the location is kept as a grouping key instead of averaged away
+    Pass copy=False when the caller hands over the frame and it may be modified in place
     """
     # Make a copy to avoid modifying original data
-    df = df.copy()
+    if copy:
+        df = df.copy()
     
-    # Convert date column to datetime if it exists
-    if 'date' in df.columns:
-        df['date'] = pd.to_datetime(df['date'])
-    elif 'Date' in df.columns:
-        df['date'] = pd.to_datetime(df['Date'])
-        
-    # Standardize column names
-    column_mapping = {
-        'product': ['product', 'Product', 'item', 'Item', 'commodity', 'Commodity'],
-        'price': ['price', 'Price', 'rate', 'Rate', 'value', 'Value', 'cost', 'Cost'],
-        'location': ['location', 'Location', 'mandi', 'Mandi', 'market', 'Market']
-    }
-    
-    for standard_col, possible_cols in column_mapping.items():
-        for col in possible_cols:
-            if col in df.columns and standard_col not in df.columns:
-                df.rename(columns={col: standard_col}, inplace=True)
-                break
+    # Standardize column names and parse dates with the format pinned for this header
+    df = MANDI_SCHEMA.normalize(df)
     
-    # Group by date and product if multiple entries exist
+    # Group by date and product (and mandi) if multiple entries exist
     if 'date' in df.columns and 'product' in df.columns:
-        df = df.groupby(['date', 'product']).agg({
-            'price': 'mean'  # Average price for the day
-        }).reset_index()
+        keys = ['date', 'product']
+        if by_location and 'location' in df.columns:
+            keys.append('location')
+        
+        # Keep the number of quotes behind each mean so later feeds can be merged in
+        compact_keys(df, keys[1:])
+        df = df.groupby(keys, observed=True).agg(
+            price=('price', 'mean'),  # Average price for the day
+            price_count=('price', 'count')
+        ).reset_index()
+        compact_counts(df)
     
     return df
 
-def calculate_price_trends(df: pd.DataFrame, forecast_days: int = 7) -> Dict:
+@timed
+def combine_mandi_data(frames: List[pd.DataFrame], by_location: bool = False) -> pd.DataFrame:
     """
-    Calculate price trends and simple forecasts using linear regression
+    Combine separately preprocessed mandi frames (e.g. CSV chunks) into one grouped frame
+    Daily means are recombined weighted by the number of quotes behind them, so per-mandi
+    frames can also be collapsed into (date, product) data this way
     """
-    if df.empty:
-        return {}
+    df = concat_frames(frames, ignore_index=True)
+    if 'date' not in df.columns or 'product' not in df.columns:
+        return df
+    
+    keys = _group_keys(df) if by_location else ['date', 'product']
+    df['price_count'] = widen(df['price_count'])
+    df['price_total'] = df['price'] * df['price_count']
+    df = df.groupby(keys, observed=True).agg(
+        price_total=('price_total', 'sum'),
+        price_count=('price_count', 'sum')
+    ).reset_index()
+    df['price'] = df['price_total'] / df['price_count']
+    
+    return compact_counts(df[keys + ['price', 'price_count']])
+
+@timed
+def merge_mandi_data(processed: pd.DataFrame, new_rows: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Merge newly preprocessed mandi rows into existing grouped (date, product[, location]) data
+    Only the tail of the existing data from the first new date onwards is regrouped
+    Returns the merged data, the previous rows that were replaced and the rows that changed
+    """
+    keys = _group_keys(processed)
+    
+    # Processed data is sorted by date, so rows that can overlap the new feed form a tail
+    split = processed['date'].searchsorted(new_rows['date'].min())
+    head = processed.iloc[:split]
+    tail = processed.iloc[split:]
     
+    new_keys = pd.MultiIndex.from_frame(new_rows[keys])
+    removed = tail[pd.MultiIndex.from_frame(tail[keys]).isin(new_keys)]
+    
+    merged_tail = combine_mandi_data([tail, new_rows], by_location=len(keys) > 2)
+    
+    added = merged_tail[pd.MultiIndex.from_frame(merged_tail[keys]).isin(new_keys)]
+    merged = concat_frames([head, merged_tail], ignore_index=True)
+    
+    return merged, removed, added
+
+@timed
+def price_regression_stats(df: pd.DataFrame, keys: List[str] = ['product']) -> pd.DataFrame:
+    """
+    Compute per-series sufficient statistics for the price regression in one grouped pass
+    A series is a product, or a (product, location) pair when keys include the location
+    x is the number of days since the series' first observation, y is the price
+    """
     df = df.sort_values('date', ascending=True)
     
-    # Get unique products
-    products = df['product'].unique()
+    work = df[keys + ['date', 'price']].copy()
+    first_date = work.groupby(keys, sort=False, observed=True)['date'].transform('min')
+    work['x'] = (work['date'] - first_date).dt.days.astype('float64')
+    work['y'] = work['price'].astype('float64')
+    work['xy'] = work['x'] * work['y']
+    work['xx'] = work['x'] * work['x']
+    work['yy'] = work['y'] * work['y']
     
-    results = {}
+    # Series keep the order in which they first appear in the date-sorted data
+    stats = work.groupby(keys, sort=False, observed=True).agg(
+        n=('y', 'size'),
+        first_date=('date', 'min'),
+        last_date=('date', 'max'),
+        current_price=('y', 'last'),
+        sum_x=('x', 'sum'),
+        sum_y=('y', 'sum'),
+        sum_xy=('xy', 'sum'),
+        sum_xx=('xx', 'sum'),
+        sum_yy=('yy', 'sum')
+    )
+    stats.index = plain_index(stats.index)
     
-    for product in products:
-        product_data = df[df['product'] == product].copy()
-        product_data = product_data.sort_values('date')
-        
-        if len(product_data) < 3:  # Need at least 3 data points for trend
-            continue
-            
-        # Prepare data for modeling
-        product_data['date_numeric'] = (product_data['date'] - product_data['date'].min()).dt.days
-        X = product_data['date_numeric'].values.reshape(-1, 1)
-        y = product_data['price'].values
-        
-        # Fit linear regression model
-        model = LinearRegression()
-        model.fit(X, y)
-        
-        # Calculate trend direction
-        slope = model.coef_[0]
-        
-        # Calculate R-squared for model quality
-        r_squared = model.score(X, y)
-        
-        # Forecast future prices
-        last_date = product_data['date'].max()
-        future_dates = []
-        future_prices = []
+    return stats
+
+@timed
+def cube_price_stats(cube: ProductDayCube, rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """
+    Per-product regression statistics read from the price grid of the cube, matching
+    price_regression_stats of the product-level frame
+    rows limits the products to those cube rows, e.g. the ones an append touched
+    """
+    with cube.lock:
+        return _cube_price_stats(cube, rows)
+
+def _cube_price_stats(cube: ProductDayCube, rows: Optional[np.ndarray]) -> pd.DataFrame:
+    rows = np.arange(len(cube)) if rows is None else np.asarray(rows, dtype=np.int64)
+    sums = ['sum_x', 'sum_y', 'sum_xy', 'sum_xx', 'sum_yy']
+    columns = {name: [] for name in ['n', 'first', 'last', 'current_price'] + sums}
+    day = np.arange(cube.mandi_last + 1, dtype=np.float64)
+    if not len(day):
+        rows = rows[:0]
+    
+    # Row blocks bound the size of the temporaries
+    for block in row_blocks(len(rows), len(day)):
+        selected = rows[block]
+        if selected[-1] - selected[0] == len(selected) - 1:
+            # Consecutive rows, e.g. all products, are read as a view instead of gathered
+            selected = slice(int(selected[0]), int(selected[-1]) + 1)
+        observed = cube.has_price[selected, :len(day)]
+        prices = cube.price[selected, :len(day)]
+        n = observed.sum(axis=1)
+        first = observed.argmax(axis=1)
+        last = len(day) - 1 - observed[:, ::-1].argmax(axis=1)
+        x = np.where(observed, day - first[:, None], 0.0)
+        y = np.where(observed, prices, 0.0)
+        columns['n'].append(n)
+        columns['first'].append(first)
+        columns['last'].append(last)
+        columns['current_price'].append(prices[np.arange(len(last)), last])
+        columns['sum_x'].append(x.sum(axis=1))
+        columns['sum_y'].append(y.sum(axis=1))
+        columns['sum_xy'].append((x * y).sum(axis=1))
+        columns['sum_xx'].append((x * x).sum(axis=1))
+        columns['sum_yy'].append((y * y).sum(axis=1))
+    columns = {name: np.concatenate(parts) if parts else np.zeros(0) for name, parts in columns.items()}
+    
+    present = columns['n'] > 0
+    stats = pd.DataFrame({
+        'n': columns['n'][present].astype(np.int64),
+        'first_date': cube.dates(columns['first'][present]),
+        'last_date': cube.dates(columns['last'][present]),
+        'current_price': columns['current_price'][present],
+        **{name: columns[name][present] for name in sums}
+    }, index=cube.products(rows[present]))
+    return _first_seen_order(stats)
+
+def _first_seen_order(stats: pd.DataFrame) -> pd.DataFrame:
+    # Series in the order they first appear in the date-sorted data: by first date, then by key
+    # (product, then location), as price_regression_stats orders a rebuild
+    levels = [stats.index.get_level_values(level).to_numpy(dtype=str) for level in reversed(range(stats.index.nlevels))]
+    return stats.iloc[np.lexsort((*levels, stats['first_date'].to_numpy()))]
+
+@timed
+def update_cube_price_stats(stats: pd.DataFrame, cube: ProductDayCube, products) -> pd.DataFrame:
+    """
+    Recompute the statistics of the given products from the cube after their prices changed,
+    keeping those of all other products
+    """
+    with cube.lock:
+        fresh = _cube_price_stats(cube, cube.rows_of(products))
+    kept = stats[~stats.index.isin(fresh.index)]
+    return _first_seen_order(pd.concat([kept, fresh]))
+
+def _series_index(points: pd.DataFrame, keys: List[str]) -> pd.Index:
+    if len(keys) == 1:
+        return plain_index(pd.Index(points[keys[0]]))
+    return plain_index(pd.MultiIndex.from_frame(points[keys]))
+
+def _point_sums(points: pd.DataFrame, origin: pd.Series, sign: float, keys: List[str]) -> pd.DataFrame:
+    """
+    Per-series contribution of individual points to the regression sums
+    """
+    index = _series_index(points, keys)
+    x = (points['date'].to_numpy() - origin.reindex(index).to_numpy()) / np.timedelta64(1, 'D')
+    y = points['price'].to_numpy(dtype='float64')
+    terms = pd.DataFrame({
+        'n': sign,
+        'sum_x': sign * x,
+        'sum_y': sign * y,
+        'sum_xy': sign * x * y,
+        'sum_xx': sign * x * x,
+        'sum_yy': sign * y * y
+    }, index=index)
+    return terms.groupby(level=list(range(len(keys))), sort=False).sum()
+
+@timed
+def merge_price_stats(stats: pd.DataFrame, removed: pd.DataFrame, added: pd.DataFrame,
+                      keys: List[str] = ['product']) -> pd.DataFrame:
+    """
+    Fold changed points into running regression statistics
+    Points in removed are subtracted and points in added are included, so the cost is
+    proportional to the size of the delta rather than the full history
+    """
+    if added.empty:
+        return stats
+    
+    sum_cols = ['n', 'sum_x', 'sum_y', 'sum_xy', 'sum_xx', 'sum_yy']
+    added = added.sort_values('date')
+    
+    delta_first = added.groupby(keys, sort=False, observed=True)['date'].min()
+    delta_first.index = plain_index(delta_first.index)
+    new_series = delta_first.index.difference(stats.index, sort=False)
+    
+    stats = stats.reindex(stats.index.append(new_series))
+    stats[sum_cols] = stats[sum_cols].fillna(0)
+    
+    # Move the x origin of series that received earlier dates
+    old_first = stats.loc[delta_first.index, 'first_date']
+    origin = old_first.where(old_first <= delta_first, delta_first)
+    shift = (old_first - origin).dt.days.fillna(0).astype('float64')
+    n = stats.loc[origin.index, 'n']
+    sum_x = stats.loc[origin.index, 'sum_x']
+    stats.loc[origin.index, 'sum_xx'] += 2 * shift * sum_x + n * shift * shift
+    stats.loc[origin.index, 'sum_xy'] += shift * stats.loc[origin.index, 'sum_y']
+    stats.loc[origin.index, 'sum_x'] += n * shift
+    stats.loc[origin.index, 'first_date'] = origin
+    
+    # Replace the contribution of points whose daily mean changed
+    delta = _point_sums(added, origin, 1.0, keys)
+    if not removed.empty:
+        delta = delta.add(_point_sums(removed, origin, -1.0, keys), fill_value=0)
+    stats.loc[delta.index, sum_cols] += delta[sum_cols]
+    stats['n'] = stats['n'].round().astype('int64')
+    
+    # The latest point of each series decides its current price
+    latest = added.groupby(keys, sort=False, observed=True).agg(date=('date', 'max'), price=('price', 'last'))
+    latest.index = plain_index(latest.index)
+    old_last = stats.loc[latest.index, 'last_date']
+    newer = latest.index[~(old_last > latest['date'])]
+    stats.loc[newer, 'last_date'] = latest.loc[newer, 'date']
+    stats.loc[newer, 'current_price'] = latest.loc[newer, 'price']
+    
+    return _first_seen_order(stats)
+
+@timed
+def price_trends_from_stats(stats: pd.DataFrame, forecast_days: int = 7) -> Dict:
+    """
+    Derive slope, R-squared, volatility and forecasts for every product from the
+    sufficient statistics using the closed-form least squares solution
+    """
+    stats = stats[stats['n'] >= 3]  # Need at least 3 data points for trend
+    if stats.empty:
+        return {}
+    
+    n = stats['n'].to_numpy(dtype='float64')
+    sum_x = stats['sum_x'].to_numpy(dtype='float64')
+    sum_y = stats['sum_y'].to_numpy(dtype='float64')
+    
+    # Centered sums of squares and cross products
+    sxx = stats['sum_xx'].to_numpy(dtype='float64') - sum_x * sum_x / n
+    sxy = stats['sum_xy'].to_numpy(dtype='float64') - sum_x * sum_y / n
+    sum_yy = stats['sum_yy'].to_numpy(dtype='float64')
+    syy = sum_yy - sum_y * sum_y / n
+    # For a constant series the difference is rounding noise of the order of eps * sum_yy, not variance
+    syy = np.where(syy > np.finfo(np.float64).eps * n * sum_yy, syy, 0.0)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(sxx > 0, sxy / sxx, 0.0)
+        intercept = (sum_y - slope * sum_x) / n
         
-        for i in range(1, forecast_days + 1):
-            future_date = last_date + timedelta(days=i)
-            future_dates.append(future_date)
-            
-            future_X = np.array([[product_data['date_numeric'].max() + i]])
-            future_price = model.predict(future_X)[0]
-            future_prices.append(max(0, future_price))  # Ensure non-negative prices
+        # A constant series is fitted perfectly (R-squared of 1)
+        ss_res = np.maximum(syy - slope * sxy, 0)
+        r_squared = np.where(syy > 0, 1 - ss_res / syy, 1.0)
         
+        # Volatility is the population standard deviation of prices
+        avg_price = sum_y / n
+        volatility = np.sqrt(syy / n)
+        volatility_pct = np.where(avg_price > 0, volatility / avg_price * 100, 0.0)
+    
+    # Forecast the whole horizon for every product at once
+    steps = np.arange(1, forecast_days + 1)
+    last_date = stats['last_date'].to_numpy(dtype='datetime64[D]')
+    last_x = (last_date - stats['first_date'].to_numpy(dtype='datetime64[D]')).astype('float64')
+    future_prices = intercept[:, None] + slope[:, None] * (last_x[:, None] + steps)
+    future_prices = np.round(np.maximum(future_prices, 0), 2)  # Ensure non-negative prices
+    future_dates = np.datetime_as_string(last_date[:, None] + steps, unit='D')
+    
+    current_price = np.round(stats['current_price'].to_numpy(dtype='float64'), 2)
+    
+    results = {}
+    
+    for i, product in enumerate(stats.index):
         # Determine trend direction
-        if slope > 0.1:  # Rising trend (threshold can be adjusted)
-            trend_label = "Price likely to increase"
+        if slope[i] > TREND_SLOPE:  # Rising trend
             direction = "up"
-        elif slope < -0.1:  # Falling trend
-            trend_label = "Price likely to fall"
+        elif slope[i] < -TREND_SLOPE:  # Falling trend
             direction = "down"
         else:
-            trend_label = "Price stable"
             direction = "stable"
-        
-        # Calculate volatility (standard deviation of prices)
-        volatility = np.std(y)
-        avg_price = np.mean(y)
-        volatility_pct = (volatility / avg_price * 100) if avg_price > 0 else 0
+        trend_label = TREND_LABELS[direction]
         
         # Determine volatility level
-        if volatility_pct > 15:  # High volatility threshold
+        if volatility_pct[i] > 15:  # High volatility threshold
             volatility_label = "High volatility zone"
-        elif volatility_pct > 8:  # Medium volatility threshold
+        elif volatility_pct[i] > 8:  # Medium volatility threshold
             volatility_label = "Medium volatility"
         else:
             volatility_label = "Low volatility"
@@ -119,52 +349,119 @@ def calculate_price_trends(df: pd.DataFrame, forecast_days: int = 7) -> Dict:
         results[product] = {
             'trend_direction': direction,
             'trend_label': trend_label,
-            'slope': slope,
-            'r_squared': r_squared,
-            'volatility': volatility,
-            'volatility_percentage': round(volatility_pct, 2),
+            'slope': float(slope[i]),
+            'r_squared': float(r_squared[i]),
+            'volatility': float(volatility[i]),
+            'volatility_percentage': round(float(volatility_pct[i]), 2),
             'volatility_label': volatility_label,
-            'forecast_dates': [date.strftime('%Y-%m-%d') for date in future_dates],
-            'forecast_prices': [round(price, 2) for price in future_prices],
-            'current_price': round(y[-1], 2),
-            'avg_price': round(avg_price, 2)
+            'forecast_dates': future_dates[i].tolist(),
+            'forecast_prices': future_prices[i].tolist(),
+            'current_price': float(current_price[i]),
+            'avg_price': round(float(avg_price[i]), 2)
         }
     
     return results
 
+@timed
+def calculate_price_trends(df: pd.DataFrame, forecast_days: int = 7) -> Dict:
+    """
+    Calculate price trends and simple forecasts using linear regression
+    All products are fitted together from grouped sums instead of one model per product
+    """
+    if df.empty:
+        return {}
+    
+    return price_trends_from_stats(price_regression_stats(df), forecast_days)
+
+@timed
 def get_price_signals(df: pd.DataFrame) -> List[Dict]:
     """
     Generate price signals in human-readable format
     """
-    trends = calculate_price_trends(df)
-    signals = []
+    return price_signals_from_trends(calculate_price_trends(df))
+
+@timed
+def price_signals_from_trends(trends: Dict) -> List[Dict]:
+    """
+    Turn price trends into human-readable signals
+    """
+    return [_price_signal(product, data) for product, data in trends.items()]
+
+def _price_signal(product: str, data: Dict) -> Dict:
+    trend_label = data['trend_label']
+    volatility_label = data['volatility_label']
     
-    for product, data in trends.items():
-        trend_label = data['trend_label']
-        volatility_label = data['volatility_label']
-        
-        # Create signal based on trend and volatility
-        if data['trend_direction'] == 'up':
-            signal = f"{product} prices likely to increase"
-        elif data['trend_direction'] == 'down':
-            signal = f"{product} prices likely to fall"
-        else:
-            signal = f"{product} prices stable"
-        
-        # Add volatility information
-        if data['volatility_percentage'] > 15:
-            signal += f" (High volatility: {data['volatility_percentage']}%)"
-        elif data['volatility_percentage'] > 8:
-            signal += f" (Medium volatility: {data['volatility_percentage']}%)"
-        
-        signals.append({
-            'product': product,
-            'signal': signal,
-            'trend_label': trend_label,
-            'volatility_label': volatility_label,
-            'volatility_percentage': data['volatility_percentage'],
-            'current_price': data['current_price'],
-            'forecast_prices': data['forecast_prices'][:3]  # Show first 3 forecasted prices
-        })
+    # Create signal based on trend and volatility
+    if data['trend_direction'] == 'up':
+        signal = f"{product} prices likely to increase"
+    elif data['trend_direction'] == 'down':
+        signal = f"{product} prices likely to fall"
+    else:
+        signal = f"{product} prices stable"
+    
+    # Add volatility information
+    if data['volatility_percentage'] > 15:
+        signal += f" (High volatility: {data['volatility_percentage']}%)"
+    elif data['volatility_percentage'] > 8:
+        signal += f" (Medium volatility: {data['volatility_percentage']}%)"
     
-    return signals
\ No newline at end of file
+    return {
+        'product': product,
+        'signal': signal,
+        'trend_label': trend_label,
+        'volatility_label': volatility_label,
+        'volatility_percentage': data['volatility_percentage'],
+        'current_price': data['current_price'],
+        'forecast_prices': data['forecast_prices'][:3]  # Show first 3 forecasted prices
+    }
+
+@timed
+def location_price_signals(stats: pd.DataFrame) -> Dict[str, List[Dict]]:
+    """
+    Build per-mandi price signals from (product, location) statistics, indexed by location
+    so a single mandi can be served without scanning the others
+    """
+    index = {}
+    for (product, location), data in price_trends_from_stats(stats).items():
+        signal = _price_signal(product, data)
+        signal['location'] = location
+        index.setdefault(location, []).append(signal)
+    
+    return index
+
+@timed
+def calculate_price_spread(stats: pd.DataFrame) -> List[Dict]:
+    """
+    Spread of the latest quoted price across mandis for every product,
+    computed from (product, location) statistics
+    """
+    current = stats[['current_price', 'last_date']].reset_index().dropna(subset=['current_price'])
+    if current.empty:
+        return []
+    
+    grouped = current.groupby('product', sort=False)
+    spread = grouped['current_price'].agg(['size', 'min', 'max', 'mean'])
+    spread['std'] = grouped['current_price'].std(ddof=0)
+    spread['cheapest'] = current.loc[grouped['current_price'].idxmin(), 'location'].to_numpy()
+    spread['dearest'] = current.loc[grouped['current_price'].idxmax(), 'location'].to_numpy()
+    spread['as_of'] = grouped['last_date'].max().dt.strftime('%Y-%m-%d')
+    spread['range'] = spread['max'] - spread['min']
+    spread['range_pct'] = np.where(spread['mean'] > 0, spread['range'] / spread['mean'] * 100, 0.0)
+    spread = spread.sort_values('range_pct', ascending=False, kind='stable')
+    
+    return [
+        {
+            'product': product,
+            'mandis': int(row['size']),
+            'min_price': round(float(row['min']), 2),
+            'max_price': round(float(row['max']), 2),
+            'avg_price': round(float(row['mean']), 2),
+            'price_std': round(float(row['std']), 2),
+            'spread': round(float(row['range']), 2),
+            'spread_percentage': round(float(row['range_pct']), 2),
+            'cheapest_location': row['cheapest'],
+            'dearest_location': row['dearest'],
+            'as_of': row['as_of']
+        }
+        for product, row in spread.iterrows()
+    ]
@@ -0,0 +1,160 @@
+import numpy as np
+from typing import Dict, List, Optional
+from instrumentation import timed
+
+# Per-product scores, all ranked largest first: |demand change %|, |price slope| and volatility %
+SCORES = ("demand_change", "price_slope", "volatility")
+
+# Updates changing the score of more than this share of the products re-sort that score instead of merging
+MAX_MERGE_SHARE = 0.1
+
+def finite_or_none(value: float) -> Optional[float]:
+    # inf (demand from nothing) and NaN (no data) cannot be sent as JSON numbers
+    return float(value) if np.isfinite(value) else None
+
+def _sort_keys(values: np.ndarray) -> np.ndarray:
+    # Ascending keys of a descending order; products without the score come last
+    return np.where(np.isnan(values), np.inf, -values)
+
+def descending(values: np.ndarray) -> np.ndarray:
+    return np.argsort(_sort_keys(values), kind='stable')
+
+def merge_sorted(kept: np.ndarray, added: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """
+    Merge positions into positions already in (key, position) order, the order a stable
+    sort of keys gives, by binary search instead of sorting again
+    """
+    added = added[np.lexsort((added, keys[added]))]
+    kept_keys = keys[kept]
+    lo = np.searchsorted(kept_keys, keys[added], side='left')
+    hi = np.searchsorted(kept_keys, keys[added], side='right')
+    at = lo.copy()
+    for i in np.flatnonzero(hi > lo):
+        # Equal keys stay in position order
+        at[i] += np.searchsorted(kept[lo[i]:hi[i]], added[i])
+    return np.insert(kept, at, added)
+
+def _same(old: np.ndarray, new: np.ndarray) -> np.ndarray:
+    return (old == new) | (np.isnan(old) & np.isnan(new))
+
+class RankingIndex:
+    """
+    Per-product scores of one dataset version, with the products pre-sorted by every score
+    and by name, so top-K queries are a scan of an index instead of a sort per request
+    Built from the signals the running aggregates already produce; on a data change the
+    previous version's index is updated, re-placing only the products whose scores changed
+    """
+
+    def __init__(self, gap_analysis: List[Dict], demand_signals: List[Dict], price_trends: Dict):
+        self._set_scores(gap_analysis, demand_signals, price_trends)
+        self.order = {name: descending(values) for name, values in self.scores.items()}
+        self.by_name = np.argsort(self.products.astype(str), kind='stable')
+        self.sorted_names = self.products[self.by_name].astype(str)
+
+    def _set_scores(self, gap_analysis: List[Dict], demand_signals: List[Dict], price_trends: Dict):
+        self.items = gap_analysis
+        self.products = np.array([item['product'] for item in gap_analysis], dtype=object)
+        self.levels = np.array([item['signal_level'] for item in gap_analysis], dtype=object)
+
+        demand = {signal['product']: signal['change_percentage'] for signal in demand_signals}
+        missing = {}
+        self.change_percentage = np.array([demand.get(product, np.nan) for product in self.products], dtype=np.float64)
+        self.slope = np.array([price_trends.get(product, missing).get('slope', np.nan)
+                               for product in self.products], dtype=np.float64)
+        volatility = np.array([price_trends.get(product, missing).get('volatility_percentage', np.nan)
+                               for product in self.products], dtype=np.float64)
+
+        self.scores = {
+            "demand_change": np.abs(self.change_percentage),
+            "price_slope": np.abs(self.slope),
+            "volatility": volatility
+        }
+
+    @timed
+    def updated(self, gap_analysis: List[Dict], demand_signals: List[Dict], price_trends: Dict) -> "RankingIndex":
+        """
+        Index of the next dataset version with the same orders a full build gives
+        Products whose score is unchanged keep their place in this index's order; the changed,
+        new and removed ones are taken out and merged back by binary search, so an append that
+        touches a few products costs O(P + C log P) instead of a sort of every score
+        """
+        index = RankingIndex.__new__(RankingIndex)
+        index._set_scores(gap_analysis, demand_signals, price_trends)
+        # New position of every product of this index, -1 when it is gone
+        if len(index) == len(self) and np.array_equal(index.products, self.products):
+            remap = np.arange(len(self))
+        else:
+            positions = {product: i for i, product in enumerate(index.products.tolist())}
+            remap = np.array([positions.get(product, -1) for product in self.products.tolist()], dtype=np.int64)
+        kept = remap >= 0
+        if not np.all(np.diff(remap[kept]) > 0):
+            # Kept products were reordered, so ties would no longer be in position order
+            return RankingIndex(gap_analysis, demand_signals, price_trends)
+        present = np.zeros(len(index), dtype=bool)
+        present[remap[kept]] = True
+        new = np.flatnonzero(~present)
+
+        index.order = {}
+        for name, values in index.scores.items():
+            same = kept.copy()
+            same[kept] = _same(self.scores[name][kept], values[remap[kept]])
+            added = np.concatenate([remap[kept & ~same], new])
+            if len(added) > MAX_MERGE_SHARE * len(index):
+                index.order[name] = descending(values)
+                continue
+            order = self.order[name]
+            index.order[name] = merge_sorted(remap[order[same[order]]], added, _sort_keys(values))
+
+        names = index.products.astype(str)
+        index.by_name = merge_sorted(remap[self.by_name[kept[self.by_name]]], new, names)
+        index.sorted_names = names[index.by_name]
+        return index
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def _prefix_mask(self, prefix: str) -> np.ndarray:
+        # Names sharing a prefix are one contiguous range of the sorted names
+        lo = np.searchsorted(self.sorted_names, prefix, side='left')
+        hi = np.searchsorted(self.sorted_names, prefix + "\U0010ffff", side='left')
+        mask = np.zeros(len(self.products), dtype=bool)
+        mask[self.by_name[lo:hi]] = True
+        return mask
+
+    @timed
+    def top(self, k: int, by: str = "demand_change", signal_level: Optional[str] = None,
+            prefix: Optional[str] = None, minimums: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """
+        Positions of the k products with the largest score that pass the filters, best first
+        minimums maps score names to the smallest score accepted
+        """
+        mask = None
+        conditions = []
+        if prefix:
+            conditions.append(self._prefix_mask(prefix))
+        if signal_level is not None:
+            conditions.append(self.levels == signal_level)
+        for name, minimum in (minimums or {}).items():
+            if minimum is not None:
+                conditions.append(self.scores[name] >= minimum)
+        for condition in conditions:
+            mask = condition if mask is None else mask & condition
+
+        order = self.order[by]
+        if mask is not None:
+            order = order[mask[order]]
+        return order[:k]
+
+    def records(self, positions: np.ndarray) -> List[Dict]:
+        return [
+            {
+                'rank': rank,
+                'product': self.products[i],
+                'signal_level': self.levels[i],
+                'demand_change_percentage': finite_or_none(self.change_percentage[i]),
+                'price_slope': finite_or_none(self.slope[i]),
+                'volatility_percentage': finite_or_none(self.scores['volatility'][i]),
+                'recommendation': self.items[i]['recommendation']
+            }
+            for rank, i in enumerate(positions, start=1)
+        ]
@@ -1,12 +1,51 @@
-from typing import Dict, List
+import heapq
+from typing import Dict, List, Optional
 from datetime import datetime, timedelta
+from instrumentation import timed
 
+# Demand change, in percent either way, that raises a demand alert
+DEMAND_ALERT_PCT = 15
+
+# Signal level of the demand and price alerts per state
+DEMAND_ALERT_LEVELS = {'rising': 'opportunity', 'falling': 'risk'}
+PRICE_ALERT_LEVELS = {'rising': 'watch', 'falling': 'risk'}
+
+def alert_id(product: str, rule: str, state: str) -> str:
+    """
+    Stable identity of an alert: the same product, rule and signal state give the same id
+    on every run, so alerts can be diffed between dataset versions
+    """
+    return f"{rule}:{state}:{product}"
+
+def price_alert_state(trend_label: str) -> Optional[str]:
+    # Price alerts follow the forecast wording of the trend label
+    if 'likely to increase' in trend_label.lower():
+        return 'rising'
+    if 'likely to fall' in trend_label.lower():
+        return 'falling'
+    return None
+
+def make_alert(product: str, rule: str, state: str, alert_type: str, message: str,
+               signal_level: str, timestamp: str) -> Dict:
+    return {
+        'id': alert_id(product, rule, state),
+        'product': product,
+        'rule': rule,
+        'type': alert_type,
+        'message': message,
+        'timestamp': timestamp,
+        'signal_level': signal_level
+    }
+
+@timed
 def generate_alerts_and_recommendations(gap_analysis: List[Dict], demand_signals: List[Dict], price_signals: List[Dict]) -> Dict:
     """
     Generate alerts and recommendations based on gap analysis and signals
     """
     alerts = []
     recommendations = []
+    # One timestamp per run; AlertFeed replaces it with the time an alert was first raised
+    now = datetime.now().isoformat()
     
     # Process each product's gap analysis
     for item in gap_analysis:
@@ -25,13 +64,7 @@ def generate_alerts_and_recommendations(gap_analysis: List[Dict], demand_signals
             alert_type = 'info'
             alert_message = f"ℹ️ Monitoring {product}. {recommendation}"
         
-        alerts.append({
-            'product': product,
-            'type': alert_type,
-            'message': alert_message,
-            'timestamp': datetime.now().isoformat(),
-            'signal_level': signal_level
-        })
+        alerts.append(make_alert(product, 'gap', signal_level, alert_type, alert_message, signal_level, now))
         
         # Add to recommendations
         recommendations.append({
@@ -46,44 +79,34 @@ def generate_alerts_and_recommendations(gap_analysis: List[Dict], demand_signals
         product = demand_signal['product']
         change_pct = demand_signal['change_percentage']
         
-        if abs(change_pct) > 15:  # Significant change threshold
+        if abs(change_pct) > DEMAND_ALERT_PCT:  # Significant change threshold
             if change_pct > 0:
-                alerts.append({
-                    'product': product,
-                    'type': 'success',
-                    'message': f"✅ {product} demand sharply rising ({change_pct}%). Consider procuring more.",
-                    'timestamp': datetime.now().isoformat(),
-                    'signal_level': 'opportunity'
-                })
+                alerts.append(make_alert(
+                    product, 'demand', 'rising', 'success',
+                    f"✅ {product} demand sharply rising ({change_pct}%). Consider procuring more.",
+                    DEMAND_ALERT_LEVELS['rising'], now
+                ))
             else:
-                alerts.append({
-                    'product': product,
-                    'type': 'warning',
-                    'message': f"⚠️ {product} demand sharply falling ({change_pct}%). Consider selling excess inventory.",
-                    'timestamp': datetime.now().isoformat(),
-                    'signal_level': 'risk'
-                })
+                alerts.append(make_alert(
+                    product, 'demand', 'falling', 'warning',
+                    f"⚠️ {product} demand sharply falling ({change_pct}%). Consider selling excess inventory.",
+                    DEMAND_ALERT_LEVELS['falling'], now
+                ))
     
     for price_signal in price_signals:
         product = price_signal['product']
-        trend_label = price_signal['trend_label']
+        state = price_alert_state(price_signal['trend_label'])
         
-        if 'likely to increase' in trend_label.lower():
-            alerts.append({
-                'product': product,
-                'type': 'info',
-                'message': f"📈 {product} prices expected to rise. Consider holding stock.",
-                'timestamp': datetime.now().isoformat(),
-                'signal_level': 'watch'
-            })
-        elif 'likely to fall' in trend_label.lower():
-            alerts.append({
-                'product': product,
-                'type': 'warning',
-                'message': f"📉 {product} prices expected to fall. Consider selling before drop.",
-                'timestamp': datetime.now().isoformat(),
-                'signal_level': 'risk'
-            })
+        if state == 'rising':
+            alerts.append(make_alert(
+                product, 'price', 'rising', 'info',
+                f"📈 {product} prices expected to rise. Consider holding stock.", PRICE_ALERT_LEVELS['rising'], now
+            ))
+        elif state == 'falling':
+            alerts.append(make_alert(
+                product, 'price', 'falling', 'warning',
+                f"📉 {product} prices expected to fall. Consider selling before drop.", PRICE_ALERT_LEVELS['falling'], now
+            ))
     
     # Sort alerts by priority (risk first, then opportunity, then watch)
     priority_order = {'risk': 0, 'opportunity': 1, 'watch': 2}
@@ -139,27 +162,34 @@ def generate_mock_sms_alerts(alerts: List[Dict], max_count: int = 5) -> List[str
     
     return sms_alerts
 
-def get_actionable_insights(gap_analysis: List[Dict], demand_signals: List[Dict], price_signals: List[Dict]) -> Dict:
+@timed
+def get_actionable_insights(gap_analysis: List[Dict], demand_signals: List[Dict], price_signals: List[Dict],
+                            k: int = 3) -> Dict:
     """
     Get the most actionable insights from the analysis
+    Opportunities and risks are ranked by the magnitude of their demand change; only the
+    top k are selected (with a heap) instead of sorting every product
     """
+    demand_change = {ds['product']: abs(ds['change_percentage']) for ds in demand_signals}
+    
+    def magnitude(item: Dict) -> float:
+        return demand_change.get(item['product'], 0)
+    
     # Find top opportunities
-    opportunities = [item for item in gap_analysis if item['signal_level'] == 'opportunity']
-    opportunities.sort(key=lambda x: abs(x.get('demand_signal_obj', {}).get('change_percentage', 0)), reverse=True)
+    opportunities = heapq.nlargest(k, (item for item in gap_analysis if item['signal_level'] == 'opportunity'), key=magnitude)
     
     # Find highest risks
-    risks = [item for item in gap_analysis if item['signal_level'] == 'risk']
-    risks.sort(key=lambda x: abs(x.get('demand_signal_obj', {}).get('change_percentage', 0)), reverse=True)
+    risks = heapq.nlargest(k, (item for item in gap_analysis if item['signal_level'] == 'risk'), key=magnitude)
     
     # Find fastest changing demands
-    demand_changes = [(ds['product'], ds['change_percentage']) for ds in demand_signals]
-    demand_changes.sort(key=lambda x: abs(x[1]), reverse=True)
+    demand_changes = heapq.nlargest(k, ((ds['product'], ds['change_percentage']) for ds in demand_signals),
+                                    key=lambda x: abs(x[1]))
     
     return {
-        'top_opportunities': opportunities[:3],
-        'top_risks': risks[:3],
-        'fastest_changing_demands': demand_changes[:3],
-        'immediate_actions': generate_immediate_actions(opportunities[:3], risks[:3])
+        'top_opportunities': opportunities,
+        'top_risks': risks,
+        'fastest_changing_demands': demand_changes,
+        'immediate_actions': generate_immediate_actions(opportunities, risks)
     }
 
 def generate_immediate_actions(opportunities: List[Dict], risks: List[Dict]) -> List[str]:
@@ -0,0 +1,260 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+from instrumentation import timed
+from gap_analyzer import RULES, RuleTable, SignalLevel, price_direction_from_label, summary_from_counts
+from price_engine import TREND_SLOPE, TREND_LABELS
+from recommendation_engine import (
+    DEMAND_ALERT_PCT, DEMAND_ALERT_LEVELS, PRICE_ALERT_LEVELS, calculate_confidence_score, price_alert_state
+)
+from forecasting import MODELS, ModelCache, SeriesSet, fitted_params
+from ranking import finite_or_none
+
+# Demand direction of every demand code; products without demand data are classified as stable
+DEMAND_DIRECTIONS = ("up", "down", "stable")
+STABLE_DEMAND = 2
+
+# Price trend label of every price code; the last code marks products without price data
+PRICE_LABELS = (TREND_LABELS["up"], TREND_LABELS["down"], TREND_LABELS["stable"], None)
+NO_PRICE = 3
+
+# Alerts and gap signals are counted per signal level, in this order
+LEVELS = tuple(level.value for level in SignalLevel)
+
+def rule_grid(rules: RuleTable) -> np.ndarray:
+    """
+    Rule position of every (demand code, price code) pair, resolved through the rule table
+    and price_direction_from_label as the live gap analysis resolves them
+    """
+    price_directions = [price_direction_from_label(label or "") for label in PRICE_LABELS]
+    demand = np.repeat(np.array(DEMAND_DIRECTIONS, dtype=object), len(PRICE_LABELS))
+    price = np.tile(np.array(price_directions, dtype=object), len(DEMAND_DIRECTIONS))
+    return rules.lookup(demand, price).reshape(len(DEMAND_DIRECTIONS), len(PRICE_LABELS))
+
+def _level_codes(levels: np.ndarray) -> np.ndarray:
+    return np.array([LEVELS.index(level) for level in levels], dtype=np.int64)
+
+def demand_change(current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    # Change of the recent period over the previous one, as demand_trends_from_totals computes it
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(previous > 0, (current - previous) / previous * 100, np.where(current > 0, np.inf, 0.0))
+
+@timed
+def evaluate_cells(cells: Dict[str, np.ndarray], rules: Optional[RuleTable] = None) -> Dict[str, np.ndarray]:
+    """
+    Classify (scenario, product) cells from their demand totals and price slope: the gap rule
+    position, the reported demand change, the price code and the signal level code of the gap,
+    demand and price alert of every cell (-1 where a cell raises no such alert)
+    """
+    rules = RULES if rules is None else rules
+    change = demand_change(cells['current'], cells['previous'])
+    demand = np.where(change > 0, 0, np.where(change < 0, 1, STABLE_DEMAND))
+    demand = np.where(cells['has_demand'], demand, STABLE_DEMAND)
+    slope = cells['slope']
+    price = np.where(slope > TREND_SLOPE, 0, np.where(slope < -TREND_SLOPE, 1, 2))
+    price = np.where(cells['has_price'], price, NO_PRICE)
+    positions = rule_grid(rules)[demand, price]
+    change = np.round(change, 2)
+
+    # Alert levels per code, looked up with the same rules generate_alerts_and_recommendations applies
+    rising, falling = LEVELS.index(DEMAND_ALERT_LEVELS['rising']), LEVELS.index(DEMAND_ALERT_LEVELS['falling'])
+    demand_alert = np.where(change > 0, rising, falling)
+    demand_alert = np.where(cells['has_demand'] & (np.abs(change) > DEMAND_ALERT_PCT), demand_alert, -1)
+    states = [price_alert_state(label) if label else None for label in PRICE_LABELS]
+    price_alert = np.array([LEVELS.index(PRICE_ALERT_LEVELS[state]) if state else -1 for state in states])[price]
+
+    return {
+        'position': positions,
+        'change': change,
+        'price': price,
+        'alerts': np.column_stack([_level_codes(rules.levels)[positions], demand_alert, price_alert])
+    }
+
+def _level_counts(groups: np.ndarray, codes: np.ndarray, n_groups: int) -> np.ndarray:
+    # (group x level) counts of the level codes of every cell, one or more per cell, skipping -1
+    codes = codes if codes.ndim == 2 else codes[:, None]
+    groups = np.repeat(groups, codes.shape[1])
+    codes = codes.ravel()
+    keep = codes >= 0
+    return np.bincount(groups[keep] * len(LEVELS) + codes[keep], minlength=n_groups * len(LEVELS)).reshape(n_groups, len(LEVELS))
+
+def alerts_summary(counts: np.ndarray) -> Dict:
+    by_level = dict(zip(LEVELS, counts.tolist()))
+    return {
+        'total_alerts': int(counts.sum()),
+        'opportunity_alerts': by_level['opportunity'],
+        'risk_alerts': by_level['risk'],
+        'watch_alerts': by_level['watch']
+    }
+
+class ScenarioBase:
+    """
+    The inputs of the live gap analysis of one dataset version as arrays in gap order (recent
+    and previous demand totals, price slope and current price), with every product's live
+    classification; scenarios are evaluated against it by recomputing only the products they perturb
+    """
+
+    def __init__(self, gap_analysis: List[Dict], totals: pd.DataFrame, price_trends: Dict, series: SeriesSet):
+        self.items = gap_analysis
+        self.products = np.array([item['product'] for item in gap_analysis], dtype=object)
+        self.rows = {product: i for i, product in enumerate(self.products.tolist())}
+
+        totals = totals.reindex(pd.Index(self.products, dtype=object))
+        self.has_demand = totals['current_period_total'].notna().to_numpy()
+        self.current = totals['current_period_total'].fillna(0).to_numpy(dtype=np.float64)
+        self.previous = totals['previous_period_total'].fillna(0).to_numpy(dtype=np.float64)
+
+        missing = {}
+        trends = [price_trends.get(product, missing) for product in self.products.tolist()]
+        self.has_price = np.array([bool(trend) for trend in trends], dtype=bool)
+        self.slope = np.array([trend.get('slope', 0.0) for trend in trends], dtype=np.float64)
+        self.current_price = np.array([trend.get('current_price', 0.0) for trend in trends], dtype=np.float64)
+
+        # Product-level price series of every product, -1 without one, for model-driven prices
+        self.series = series
+        series_rows = {product: i for i, (product, _) in enumerate(series.keys)}
+        self.series_rows = np.array([series_rows.get(product, -1) for product in self.products.tolist()], dtype=np.int64)
+
+        self.confidence = np.array([calculate_confidence_score(item) for item in gap_analysis], dtype=np.float64)
+        self.levels = np.array([item['signal_level'] for item in gap_analysis], dtype=object)
+        self.level_codes = _level_codes(self.levels)
+        self.recommendations = np.array([item['recommendation'] for item in gap_analysis], dtype=object)
+
+        evaluated = evaluate_cells(self.cells(np.arange(len(self.products))))
+        self.alerts = evaluated['alerts']
+        whole = np.zeros(len(self.products), dtype=np.int64)
+        self.level_counts = _level_counts(whole, self.level_codes, 1)[0]
+        self.alert_counts = _level_counts(whole, self.alerts, 1)[0]
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def cells(self, rows: np.ndarray) -> Dict[str, np.ndarray]:
+        # Copies of the inputs of the given products only
+        return {
+            'current': self.current[rows],
+            'previous': self.previous[rows],
+            'has_demand': self.has_demand[rows],
+            'slope': self.slope[rows],
+            'has_price': self.has_price[rows]
+        }
+
+    def rows_of(self, products: Optional[List[str]]) -> np.ndarray:
+        """
+        Gap positions of the given known products in gap order, all products without a list
+        """
+        if products is None:
+            return np.arange(len(self.products))
+        return np.unique(np.array([self.rows[product] for product in products if product in self.rows], dtype=np.int64))
+
+    def forecast_end(self, model: str, horizon: int, rows: np.ndarray, cache: Optional[ModelCache]) -> np.ndarray:
+        """
+        Price the model forecasts at the end of the horizon for the given products, NaN for
+        products whose series is too short to fit; fits come from the namespace's model cache
+        """
+        forecaster = MODELS[model]
+        series_rows = self.series_rows[rows]
+        has_series = series_rows >= 0
+        eligible = np.flatnonzero(has_series)
+        eligible = eligible[self.series.recent_counts[series_rows[eligible]] >= forecaster.min_points]
+        end = np.full(len(rows), np.nan)
+        if len(eligible):
+            prices = forecaster.predict(fitted_params(self.series, forecaster, cache, series_rows[eligible]), horizon)
+            end[eligible] = np.maximum(prices[:, horizon - 1], 0)  # Ensure non-negative prices
+        return end
+
+@timed
+def scenario_cells(base: ScenarioBase, specs: List[Dict], cache: Optional[ModelCache] = None) -> Dict[str, np.ndarray]:
+    """
+    One cell per product a scenario perturbs, holding copies of that product's inputs with
+    the scenario applied: the recent demand total scaled by demand_change, and the price
+    slope set to reach, over the horizon, the price_model forecast (or the current trend)
+    moved by price_change
+    """
+    selected = [base.rows_of(spec['products']) for spec in specs]
+
+    # Every model forecast is fitted once, over all the products the scenarios using it perturb
+    forecasts = {}
+    for spec, rows in zip(specs, selected):
+        if spec['price_model'] is not None:
+            forecasts.setdefault((spec['price_model'], spec['horizon']), []).append(rows)
+    for (model, horizon), parts in forecasts.items():
+        rows = np.unique(np.concatenate(parts))
+        end = np.full(len(base), np.nan)
+        end[rows] = base.forecast_end(model, horizon, rows, cache)
+        forecasts[model, horizon] = end
+
+    parts = []
+    for i, (spec, rows) in enumerate(zip(specs, selected)):
+        cells = base.cells(rows)
+        if spec['demand_change']:
+            cells['current'] *= 1 + spec['demand_change'] / 100
+        if spec['price_model'] is not None or spec['price_change']:
+            horizon = spec['horizon']
+            current_price = base.current_price[rows]
+            end = current_price + cells['slope'] * horizon
+            if spec['price_model'] is not None:
+                forecast = forecasts[spec['price_model'], horizon][rows]
+                end = np.where(np.isnan(forecast), end, forecast)
+            end = end * (1 + spec['price_change'] / 100)
+            cells['slope'] = (end - current_price) / horizon
+        cells['scenario'] = np.full(len(rows), i, dtype=np.int64)
+        cells['row'] = rows
+        parts.append(cells)
+    return {name: np.concatenate([cells[name] for cells in parts]) for name in parts[0]}
+
+@timed
+def scenario_results(base: ScenarioBase, specs: List[Dict], cells: Dict[str, np.ndarray],
+                     evaluated: Dict[str, np.ndarray], rules: Optional[RuleTable] = None) -> Dict:
+    """
+    Gap and alert summaries per scenario, with the products whose recommendation changed
+    Counts start from the live ones and swap the perturbed products' live contribution for
+    their scenario one, so unperturbed products are never revisited
+    """
+    rules = RULES if rules is None else rules
+    n = len(specs)
+    scenario, rows = cells['scenario'], cells['row']
+    positions = evaluated['position']
+    levels = rules.levels[positions]
+    recommendations = rules.recommendations[positions]
+
+    level_counts = (base.level_counts + _level_counts(scenario, _level_codes(rules.levels)[positions], n)
+                    - _level_counts(scenario, base.level_codes[rows], n))
+    alert_counts = (base.alert_counts + _level_counts(scenario, evaluated['alerts'], n)
+                    - _level_counts(scenario, base.alerts[rows], n))
+
+    changed = np.flatnonzero((levels != base.levels[rows]) | (recommendations != base.recommendations[rows]))
+    bounds = np.searchsorted(scenario[changed], np.arange(n + 1))
+    changes, price = evaluated['change'], evaluated['price']
+
+    results = []
+    for i, spec in enumerate(specs):
+        records = []
+        for cell in changed[bounds[i]:bounds[i + 1]].tolist():
+            row = rows[cell]
+            records.append({
+                'product': base.products[row],
+                'action': recommendations[cell],
+                'priority': levels[cell],
+                'confidence': float(base.confidence[row]),
+                'base_action': base.recommendations[row],
+                'base_priority': base.levels[row],
+                'demand_change_percentage': finite_or_none(changes[cell]) if base.has_demand[row] else None,
+                'price_trend': PRICE_LABELS[price[cell]]
+            })
+        results.append({
+            'name': spec['name'],
+            'perturbed_products': int(np.count_nonzero(scenario == i)),
+            'summary': summary_from_counts(dict(zip(LEVELS, level_counts[i].tolist())), len(base)),
+            'alerts_summary': alerts_summary(alert_counts[i]),
+            'changed_recommendations': records,
+            'changed_count': len(records)
+        })
+    return {
+        'base': {
+            'summary': summary_from_counts(dict(zip(LEVELS, base.level_counts.tolist())), len(base)),
+            'alerts_summary': alerts_summary(base.alert_counts)
+        },
+        'scenarios': results,
+        'count': n
+    }
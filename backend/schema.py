@@ -0,0 +1,203 @@
+import csv
+import io
+import os
+import threading
+import pandas as pd
+from datetime import datetime
+from typing import BinaryIO, Dict, List, Optional, Sequence, Tuple
+from frames import COMPACT
+
+# Bytes read from the start of an upload to find its header and sample its dates
+SNIFF_BYTES = 64 * 1024
+
+# Resolved headers remembered per schema; feeds from one source repeat the same header
+RESOLUTION_CACHE = int(os.environ.get("AGRIS_SCHEMA_CACHE", "256"))
+
+# Date formats tried, in order, when pinning the format of a feed; other feeds are inferred
+DATE_FORMATS = [
+    "%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%m-%d-%Y", "%d-%m-%Y", "%Y/%m/%d",
+    "%d-%b-%Y", "%d %b %Y", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"
+]
+
+def detect_date_format(values: Sequence) -> Optional[str]:
+    """
+    The first known format that parses every sampled value, or None to let pandas infer
+    A sample that fits both month-first and day-first is read month-first, as pandas infers it
+    """
+    sample = [str(value).strip() for value in values if isinstance(value, str) and value.strip()]
+    if not sample:
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            for value in sample:
+                datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return fmt
+    return None
+
+def parse_dates(values: pd.Series, fmt: Optional[str]) -> pd.Series:
+    """
+    Parse a date column with a pinned format, falling back to inference for values that
+    do not match it (e.g. a feed that switches format part way)
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    if fmt is not None:
+        try:
+            return pd.to_datetime(values, format=fmt)
+        except (ValueError, TypeError):
+            pass
+    return pd.to_datetime(values)
+
+def sniff_csv(source: BinaryIO) -> Tuple[List[str], List[List[str]]]:
+    """
+    Header and leading rows of a CSV file object, leaving its position unchanged
+    """
+    position = source.tell()
+    head = source.read(SNIFF_BYTES)
+    source.seek(position)
+    text = head.decode("utf-8", errors="ignore") if isinstance(head, bytes) else head
+    if len(head) == SNIFF_BYTES:
+        # Drop the row cut off at the end of the sample
+        text = text[:text.rfind("\n") + 1]
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        return [], []
+    return rows[0], rows[1:]
+
+class Resolution:
+    """
+    How one header maps onto a schema: the renames to standard names, the source columns
+    the engines use, and the date format pinned from a sample of the feed
+    """
+
+    def __init__(self, header: Tuple[str, ...], renames: Dict[str, str], date_format: Optional[str]):
+        self.header = header
+        self.renames = renames
+        # Source column of every standard column present
+        self.sources = {standard: source for source, standard in renames.items()}
+        for column in header:
+            if column not in renames:
+                self.sources.setdefault(column, column)
+        self.date_format = date_format
+
+class Schema:
+    """
+    Standard columns of a feed and the aliases each is recognised by, matched case-insensitively
+    Resolved headers are cached, so repeated feeds with the same header skip resolution
+    """
+
+    def __init__(self, name: str, aliases: Dict[str, List[str]], dtypes: Optional[Dict[str, str]] = None,
+                 keys: Sequence[str] = (), date_column: str = "date"):
+        self.name = name
+        # Aliases in order of preference; a column already named like the standard one always wins
+        self.aliases = {standard: [alias.lower() for alias in [standard] + names] for standard, names in aliases.items()}
+        self.dtypes = dtypes or {}
+        # Name columns read as categoricals when the raw rows are not kept
+        self.keys = list(keys)
+        self.date_column = date_column
+        self._resolved = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _renames(self, header: Tuple[str, ...]) -> Dict[str, str]:
+        by_name = {}
+        for column in header:
+            by_name.setdefault(str(column).strip().lower(), column)
+        renames = {}
+        for standard, aliases in self.aliases.items():
+            if standard in header:
+                continue
+            for alias in aliases:
+                source = by_name.get(alias)
+                if source is not None and source not in renames and source not in self.aliases:
+                    renames[source] = standard
+                    break
+        return renames
+
+    def resolve(self, header: Sequence[str], date_sample: Sequence = ()) -> Resolution:
+        """
+        Resolution of a header, from the cache when this header was seen before
+        A cached date format is kept while it still parses the new sample
+        """
+        header = tuple(header)
+        with self._lock:
+            resolution = self._resolved.get(header)
+            if resolution is not None:
+                self.hits += 1
+                # Most recently used last, so the oldest header is dropped first
+                self._resolved[header] = self._resolved.pop(header)
+            else:
+                self.misses += 1
+        if resolution is not None and (not date_sample or _fits(date_sample, resolution.date_format)):
+            return resolution
+
+        renames = self._renames(header) if resolution is None else resolution.renames
+        resolution = Resolution(header, renames, detect_date_format(date_sample))
+        with self._lock:
+            self._resolved[header] = resolution
+            while len(self._resolved) > RESOLUTION_CACHE:
+                self._resolved.pop(next(iter(self._resolved)))
+        return resolution
+
+    def resolve_sample(self, header: List[str], rows: List[List[str]]) -> Resolution:
+        # Date values of the sampled rows, found through the renames of the header
+        resolution = self.resolve(header)
+        source = resolution.sources.get(self.date_column)
+        if source is None or source not in header:
+            return resolution
+        index = header.index(source)
+        return self.resolve(header, [row[index] for row in rows if len(row) > index])
+
+    def read_options(self, resolution: Resolution, keep_raw: bool) -> Dict:
+        """
+        pd.read_csv arguments for a resolved feed
+        When raw rows are kept they are read as uploaded; otherwise only the columns the
+        engines use are read, with explicit dtypes and the pinned date format
+        """
+        if keep_raw:
+            return {}
+        used = [resolution.sources[standard] for standard in self.aliases if standard in resolution.sources]
+        if not used:
+            return {}
+        dtypes = {resolution.sources[standard]: dtype for standard, dtype in self.dtypes.items()
+                  if standard in resolution.sources}
+        if COMPACT:
+            dtypes.update({resolution.sources[key]: "category" for key in self.keys if key in resolution.sources})
+        options = {"usecols": used, "dtype": dtypes}
+        date_source = resolution.sources.get(self.date_column)
+        if date_source is not None and resolution.date_format is not None:
+            options["parse_dates"] = [date_source]
+            options["date_format"] = resolution.date_format
+        return options
+
+    def normalize(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Rename a frame's columns to the standard names in one pass and parse its dates
+        """
+        resolution = self.resolve(df.columns)
+        if resolution.renames:
+            df = df.rename(columns=resolution.renames)
+        if self.date_column in df.columns:
+            fmt = resolution.date_format
+            if fmt is None and not pd.api.types.is_datetime64_any_dtype(df[self.date_column]):
+                fmt = detect_date_format(df[self.date_column].head(100).tolist())
+            df[self.date_column] = parse_dates(df[self.date_column], fmt)
+        return df
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'headers': len(self._resolved), 'hits': self.hits, 'misses': self.misses}
+
+def _fits(values: Sequence, fmt: Optional[str]) -> bool:
+    if fmt is None:
+        return detect_date_format(values) is None
+    try:
+        for value in values:
+            if isinstance(value, str) and value.strip():
+                datetime.strptime(value.strip(), fmt)
+    except ValueError:
+        return False
+    return True
@@ -0,0 +1,20 @@
+import re
+
+# Settings the API layer needs while declaring its routes, kept free of pandas and numpy
+# so the server can start and answer health checks before the engines are imported
+
+# Namespace served by the routes without a /datasets/{name} prefix; persisted at the store root
+DEFAULT_DATASET = "default"
+
+DATASET_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Largest k served by ranked queries
+MAX_TOP_K = 1000
+
+# Longest forecast horizon served, in days
+MAX_HORIZON = 90
+
+DEFAULT_MODEL = "linear"
+
+# Most scenarios evaluated per what-if request
+MAX_SCENARIOS = 100
@@ -0,0 +1,119 @@
+import os
+import shutil
+import pandas as pd
+from typing import List, Optional
+from frames import KEY_COLUMNS, compact_keys
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+except ImportError:  # The on-disk store is optional
+    pa = None
+
+# Processed datasets are written here as Parquet, partitioned by product and month
+STORE_DIR = os.environ.get(
+    "AGRIS_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "store")
+)
+
+PARTITION_COLUMNS = ["product", "month"]
+
+def store_enabled() -> bool:
+    return pa is not None and bool(STORE_DIR)
+
+def _dataset_path(kind: str, root: Optional[str] = None) -> str:
+    return os.path.join(root or STORE_DIR, kind)
+
+def _partitioning():
+    return ds.partitioning(
+        pa.schema([("product", pa.string()), ("month", pa.string())]),
+        flavor="hive"
+    )
+
+def _with_month(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df['product'] = df['product'].astype(str)
+    df['month'] = df['date'].dt.strftime('%Y-%m')
+    return df
+
+def save_processed(kind: str, df: pd.DataFrame, changed: Optional[pd.DataFrame] = None, root: Optional[str] = None):
+    """
+    Write a processed (date, product) frame to the columnar store
+    When changed rows are given only the product/month partitions they touch are rewritten,
+    otherwise the whole dataset is replaced
+    """
+    if not store_enabled():
+        return
+
+    path = _dataset_path(kind, root)
+
+    if changed is None:
+        shutil.rmtree(path, ignore_errors=True)
+        rows = _with_month(df)
+    else:
+        touched = _with_month(changed)[PARTITION_COLUMNS].drop_duplicates()
+        rows = _with_month(df).merge(touched, on=PARTITION_COLUMNS, how='inner')
+
+    if rows.empty:
+        return
+
+    ds.write_dataset(
+        pa.Table.from_pandas(rows, preserve_index=False),
+        path,
+        format="parquet",
+        partitioning=_partitioning(),
+        existing_data_behavior="delete_matching",
+        max_partitions=1_000_000,
+        max_open_files=512,
+        basename_template="part-{i}.parquet"
+    )
+
+def load_processed(kind: str, products: Optional[List[str]] = None,
+                   start: Optional[pd.Timestamp] = None, end: Optional[pd.Timestamp] = None,
+                   root: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """
+    Load a processed frame back from the store, memory-mapping the Parquet files
+    Product and date filters prune partitions so only the ones needed are read
+    """
+    if not store_enabled():
+        return None
+
+    path = _dataset_path(kind, root)
+    if not os.path.isdir(path):
+        return None
+
+    dataset = ds.dataset(
+        path,
+        format="parquet",
+        partitioning=_partitioning(),
+        filesystem=pafs.LocalFileSystem(use_mmap=True)
+    )
+
+    condition = None
+    def add(expression):
+        nonlocal condition
+        condition = expression if condition is None else condition & expression
+
+    if products is not None:
+        add(ds.field("product").isin([str(product) for product in products]))
+    if start is not None:
+        add(ds.field("month") >= pd.Timestamp(start).strftime('%Y-%m'))
+        add(ds.field("date") >= pa.scalar(pd.Timestamp(start).to_datetime64()))
+    if end is not None:
+        add(ds.field("month") <= pd.Timestamp(end).strftime('%Y-%m'))
+        add(ds.field("date") <= pa.scalar(pd.Timestamp(end).to_datetime64()))
+
+    table = dataset.to_table(filter=condition)
+    if table.num_rows == 0:
+        return None
+
+    df = table.to_pandas().drop(columns=['month'])
+    for col in KEY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(str)
+    compact_keys(df)
+
+    # Restore the (date, product) ordering preprocessing produces
+    columns = ['date', 'product'] + [col for col in df.columns if col not in ('date', 'product')]
+    return df[columns].sort_values(['date', 'product'], kind='stable').reset_index(drop=True)
@@ -0,0 +1,47 @@
+"""
+Alert cursors resume only on the feed that issued them; any other gets a full snapshot
+Run from the backend directory: python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alerts import AlertFeed
+
+def alert(alert_id: str, severity: str = "high") -> dict:
+    return {'id': alert_id, 'product': alert_id.split(":")[-1], 'severity': severity}
+
+def test_cursor_resumes_with_the_changes_after_it():
+    feed = AlertFeed("run-a")
+    feed.update([alert("gap:risk:Onions")], 1)
+    cursor = feed.since(None)['cursor']
+    feed.update([alert("gap:risk:Onions", "low"), alert("price:falling:Rice")], 2)
+    page = feed.since(cursor)
+    assert page['reset'] is False
+    assert [(event['type'], event['alert']['id']) for event in page['events']] == [
+        ("changed", "gap:risk:Onions"), ("new", "price:falling:Rice")]
+    assert page['cursor'] == page['events'][-1]['cursor'] == "run-a:3"
+    assert feed.since(page['cursor'])['events'] == []
+
+def test_cursor_from_another_run_gets_the_full_list():
+    before = AlertFeed("run-a")
+    before.update([alert("gap:risk:Onions")], 1)
+    cursor = before.since(None)['cursor']
+
+    # A restarted server, or another worker, numbers its events from 0 again
+    after = AlertFeed("run-b")
+    after.update([alert("gap:risk:Onions"), alert("price:falling:Rice")], 1)
+    after.update([alert("price:falling:Rice")], 2)
+    assert after.seq > before.seq
+    page = after.since(cursor)
+    assert page['reset'] is True
+    assert [item['id'] for item in page['alerts']] == ["price:falling:Rice"]
+    assert page['cursor'] == "run-b:3"
+
+def test_malformed_and_unknown_cursors_get_the_full_list():
+    feed = AlertFeed("run-a")
+    feed.update([alert("gap:risk:Onions")], 1)
+    for cursor in ("1", "run-a:x", "run-a:9", ""):
+        page = feed.since(cursor)
+        assert page['reset'] is True and len(page['alerts']) == 1, cursor
@@ -0,0 +1,137 @@
+"""
+Requests read one dataset version while uploads apply, and background jobs do not take
+request threads
+Run from the backend directory: python -m pytest -q tests
+"""
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep test datasets out of the real on-disk store
+os.environ["AGRIS_STORE_DIR"] = ""
+
+from concurrency import PoolSaturated, ReadWriteLock
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data")
+
+def start(fn) -> threading.Thread:
+    thread = threading.Thread(target=fn, daemon=True)
+    thread.start()
+    return thread
+
+def test_readers_share_and_writers_wait_for_them():
+    lock = ReadWriteLock()
+    written = threading.Event()
+
+    def write():
+        with lock:
+            written.set()
+
+    with lock.shared():
+        with lock.shared():
+            assert not lock.acquire(blocking=False)
+        writer = start(write)
+        assert not written.wait(0.2)
+    writer.join(5)
+    assert written.is_set()
+    assert lock.acquire(blocking=False)
+    lock.release()
+
+def test_waiting_writer_goes_before_new_readers():
+    lock = ReadWriteLock()
+    order = []
+
+    def write():
+        with lock:
+            order.append("write")
+
+    def read():
+        with lock.shared():
+            order.append("read")
+
+    with lock.shared():
+        writer = start(write)
+        # Until the writer is queued, a new reader would still get in ahead of it
+        while not lock._writers_waiting:
+            threading.Event().wait(0.01)
+        reader = start(read)
+        assert not writer.join(0.2) and order == []
+    writer.join(5)
+    reader.join(5)
+    assert order == ["write", "read"]
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        for kind, name in (("retail", "retail_sales"), ("mandi", "mandi_prices")):
+            with open(os.path.join(DATA_DIR, f"{name}.csv"), "rb") as f:
+                client.post(f"/upload/{kind}", files={"file": (f"{name}.csv", f, "text/csv")}).raise_for_status()
+        yield client
+
+def test_upload_waits_for_a_request_reading_the_data(client):
+    import main
+
+    dataset = main.get_datasets().get(main.DEFAULT_DATASET)
+    version = dataset.version
+    uploaded = threading.Event()
+
+    def upload():
+        with open(os.path.join(DATA_DIR, "mandi_prices.csv"), "rb") as f:
+            client.post("/upload/mandi", files={"file": ("mandi_prices.csv", f, "text/csv")}).raise_for_status()
+        uploaded.set()
+
+    with dataset.update_lock.shared():
+        uploader = start(upload)
+        assert not uploaded.wait(0.5)
+        assert dataset.version == version
+    uploader.join(30)
+    assert uploaded.is_set() and dataset.version == version + 1
+
+def test_jobs_run_while_the_request_pool_is_full(client, monkeypatch):
+    import main
+
+    def saturated(*args):
+        raise PoolSaturated()
+
+    monkeypatch.setattr(main.work_pool, "submit", saturated)
+    assert client.get("/analysis/gap").status_code == 429
+    response = client.post("/jobs/analysis")
+    assert response.status_code == 202
+    job = main.jobs.get(response.json()["job_id"])
+    job.future.result(30)
+    assert client.get(f"/jobs/{job.id}").json()["status"] == "succeeded"
+
+def test_result_is_cached_under_the_version_it_was_computed_from(client):
+    import asyncio
+    from starlette.requests import Request
+    import main
+
+    dataset = main.get_datasets().get(main.DEFAULT_DATASET)
+    request = Request({"type": "http", "method": "GET", "path": "/analysis/gap", "query_string": b"", "headers": []})
+    versions = []
+
+    def compute():
+        versions.append(dataset.version)
+        return dataset.compute_gap_analysis()
+
+    async def request_during_upload():
+        # The request makes its key, then an upload applies before the computation starts
+        dataset.update_lock.acquire()
+        stale_key = dataset.cache_key("gap_during_upload")
+        response = asyncio.ensure_future(main.cached_response(request, dataset, "gap_during_upload", compute))
+        await asyncio.sleep(0.2)
+        dataset.bump_version()
+        dataset.update_lock.release()
+        return stale_key, await response
+
+    stale_key, response = asyncio.run(request_during_upload())
+    assert versions == [dataset.version]
+    assert dataset.cache.get(stale_key) is None
+    assert response.headers["etag"] == dataset.cache.get(dataset.cache_key("gap_during_upload"))[1]
@@ -0,0 +1,28 @@
+"""
+Streamed NDJSON rows carry the same values as the records of the matching JSON page
+Run from the backend directory: python -m pytest -q tests
+"""
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pagination
+
+def test_ndjson_lines_match_json_page_records():
+    df = pd.DataFrame({
+        'date': pd.to_datetime(["2024-01-01", "2024-01-02", "2024-01-03"]),
+        'product': ["Onions", "Rice", "Wheat"],
+        'price': [25.2, np.nan, 1 / 3],
+        'location': ["Delhi", "Pune", None]
+    })
+    positions = np.array([2, 0, 1])
+    records = pagination.page_payload(df, positions, 0, len(positions), "records", 1)["data"]
+    body = b"".join(pagination.stream_ndjson(df, positions)).decode("utf-8")
+    lines = [json.loads(line) for line in body.splitlines()]
+    assert lines == records
+    assert lines[0]['date'] == "2024-01-03"
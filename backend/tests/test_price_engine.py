@@ -0,0 +1,190 @@
+"""
+Parity of the grouped least-squares calculate_price_trends with the per-product
+LinearRegression loop it replaced
+Run from the backend directory: python -m pytest -q tests
+"""
+import math
+import os
+import sys
+from datetime import timedelta
+from fractions import Fraction
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_engine import (calculate_price_trends, combine_mandi_data, merge_mandi_data, merge_price_stats,
+                          preprocess_mandi_data, price_regression_stats)
+
+LinearRegression = pytest.importorskip("sklearn.linear_model").LinearRegression
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data")
+
+def reference_price_trends(df: pd.DataFrame, forecast_days: int = 7) -> dict:
+    # The implementation before the rewrite, one sklearn model per product
+    if df.empty:
+        return {}
+
+    df = df.sort_values('date', ascending=True)
+    products = df['product'].unique()
+    results = {}
+
+    for product in products:
+        product_data = df[df['product'] == product].copy()
+        product_data = product_data.sort_values('date')
+
+        if len(product_data) < 3:
+            continue
+
+        product_data['date_numeric'] = (product_data['date'] - product_data['date'].min()).dt.days
+        X = product_data['date_numeric'].values.reshape(-1, 1)
+        y = product_data['price'].values
+
+        model = LinearRegression()
+        model.fit(X, y)
+        slope = model.coef_[0]
+        r_squared = model.score(X, y)
+
+        last_date = product_data['date'].max()
+        future_dates = []
+        future_prices = []
+        for i in range(1, forecast_days + 1):
+            future_dates.append(last_date + timedelta(days=i))
+            future_X = np.array([[product_data['date_numeric'].max() + i]])
+            future_prices.append(max(0, model.predict(future_X)[0]))
+
+        if slope > 0.1:
+            trend_label, direction = "Price likely to increase", "up"
+        elif slope < -0.1:
+            trend_label, direction = "Price likely to fall", "down"
+        else:
+            trend_label, direction = "Price stable", "stable"
+
+        volatility = np.std(y)
+        avg_price = np.mean(y)
+        volatility_pct = (volatility / avg_price * 100) if avg_price > 0 else 0
+        if volatility_pct > 15:
+            volatility_label = "High volatility zone"
+        elif volatility_pct > 8:
+            volatility_label = "Medium volatility"
+        else:
+            volatility_label = "Low volatility"
+
+        results[product] = {
+            'trend_direction': direction,
+            'trend_label': trend_label,
+            'slope': slope,
+            'r_squared': r_squared,
+            'volatility': volatility,
+            'volatility_percentage': round(volatility_pct, 2),
+            'volatility_label': volatility_label,
+            'forecast_dates': [date.strftime('%Y-%m-%d') for date in future_dates],
+            'forecast_prices': [round(price, 2) for price in future_prices],
+            'current_price': round(y[-1], 2),
+            'avg_price': round(avg_price, 2)
+        }
+
+    return results
+
+def assert_same_value(actual, expected, path):
+    if isinstance(expected, (list, tuple)):
+        assert len(actual) == len(expected), path
+        for i, (a, e) in enumerate(zip(actual, expected)):
+            assert_same_value(a, e, f"{path}[{i}]")
+    elif isinstance(expected, (float, np.floating)) and not isinstance(expected, bool):
+        # Unrounded statistics agree to float precision; rounded ones exactly
+        assert actual == pytest.approx(float(expected), rel=1e-9, abs=1e-9), path
+    else:
+        assert actual == expected, path
+
+def at_rounding_tie(df: pd.DataFrame, product: str, actual: float, expected: float) -> bool:
+    # The grouped sums and np.mean add the prices in different orders, so a mean that is exactly
+    # half a cent may round either way; only then may avg_price differ, by one cent
+    prices = df.loc[df['product'] == product, 'price'].to_numpy()
+    exact = sum(Fraction(float(price)) for price in prices) / len(prices)
+    return (abs(abs(actual - expected) - 0.01) < 1e-9
+            and abs(float(exact) - (actual + expected) / 2) < 1e-9)
+
+def assert_same_trends(actual: dict, expected: dict, df: pd.DataFrame, skip=()):
+    assert list(actual) == list(expected)
+    for product, fields in expected.items():
+        assert list(actual[product]) == list(fields), product
+        for field, value in fields.items():
+            if field in skip:
+                continue
+            if field == 'avg_price' and at_rounding_tie(df, product, actual[product][field], value):
+                continue
+            assert_same_value(actual[product][field], value, f"{product}.{field}")
+
+def random_mandi(seed: int, products: int = 60, days: int = 90) -> pd.DataFrame:
+    """
+    Seeded noisy linear price series with random missing days, a few products with too
+    few quotes for a trend and several quotes per day at different mandis
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for p in range(products):
+        start = pd.Timestamp("2024-01-01") + pd.Timedelta(days=int(rng.integers(0, 20)))
+        base, slope = rng.uniform(10, 200), rng.normal(0, 0.5)
+        length = 2 if p % 17 == 0 else days
+        for day in range(length):
+            if rng.random() < 0.3:
+                continue
+            for mandi in range(int(rng.integers(1, 3))):
+                price = base + slope * day + rng.normal(0, base * 0.05)
+                rows.append((start + pd.Timedelta(days=day), f"Product {p:03d}", round(price, 2), f"Mandi {mandi}"))
+    return pd.DataFrame(rows, columns=["date", "product", "price", "location"])
+
+def test_sample_data_matches_reference():
+    df = preprocess_mandi_data(pd.read_csv(os.path.join(DATA_DIR, "mandi_prices.csv")))
+    assert_same_trends(calculate_price_trends(df), reference_price_trends(df), df)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_series_with_missing_days_match_reference(seed):
+    df = preprocess_mandi_data(random_mandi(seed))
+    expected = reference_price_trends(df)
+    assert len(expected) > 0
+    assert_same_trends(calculate_price_trends(df), expected, df)
+
+@pytest.mark.parametrize("forecast_days", [1, 14])
+def test_forecast_horizon_matches_reference(forecast_days):
+    df = preprocess_mandi_data(random_mandi(7, products=10))
+    assert_same_trends(calculate_price_trends(df, forecast_days), reference_price_trends(df, forecast_days), df)
+
+def test_constant_series_has_r_squared_one():
+    # sklearn reports 1.0 or 0.0 for a flat series depending on float noise; the rewrite always reports 1.0
+    dates = pd.date_range("2024-01-01", periods=10)
+    df = preprocess_mandi_data(pd.DataFrame({
+        "date": list(dates) * 2,
+        "product": ["Flat"] * 10 + ["Flat again"] * 10,
+        "price": [25.3] * 10 + [0.1] * 10,
+        "location": "Delhi"
+    }))
+    trends = calculate_price_trends(df)
+    assert [trends[product]['r_squared'] for product in trends] == [1.0, 1.0]
+    assert_same_trends(trends, reference_price_trends(df), df, skip=('r_squared',))
+    for data in trends.values():
+        assert data['trend_direction'] == 'stable'
+        assert data['slope'] == pytest.approx(0.0, abs=1e-9)
+        assert math.isclose(data['volatility'], 0.0, abs_tol=1e-9)
+
+@pytest.mark.parametrize("keys", [['product'], ['product', 'location']])
+def test_merged_stats_order_series_like_a_rebuild(keys):
+    # Appended rows, out of date order, start series on a date existing ones already started on
+    # and move the first date of an existing one back
+    base = pd.DataFrame({"date": pd.to_datetime(["2024-01-02", "2024-01-03", "2024-01-04"] * 2),
+                         "product": ["B"] * 3 + ["C"] * 3, "price": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+                         "location": "Delhi"})
+    new = pd.DataFrame({"date": pd.to_datetime(["2024-01-05", "2024-01-02", "2024-01-01", "2024-01-02"]),
+                        "product": ["B", "A", "C", "Ab"], "price": [4.0, 5.0, 6.0, 7.0],
+                        "location": ["Pune", "Delhi", "Delhi", "Delhi"]})
+    by_location = len(keys) > 1
+    processed = combine_mandi_data([preprocess_mandi_data(base, by_location=True)], by_location=by_location)
+    merged, removed, added = merge_mandi_data(
+        processed, combine_mandi_data([preprocess_mandi_data(new, by_location=True)], by_location=by_location))
+    incremental = merge_price_stats(price_regression_stats(processed, keys), removed, added, keys)
+    rebuilt = price_regression_stats(merged, keys)
+    assert incremental.index.tolist() == rebuilt.index.tolist()
+    pd.testing.assert_frame_equal(incremental, rebuilt, check_dtype=False, check_index_type=False)
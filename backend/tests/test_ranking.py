@@ -0,0 +1,110 @@
+"""
+Rankings updated on a data change give the same orders as an index built from scratch
+Run from the backend directory: python -m pytest -q tests
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+# Keep test datasets out of the real on-disk store
+os.environ["AGRIS_STORE_DIR"] = ""
+
+from ranking import SCORES, RankingIndex
+
+def signals(products, rng):
+    """
+    Gap items, demand signals and price trends with ties, missing scores and infinite changes
+    """
+    gap, demand, trends = [], [], {}
+    for product in products:
+        gap.append({'product': product, 'signal_level': rng.choice(['opportunity', 'watch', 'risk']),
+                    'recommendation': 'MONITOR'})
+        roll = rng.random()
+        if roll < 0.8:
+            change = np.inf if roll < 0.05 else float(rng.choice([0.0, 5.0, -5.0, round(rng.normal(0, 20), 2)]))
+            demand.append({'product': product, 'change_percentage': change})
+        if rng.random() < 0.7:
+            trends[product] = {'slope': float(rng.choice([0.0, 0.5, round(rng.normal(0, 1), 4)])),
+                               'volatility_percentage': float(rng.choice([3.0, round(rng.uniform(0, 30), 2)]))}
+    return gap, demand, trends
+
+def changed(gap, demand, trends, products, rng):
+    # Next version: new scores for the given products, as an append touching only them
+    demand = [dict(signal) for signal in demand]
+    trends = {product: dict(trend) for product, trend in trends.items()}
+    for signal in demand:
+        if signal['product'] in products:
+            signal['change_percentage'] = float(rng.choice([0.0, 5.0, round(rng.normal(0, 20), 2)]))
+    for product in products:
+        trends[product] = {'slope': float(rng.choice([0.5, round(rng.normal(0, 1), 4)])),
+                           'volatility_percentage': float(rng.choice([3.0, np.nan, round(rng.uniform(0, 30), 2)]))}
+    return gap, demand, trends
+
+def assert_same_index(updated: RankingIndex, built: RankingIndex):
+    assert updated.products.tolist() == built.products.tolist()
+    for name in SCORES:
+        np.testing.assert_array_equal(updated.order[name], built.order[name], err_msg=name)
+        np.testing.assert_array_equal(updated.scores[name], built.scores[name], err_msg=name)
+    np.testing.assert_array_equal(updated.by_name, built.by_name)
+    np.testing.assert_array_equal(updated.sorted_names, built.sorted_names)
+    for by in SCORES:
+        for level in (None, 'risk'):
+            np.testing.assert_array_equal(updated.top(20, by, level, "P0"), built.top(20, by, level, "P0"))
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("touched", [3, 400])
+def test_updated_scores_match_full_build(seed, touched):
+    # A few changed products are merged in; many re-sort the score
+    rng = np.random.default_rng(seed)
+    products = [f"P{i:04d}" for i in range(1000)]
+    index = RankingIndex(*signals(products, rng))
+    gap, demand, trends = changed(*signals(products, np.random.default_rng(seed)),
+                                  set(rng.choice(products, touched, replace=False).tolist()), rng)
+    assert_same_index(index.updated(gap, demand, trends), RankingIndex(gap, demand, trends))
+
+@pytest.mark.parametrize("seed", range(3))
+def test_added_and_removed_products_match_full_build(seed):
+    rng = np.random.default_rng(seed)
+    products = [f"P{i:04d}" for i in range(0, 2000, 2)]
+    index = RankingIndex(*signals(products, rng))
+    # New names fall between the existing ones; some products are dropped
+    later = sorted(set(products[5:]) | {f"P{i:04d}" for i in (1, 7, 501, 1999)})
+    gap, demand, trends = signals(later, rng)
+    updated = index.updated(gap, demand, trends)
+    assert_same_index(updated, RankingIndex(gap, demand, trends))
+    # And again from the updated index, as successive appends chain
+    gap, demand, trends = changed(gap, demand, trends, {"P0001", "P0010"}, rng)
+    assert_same_index(updated.updated(gap, demand, trends), RankingIndex(gap, demand, trends))
+
+def test_append_keeps_rankings_equal_to_a_rebuild():
+    from synthetic import generate_retail, generate_mandi
+    from datasets import Dataset
+    from demand_engine import preprocess_retail_data
+    from price_engine import preprocess_mandi_data
+
+    retail = generate_retail(products=300, days=60, seed=1)
+    mandi = generate_mandi(products=300, mandis=2, days=60, seed=1)
+    dataset = Dataset("ranking-test")
+    dataset.apply_retail(retail, preprocess_retail_data(retail), "replace")
+    dataset.apply_mandi(mandi, preprocess_mandi_data(mandi, by_location=True), "replace")
+
+    # The next day's sales and prices of a few products, one of them new
+    day = pd.Timestamp(retail['date'].max()) + pd.Timedelta(days=1)
+    names = sorted(retail['product'].unique())[:5] + ["Zz new product"]
+    retail_rows = pd.DataFrame({'date': day, 'product': names, 'sales_quantity': 500, 'sales_value': 5000.0})
+    mandi_rows = pd.DataFrame({'date': day, 'product': names, 'price': 99.0, 'location': 'Mandi 0'})
+    for _ in range(2):
+        dataset.apply_retail(retail_rows, preprocess_retail_data(retail_rows), "append")
+        dataset.apply_mandi(mandi_rows, preprocess_mandi_data(mandi_rows, by_location=True), "append")
+        built = RankingIndex(dataset.current_gap_analysis(), dataset.current_demand_signals(),
+                             dataset.current_price_trends())
+        assert_same_index(dataset.rankings, built)
+        day += pd.Timedelta(days=1)
+        retail_rows = retail_rows.assign(date=day)
+        mandi_rows = mandi_rows.assign(date=day, price=101.0)
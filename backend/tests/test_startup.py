@@ -0,0 +1,87 @@
+"""
+Startup cost of the API process: importing main stays within its budget and neither the
+import nor GET / loads pandas, numpy or pyarrow
+Run from the backend directory: python -m pytest -q tests
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Largest accepted median import time of main in milliseconds, not counting the framework
+IMPORT_BUDGET_MS = float(os.environ.get("AGRIS_IMPORT_BUDGET_MS", "150"))
+
+# Fresh interpreters the median import time is taken over
+RUNS = 5
+
+# Imported by the server whatever the app does, so not counted against the budget
+FRAMEWORK = ("fastapi", "starlette", "pydantic", "pydantic_core", "anyio")
+
+# Must not be imported until an endpoint needs them
+HEAVY = ("pandas", "numpy", "pyarrow")
+
+HEALTH_CHECK = """
+import json, sys
+from fastapi.testclient import TestClient
+import main
+imported = [name for name in {heavy!r} if name in sys.modules]
+with TestClient(main.app) as client:
+    status = client.get("/").status_code
+served = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"status": status, "on_import": imported, "on_health_check": served}}))
+"""
+
+def run_python(args: list, env: dict) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable] + args, cwd=BACKEND_DIR, capture_output=True, text=True,
+                          env=env, check=True)
+
+def import_times() -> dict:
+    """
+    Microseconds spent importing main, in total and per top-level package it pulls in
+    """
+    env = dict(os.environ, AGRIS_STORE_DIR="")
+    lines = run_python(["-X", "importtime", "-c", "import main"], env).stderr.splitlines()
+    packages = {}
+    children = {}
+    total = 0
+    for line in lines:
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            cumulative = int(cumulative)
+        except ValueError:  # Header line
+            continue
+        module = name.strip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            # A module is reported after everything it imported
+            if module == "main":
+                total = cumulative
+                packages = children
+            children = {}
+        elif depth == 1:
+            # Direct imports carry the cost of everything below them
+            package = module.split(".")[0]
+            children[package] = children.get(package, 0) + cumulative
+    framework = sum(us for package, us in packages.items() if package in FRAMEWORK)
+    return {"total_us": total, "own_us": total - framework, "packages": packages}
+
+def test_import_time_within_budget():
+    runs = [import_times() for _ in range(RUNS)]
+    assert all(run["total_us"] > 0 for run in runs), "main missing from the -X importtime report"
+    own_ms = statistics.median(run["own_us"] for run in runs) / 1000
+    slowest = sorted(runs[-1]["packages"].items(), key=lambda item: -item[1])[:5]
+    assert own_ms <= IMPORT_BUDGET_MS, (
+        f"importing main took {own_ms:.1f} ms without the framework, over the budget of {IMPORT_BUDGET_MS} ms; "
+        f"slowest imports (us): {slowest}")
+
+def test_startup_and_health_check_leave_heavy_modules_unloaded():
+    env = dict(os.environ, AGRIS_STORE_DIR="", AGRIS_PRELOAD="0")
+    health = json.loads(run_python(["-c", HEALTH_CHECK.format(heavy=HEAVY)], env).stdout.strip().splitlines()[-1])
+    assert health["status"] == 200
+    assert health["on_import"] == []
+    assert health["on_health_check"] == []
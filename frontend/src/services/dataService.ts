@@ -58,6 +58,161 @@ export interface Recommendation {
   confidence: number;
 }
 
+// Version of the analysis response layout this client reads; the API sends its own in X-Schema-Version
+export const SCHEMA_VERSION = 1;
+
+// How analysis responses are requested: plain JSON, compact JSON (record lists as columns, repeated
+// strings as codes into lookup tables) or compact MessagePack. The browser negotiates gzip/brotli itself
+export type ResponseFormat = 'json' | 'compact' | 'msgpack';
+
+interface CompactPayload {
+  schema_version: number;
+  enums: Record<string, string[]>;
+  data: unknown;
+}
+
+interface CompactTable {
+  $columns: Record<string, unknown[]>;
+  $coded: string[];
+}
+
+const isCompactTable = (value: unknown): value is CompactTable =>
+  typeof value === 'object' && value !== null && '$columns' in value && '$coded' in value;
+
+// Expand a compact payload back into the plain JSON layout
+export const decodeCompact = <T>(payload: CompactPayload): T => {
+  const { enums } = payload;
+  const walk = (value: unknown): unknown => {
+    if (Array.isArray(value)) {
+      return value.map(walk);
+    }
+    if (isCompactTable(value)) {
+      const coded = new Set(value.$coded);
+      const fields = Object.keys(value.$columns);
+      const columns = fields.map((field) => {
+        const column = value.$columns[field];
+        return coded.has(field) ? column.map((code) => enums[field][code as number]) : column.map(walk);
+      });
+      const count = columns.length > 0 ? columns[0].length : 0;
+      const records: Record<string, unknown>[] = [];
+      for (let i = 0; i < count; i++) {
+        const record: Record<string, unknown> = {};
+        fields.forEach((field, j) => {
+          record[field] = columns[j][i];
+        });
+        records.push(record);
+      }
+      return records;
+    }
+    if (typeof value === 'object' && value !== null) {
+      const result: Record<string, unknown> = {};
+      for (const [key, item] of Object.entries(value)) {
+        result[key] = walk(item);
+      }
+      return result;
+    }
+    return value;
+  };
+  return walk(payload.data) as T;
+};
+
+// Decode a MessagePack body (nil, booleans, numbers, strings, binary, arrays and maps)
+export const decodeMessagePack = (buffer: ArrayBuffer): unknown => {
+  const view = new DataView(buffer);
+  const bytes = new Uint8Array(buffer);
+  const text = new TextDecoder();
+  let offset = 0;
+
+  const take = (length: number): Uint8Array => {
+    const slice = bytes.subarray(offset, offset + length);
+    offset += length;
+    return slice;
+  };
+  const uint = (size: number): number => {
+    let value: number;
+    if (size === 1) value = view.getUint8(offset);
+    else if (size === 2) value = view.getUint16(offset);
+    else if (size === 4) value = view.getUint32(offset);
+    else value = Number(view.getBigUint64(offset));
+    offset += size;
+    return value;
+  };
+  const int = (size: number): number => {
+    let value: number;
+    if (size === 1) value = view.getInt8(offset);
+    else if (size === 2) value = view.getInt16(offset);
+    else if (size === 4) value = view.getInt32(offset);
+    else value = Number(view.getBigInt64(offset));
+    offset += size;
+    return value;
+  };
+  const array = (length: number): unknown[] => {
+    const items: unknown[] = [];
+    for (let i = 0; i < length; i++) items.push(read());
+    return items;
+  };
+  const map = (length: number): Record<string, unknown> => {
+    const result: Record<string, unknown> = {};
+    for (let i = 0; i < length; i++) {
+      const key = String(read());
+      result[key] = read();
+    }
+    return result;
+  };
+
+  const read = (): unknown => {
+    const type = view.getUint8(offset++);
+    if (type <= 0x7f) return type;
+    if (type <= 0x8f) return map(type & 0x0f);
+    if (type <= 0x9f) return array(type & 0x0f);
+    if (type <= 0xbf) return text.decode(take(type & 0x1f));
+    if (type >= 0xe0) return type - 0x100;
+    switch (type) {
+      case 0xc0: return null;
+      case 0xc2: return false;
+      case 0xc3: return true;
+      case 0xc4: case 0xc5: case 0xc6: return take(uint(1 << (type - 0xc4))).slice();
+      case 0xca: { const value = view.getFloat32(offset); offset += 4; return value; }
+      case 0xcb: { const value = view.getFloat64(offset); offset += 8; return value; }
+      case 0xcc: case 0xcd: case 0xce: case 0xcf: return uint(1 << (type - 0xcc));
+      case 0xd0: case 0xd1: case 0xd2: case 0xd3: return int(1 << (type - 0xd0));
+      case 0xd9: case 0xda: case 0xdb: return text.decode(take(uint(1 << (type - 0xd9))));
+      case 0xdc: case 0xdd: return array(uint(type === 0xdc ? 2 : 4));
+      case 0xde: case 0xdf: return map(uint(type === 0xde ? 2 : 4));
+      default: throw new Error(`Unsupported MessagePack type 0x${type.toString(16)}`);
+    }
+  };
+  return read();
+};
+
+// Fetch an analysis endpoint in the given format and return it in the plain JSON layout
+export const fetchAnalysis = async <T>(path: string, format: ResponseFormat = 'compact'): Promise<T> => {
+  const params = new URLSearchParams();
+  if (format !== 'json') params.set('compact', 'true');
+  if (format === 'msgpack') params.set('format', 'msgpack');
+  const query = params.toString() ? `${path.includes('?') ? '&' : '?'}${params}` : '';
+
+  const response = await fetch(`${API_BASE_URL}${path}${query}`);
+
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+
+  const version = response.headers.get('X-Schema-Version');
+  if (version !== null && Number(version) !== SCHEMA_VERSION) {
+    throw new Error(`Unsupported response schema version ${version}`);
+  }
+  const type = response.headers.get('Content-Type') || '';
+  const payload = type.startsWith('application/msgpack')
+    ? decodeMessagePack(await response.arrayBuffer())
+    : await response.json();
+  // Endpoints answer errors such as missing uploads in plain JSON, whatever was asked for
+  if (typeof payload === 'object' && payload !== null && 'enums' in payload && 'data' in payload) {
+    return decodeCompact<T>(payload as CompactPayload);
+  }
+  return payload as T;
+};
+
 // Upload retail data
 export const uploadRetailData = async (file: File): Promise<any> => {
   const formData = new FormData();
@@ -94,35 +249,17 @@ export const uploadMandiData = async (file: File): Promise<any> => {
 
 // Get demand analysis
 export const getDemandAnalysis = async (): Promise<{ signals: DemandSignal[]; count: number }> => {
-  const response = await fetch(`${API_BASE_URL}/analysis/demand`);
-  
-  if (!response.ok) {
-    throw new Error(`HTTP error! status: ${response.status}`);
-  }
-  
-  return response.json();
+  return fetchAnalysis(`/analysis/demand`);
 };
 
 // Get price analysis
 export const getPriceAnalysis = async (): Promise<{ signals: PriceSignal[]; count: number }> => {
-  const response = await fetch(`${API_BASE_URL}/analysis/price`);
-  
-  if (!response.ok) {
-    throw new Error(`HTTP error! status: ${response.status}`);
-  }
-  
-  return response.json();
+  return fetchAnalysis(`/analysis/price`);
 };
 
 // Get gap analysis
 export const getGapAnalysis = async (): Promise<{ gap_analysis: GapAnalysis[]; summary: any; count: number }> => {
-  const response = await fetch(`${API_BASE_URL}/analysis/gap`);
-  
-  if (!response.ok) {
-    throw new Error(`HTTP error! status: ${response.status}`);
-  }
-  
-  return response.json();
+  return fetchAnalysis(`/analysis/gap`);
 };
 
 // Get recommendations
@@ -132,11 +269,5 @@ export const getRecommendations = async (): Promise<{
   summary: any;
   actionable_insights: any;
 }> => {
-  const response = await fetch(`${API_BASE_URL}/analysis/recommendations`);
-  
-  if (!response.ok) {
-    throw new Error(`HTTP error! status: ${response.status}`);
-  }
-  
-  return response.json();
+  return fetchAnalysis(`/analysis/recommendations`);
 };